@@ -1,5 +1,4 @@
 #!/usr/bin/env bash
 set -euo pipefail
-python -m src.models.nmf_runner || echo "[WARN] NMF failed."
-python -m src.models.corex_runner || echo "[INFO] CorEx skipped or failed."
-python -m src.models.bertopic_runner || echo "[INFO] BERTopic skipped (deps missing)."
+# incremental: skips the stage when its inputs, config and code are unchanged (see src/pipeline/runner.py)
+python -m src run nmf corex bertopic "$@"
@@ -1,5 +1,4 @@
 #!/usr/bin/env bash
 set -euo pipefail
-python -m src.eval.extrinsic || true
-python -m src.eval.coherence || true
-python -m src.eval.compare || true
+# incremental: skips the stage when its inputs, config and code are unchanged (see src/pipeline/runner.py)
+python -m src run evaluate "$@"
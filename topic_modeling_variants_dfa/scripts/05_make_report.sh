@@ -1,3 +1,4 @@
 #!/usr/bin/env bash
 set -euo pipefail
-python -m src.labeling.topic_cards || true
+# incremental: skips the stage when its inputs, config and code are unchanged (see src/pipeline/runner.py)
+python -m src run report "$@"
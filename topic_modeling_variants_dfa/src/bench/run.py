@@ -0,0 +1,202 @@
+import os, sys, json, argparse, platform, subprocess
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+# Offline benchmark of the pipeline hot paths on synthetic corpora (src/bench/corpus.py):
+#   python -m src.bench.run [--sizes 1000 10000] [--name NAME]     -> evaluation/bench/<name>.json
+#   python -m src.bench.run compare OLD.json NEW.json [--threshold 0.1]
+# Each size runs in a fresh worker process so process_peak_rss_mb is per size; within a size,
+# rss_growth_mb is how much a stage raised the process high-water mark. Stages are chained
+# (chunk -> preprocess -> tfidf -> nmf -> coherence); end_to_end times the whole chain as one run,
+# glue included. Stage rows are inclusive (the instrumented stages the code under test opens itself count towards them).
+# Documents are generated lazily while chunking, in a stage of their own that chunk and end_to_end
+# exclude.
+
+def _versions():
+    import numpy, scipy, sklearn
+    out = {"python": platform.python_version(), "numpy": numpy.__version__, "scipy": scipy.__version__,
+           "sklearn": sklearn.__version__, "platform": platform.platform(), "cpu_count": os.cpu_count()}
+    try:
+        out["git"] = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                    text=True, check=True).stdout.strip()
+    except Exception:
+        pass
+    return out
+
+def _row(size, st, exclude=None):
+    # inclusive time: exclusive wall_s would leave out the stages nested inside (preprocess.clean,
+    # tfidf.build, coherence.*), i.e. the work being benchmarked. exclude: a stage record to take
+    # out of it (document generation, nested in chunk and end_to_end)
+    rec = st.finish()
+    items = rec["counts"].get(st.unit, 0)
+    wall = round(rec["total_wall_s"] - (exclude["total_wall_s"] if exclude else 0.0), 6)
+    cpu = round(rec["total_cpu_s"] - (exclude["total_cpu_s"] if exclude else 0.0), 6)
+    return {"size": size, "stage": st.name.split(".", 1)[1], "wall_s": wall, "cpu_s": cpu,
+            "unit": st.unit, "items": items, "items_per_s": round(items / wall, 3) if wall > 0 else 0.0,
+            "counts": rec["counts"], "process_peak_rss_mb": rec["process_peak_rss_mb"],
+            "rss_growth_mb": rec["peak_rss_growth_mb"]}
+
+def bench_size(size, cfg, base):
+    os.environ["TM_PERF"] = "0"  # rows go to the baseline file, not evaluation/perf.jsonl
+    from ..utils import perf
+    from .corpus import SyntheticCorpus
+    from ..ingest.filters import keep_chunk
+    from ..ingest.chunker import chunk_pages
+
+    stages = cfg.get("stages", ["chunk", "preprocess", "tfidf", "nmf", "coherence"])
+    c = cfg.get("corpus", {}) or {}
+    chunking = base["chunking"]
+    corpus = SyntheticCorpus(c.get("seeds_file", "configs/seeds.yaml"), vocab_size=int(c.get("vocab_size", 20000)),
+                             zipf_a=float(c.get("zipf_a", 1.07)), topic_mix=float(c.get("topic_mix", 0.25)),
+                             seed=int(cfg.get("seed", 42)))
+    rows = []
+
+    def begin(name, unit):
+        return perf.Stage(f"bench.{name}", unit).start()
+
+    def generated(st, docs):
+        # the generator's own time goes to st, so the enclosing stages exclude it
+        while True:
+            st.start()
+            try:
+                d = next(docs, None)
+            finally:
+                st.pause()
+            if d is None:
+                return
+            st.add()
+            yield d
+
+    total = begin("end_to_end", "chunks")
+    gen = perf.Stage("bench.generate", "docs")
+    st = begin("chunk", "chunks")
+    records = []
+    for d in generated(gen, corpus.documents(page_tokens=int(c.get("page_tokens", 450)))):
+        for ch in chunk_pages(d, target_tokens=chunking["target_tokens"], overlap_tokens=chunking["overlap_tokens"]):
+            if keep_chunk(ch["text"]):
+                records.append({"pdf_id": d["pdf_id"], "title": d["title"], "start_page": ch["start_page"],
+                                "end_page": ch["end_page"], "text": ch["text"]})
+                if len(records) >= size:
+                    break
+        if len(records) >= size:
+            break
+    st.pause(); st.add(len(records))
+    generation = gen.finish()
+    rows.append(_row(size, st, exclude=generation))
+
+    if "preprocess" in stages:
+        from ..preprocess.clean import process_records
+        extra = base["language"].get("extra_stopwords", [])
+        st = begin("preprocess", "records")
+        try:
+            records = list(process_records(records, extra_stop=extra, workers=cfg.get("preprocess_workers", 1)))
+            st.pause(); st.add(len(records), tokens=sum(len(r["tokens"]) for r in records))
+            rows.append(_row(size, st))
+        except LookupError:
+            st.pause(); st.finish()
+            print("[WARN] NLTK stopwords/wordnet not installed — preprocess skipped; later stages use raw lowercase words.")
+    if not all("tokens" in r for r in records):
+        for r in records:
+            r["tokens"] = [w for w in r["text"].lower().split() if w.isalpha() and len(w) > 2]
+
+    X = vocab = top = None
+    if "tfidf" in stages or "nmf" in stages:
+        from ..features.tfidf import build_tfidf_strs
+        from ..features.store import _tfidf_kwargs
+        st = begin("tfidf", "docs")
+        X, vocab, _ = build_tfidf_strs(records, **_tfidf_kwargs({**base["tfidf"], **(cfg.get("tfidf") or {})}))
+        st.pause(); st.add(X.shape[0], nnz=int(X.nnz)); rows.append(_row(size, st))
+    if "nmf" in stages:
+        from ..models.nmf_runner import grid_search, top_terms
+        st = begin("nmf", "fits")
+        fits = grid_search(X, cfg.get("nmf", {}), seed=int(cfg.get("seed", 42)))
+        st.pause(); st.add(len(fits), topics=sum(f["k"] for f in fits)); rows.append(_row(size, st))
+        top = next(f["top"] for f in fits if "model" in f)  # grid_search keeps only the best model
+    if "coherence" in stages:
+        from ..eval.coherence import score_topics
+        texts = [r["tokens"] for r in records]
+        if top is not None:
+            topics = top_terms(None, vocab, top=top[:, :10])
+            present = {w for doc in texts for w in doc}
+            topics = [[w for w in t if w in present] for t in topics]
+        else:
+            topics = [list(ws[:10]) for ws in corpus.cat_words]
+        topics = [t for t in topics if len(t) >= 2]
+        st = begin("coherence", "topics")
+        score_topics(topics, texts)
+        st.pause(); st.add(len(topics), tokens=sum(len(t) for t in texts)); rows.append(_row(size, st))
+
+    total.pause(); total.add(len(records))
+    rows.append(_row(size, total, exclude=generation))
+    # the stage rows should account for the whole run; the rest is glue (or a skipped stage)
+    staged = sum(r["wall_s"] for r in rows[:-1])
+    rows[-1]["stage_share"] = round(staged / rows[-1]["wall_s"], 4) if rows[-1]["wall_s"] > 0 else 0.0
+    if not 0.9 <= rows[-1]["stage_share"] <= 1.01:
+        print(f"[WARN] size={size}: stage rows sum to {staged:.3f}s of {rows[-1]['wall_s']:.3f}s end_to_end "
+              f"({rows[-1]['stage_share']:.0%})")
+    for r in rows:
+        print(f"[BENCH] size={size:>8} {r['stage']:<11} {r['wall_s']:>9.3f}s  {r['items_per_s']:>12.1f} {r['unit']}/s"
+              f"  rss +{r['rss_growth_mb']}MB (peak {r['process_peak_rss_mb']}MB)")
+    return rows
+
+def run(cfg_path="configs/bench.yaml", base_cfg="configs/base.yaml", sizes=None, name=None):
+    from ..utils.io import read_yaml
+    cfg, base = read_yaml(cfg_path), read_yaml(base_cfg)
+    sizes = [int(s) for s in (sizes or cfg.get("sizes", [1000]))]
+    rows = []
+    for size in sizes:
+        with ProcessPoolExecutor(max_workers=1) as ex:  # fresh process per size
+            rows.extend(ex.submit(bench_size, size, cfg, base).result())
+    out_dir = cfg.get("out_dir", "evaluation/bench")
+    os.makedirs(out_dir, exist_ok=True)
+    name = name or datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+    out = os.path.join(out_dir, f"{name}.json")
+    json.dump({"name": name, "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+               "env": _versions(), "config": cfg, "results": rows},
+              open(out, "w", encoding="utf-8"), indent=2)
+    print("Benchmark written to", out)
+    return out
+
+def compare(old_path, new_path, threshold=0.10, metric="wall_s"):
+    old = json.load(open(old_path, "r", encoding="utf-8"))
+    new = json.load(open(new_path, "r", encoding="utf-8"))
+    ref = {(r["size"], r["stage"]): r for r in old["results"]}
+    regressions = []
+    print(f"{'size':>8} {'stage':<11} {'old':>10} {'new':>10} {'change':>8}")
+    for r in new["results"]:
+        o = ref.get((r["size"], r["stage"]))
+        if o is None or not o.get(metric):
+            continue
+        change = r[metric] / o[metric] - 1.0
+        flag = change > threshold
+        if flag:
+            regressions.append({"size": r["size"], "stage": r["stage"], "old": o[metric], "new": r[metric], "change": change})
+        print(f"{r['size']:>8} {r['stage']:<11} {o[metric]:>10.3f} {r[metric]:>10.3f} {change:>+7.1%}" + ("  SLOWER" if flag else ""))
+    if regressions:
+        print(f"[WARN] {len(regressions)} stage(s) slower than {old_path} by more than {threshold:.0%} ({metric})")
+    else:
+        print(f"[INFO] No {metric} regressions beyond {threshold:.0%}")
+    return regressions
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["compare"]:
+        ap = argparse.ArgumentParser(prog="python -m src.bench.run compare")
+        ap.add_argument("old"); ap.add_argument("new")
+        ap.add_argument("--threshold", type=float)
+        ap.add_argument("--metric", default="wall_s", choices=["wall_s", "cpu_s"])
+        ap.add_argument("--config", default="configs/bench.yaml")
+        args = ap.parse_args(argv[1:])
+        from ..utils.io import read_yaml
+        threshold = args.threshold if args.threshold is not None else read_yaml(args.config).get("threshold", 0.10)
+        return 1 if compare(args.old, args.new, float(threshold), args.metric) else 0
+    ap = argparse.ArgumentParser(prog="python -m src.bench.run")
+    ap.add_argument("--sizes", type=int, nargs="+", help="chunks per synthetic corpus (default: bench.yaml sizes)")
+    ap.add_argument("--name", help="baseline name (default: UTC timestamp)")
+    ap.add_argument("--config", default="configs/bench.yaml")
+    args = ap.parse_args(argv)
+    run(args.config, sizes=args.sizes, name=args.name)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
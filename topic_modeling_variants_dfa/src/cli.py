@@ -0,0 +1,67 @@
+import sys, time, argparse
+from importlib import import_module
+
+# `python -m src <command>`: one entry point for the pipeline and the module tools, so a whole run
+# (`python -m src run`) happens in one interpreter. Nothing heavy is imported here: each command
+# imports its module only when it runs (gensim, pandas, torch, NLTK stay unloaded for --help and
+# `deps`), and optional dependencies are looked up with importlib.util.find_spec (src/utils/deps.py).
+
+# command -> (module with main(argv), help); these parse their own arguments, `<command> --help`
+TOOLS = {
+    "run": (".pipeline.runner", "run pipeline stages incrementally in this process (default: all)"),
+    "models": (".pipeline.models", "run nmf / corex / bertopic concurrently on one shared feature store"),
+    "online": (".models.online", "incremental NMF updates: update | status"),
+    "corex": (".models.corex_runner", "fit anchored CorEx, or --sweep the corex.yaml grid"),
+    "stability": (".models.stability", "bootstrap topic stability per k for NMF / CorEx (cached replicates)"),
+    "infer": (".models.inference", "tag new text with the fitted models: transform | serve"),
+    "tokens": (".preprocess.token_store", "convert between the token store and chunks_tokens.jsonl"),
+    "scan": (".preprocess.scan", "tokenizer golden check / MB/s benchmark"),
+    "bench": (".bench.run", "benchmark the pipeline on synthetic corpora"),
+}
+
+def evaluate(check_gensim=False, cards=False):
+    # the evaluate stage without fingerprints: rewrite evaluation/*.csv from the current model outputs
+    from .eval import engine
+    t0 = time.perf_counter()
+    engine.main(check_gensim=check_gensim, cards=cards)
+    print(f"[INFO] evaluate: {time.perf_counter() - t0:.2f}s")
+    return 0
+
+def report():
+    from .labeling import topic_cards
+    topic_cards.main()
+    return 0
+
+def deps():
+    from .utils.deps import OPTIONAL, missing
+    for what, names in OPTIONAL.items():
+        m = missing(*names)
+        print(f"{what:<26} {'ok' if not m else 'missing: ' + ', '.join(m)}")
+    return 0
+
+def _parser():
+    ap = argparse.ArgumentParser(prog="python -m src", description="Topic-modeling pipeline and tools.")
+    sub = ap.add_subparsers(dest="cmd", metavar="command")
+    for name, (_, help_) in TOOLS.items():
+        sub.add_parser(name, help=help_, add_help=False)
+    p = sub.add_parser("evaluate", help="rewrite evaluation/*.csv from the current models (no fingerprints)")
+    p.add_argument("--cards", action="store_true", help="also rewrite the topic cards")
+    p.add_argument("--check-gensim", action="store_true", help="compare coherence against gensim")
+    sub.add_parser("report", help="rewrite the topic cards under reports/")
+    sub.add_parser("deps", help="which optional dependencies are installed (without importing them)")
+    return ap
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if argv and argv[0] in TOOLS:
+        return import_module(TOOLS[argv[0]][0], __package__).main(argv[1:]) or 0
+    ap = _parser()
+    args = ap.parse_args(argv)
+    if args.cmd == "evaluate":
+        return evaluate(args.check_gensim, args.cards)
+    if args.cmd == "report":
+        return report()
+    if args.cmd == "deps":
+        return deps()
+    ap.print_help()
+    return 0
@@ -1,11 +1,21 @@
-import os, json, csv
-from ..utils.io import read_yaml
-try:
-    from gensim.corpora import Dictionary
-    from gensim.models.coherencemodel import CoherenceModel
-    GENSIM_OK = True
-except Exception:
-    GENSIM_OK = False
+import os, json, sys
+from itertools import chain, repeat
+import numpy as np
+from scipy.sparse import csr_matrix
+from ..utils.perf import stage
+from ..preprocess.token_store import TokenStore, to_gensim
+
+# Coherence from one pass over the corpus: positions of every term that appears in any topic
+# are indexed once and turned into per-term window presence runs; each topic's co-occurrence
+# block is a small weighted sparse product over those runs, and c_v / NPMI / UMass are then
+# vectorized per block.
+# Counting follows gensim's boolean sliding window exactly (including how its incremental
+# window drops a word when its earlier copy leaves the window), so c_v / c_npmi / u_mass
+# agree with gensim.models.CoherenceModel up to floating point.
+
+EPSILON = 1e-12
+C_V_WINDOW = 110
+NPMI_WINDOW = 10
 
 def _load_tokens(proc_path):
     toks = []
@@ -23,64 +33,210 @@ def _norm_topic_raw(t):
 def _to_dict_tokens(topic_terms, dct):
     # 1) try underscored whole phrases
     canned = [w.replace(" ", "_") for w in topic_terms]
-    keep = [w for w in canned if w in dct.token2id]
+    keep = [w for w in canned if w in dct]
     if keep:
         return keep
     # 2) fallback: split into unigrams and keep those present
     parts = []
     for w in canned:
         parts.extend(w.split("_"))
-    keep_parts = [p for p in parts if p in dct.token2id]
+    keep_parts = [p for p in parts if p in dct]
     return keep_parts
 
+class OccurrenceIndex:
+    # Positions of the relevant terms in every document, built in a single pass.
+    # texts: token lists, or a TokenStore (then only its id arrays are read).
+    def __init__(self, texts, terms):
+        self.terms = sorted(set(terms))
+        self.term2id = {t: i for i, t in enumerate(self.terms)}
+        if isinstance(texts, TokenStore):
+            lut = np.full(len(texts.vocab) + 1, -1, dtype=np.int64)
+            index = texts.term_index()
+            for t, i in self.term2id.items():
+                if t in index: lut[index[t]] = i
+            lens = texts.lengths.astype(np.int64)
+            flat = lut[texts.ids]
+        else:
+            texts = texts if isinstance(texts, list) else list(texts)
+            lens = np.fromiter(map(len, texts), dtype=np.int64, count=len(texts))
+            flat = np.fromiter(map(self.term2id.get, chain.from_iterable(texts), repeat(-1)),
+                               dtype=np.int64, count=int(lens.sum()))
+        hit = np.flatnonzero(flat >= 0)
+        doc_of = np.repeat(np.arange(len(lens), dtype=np.int64), lens)
+        offsets = np.concatenate([[0], np.cumsum(lens)[:-1]]).astype(np.int64)
+        self.doc = doc_of[hit]
+        self.pos = hit - offsets[self.doc]
+        self.tid = flat[hit]
+        self.doc_len = lens
+
+    @property
+    def n_terms(self):
+        return len(self.terms)
+
+    def doc_intervals(self):
+        # every document is a single "window": (doc, term) presence as [0, 1)
+        V = self.n_terms
+        g = np.unique(self.doc * V + self.tid)
+        ones = np.ones(len(g), dtype=np.int64)
+        return Intervals(g // V, g % V, ones - 1, ones, V), len(self.doc_len)
+
+    def window_intervals(self, window):
+        # gensim boolean sliding window as presence intervals; second value is the window count
+        nwin = np.maximum(1, self.doc_len - window + 1)
+        doc, tid, start, end = _window_presence(self.doc, self.pos, self.tid, self.doc_len, nwin, window, self.n_terms)
+        return Intervals(doc, tid, start, end, self.n_terms), int(nwin.sum())
+
+class Intervals:
+    # [start, end) runs of windows in which a term is present, grouped by term
+    def __init__(self, doc, tid, start, end, n_terms):
+        order = np.lexsort((start, doc, tid))
+        self.doc, self.start, self.end = doc[order], start[order], end[order]
+        self.ptr = np.searchsorted(tid[order], np.arange(n_terms + 1))
+        self.span = int(self.end.max()) + 1 if len(self.end) else 1
+
+    def block(self, ids):
+        # co-occurrence counts between the given terms (occurrence counts on the diagonal).
+        # Windows are never materialized: each doc is cut into segments where the set of these
+        # terms is constant, and segment lengths weight the Gram matrix.
+        uniq, inv = np.unique(ids, return_inverse=True)
+        sel = np.concatenate([np.arange(self.ptr[u], self.ptr[u + 1]) for u in uniq])
+        col = np.repeat(np.arange(len(uniq)), [self.ptr[u + 1] - self.ptr[u] for u in uniq])
+        if not len(sel):
+            return np.zeros((len(ids), len(ids)))
+        d, a, b = self.doc[sel] * self.span, self.start[sel], self.end[sel]
+        cuts = np.sort(np.concatenate([d + a, d + b]), kind="stable")  # merges presorted runs
+        cuts = cuts[np.concatenate([[True], cuts[1:] != cuts[:-1]])]
+        lo, hi = np.searchsorted(cuts, d + a), np.searchsorted(cuts, d + b)
+        n_seg = hi - lo
+        seg = np.repeat(lo - np.concatenate([[0], np.cumsum(n_seg)[:-1]]), n_seg) + np.arange(int(n_seg.sum()))
+        cols = np.repeat(col, n_seg)
+        width = np.diff(cuts).astype(np.float64)[seg]
+        M = csr_matrix((np.ones(len(seg)), (seg, cols)), shape=(len(cuts), len(uniq)))
+        Mw = csr_matrix((width, (seg, cols)), shape=(len(cuts), len(uniq)))
+        G = np.asarray((M.T @ Mw).todense())
+        return G[np.ix_(inv, inv)]
+
+def _window_presence(doc, pos, tid, doc_len, nwin, window, V):
+    # (doc, term, start, end) window intervals in which gensim's accumulator marks the term.
+    # The accumulator sets a word when it enters a window and clears it when the token at the
+    # window's left edge leaves, even if another copy is still inside; replay those set/clear
+    # events per (doc, term) and turn them into [start, end) runs.
+    short = doc_len[doc] < window
+    sd = np.unique(doc[short] * V + tid[short])
+    s_doc, s_tid = sd // V, sd % V
+    s_start = np.zeros(len(sd), dtype=np.int64); s_end = np.ones(len(sd), dtype=np.int64)
+
+    d, p, t = doc[~short], pos[~short], tid[~short]
+    g = d * V + t
+    sets = np.maximum(0, p - window + 1)
+    clears = p + 1
+    valid = clears <= nwin[d] - 1
+    ev_g = np.concatenate([g, g[valid]])
+    ev_t = np.concatenate([sets, clears[valid]])
+    ev_type = np.concatenate([np.ones(len(g), dtype=np.int8), np.zeros(int(valid.sum()), dtype=np.int8)])
+    order = np.lexsort((ev_type, ev_t, ev_g))  # clear before set within the same window
+    ev_g, ev_t, ev_type = ev_g[order], ev_t[order], ev_type[order]
+    first = np.ones(len(ev_g), dtype=bool)
+    first[1:] = ev_g[1:] != ev_g[:-1]
+    prev_clear = np.zeros(len(ev_g), dtype=bool)
+    prev_clear[1:] = ev_type[:-1] == 0
+    starts = np.flatnonzero((ev_type == 1) & (first | prev_clear))
+    l_doc, l_tid = ev_g[starts] // V, ev_g[starts] % V
+    l_start = ev_t[starts]
+    l_end = nwin[l_doc]
+    clear_idx = np.flatnonzero(ev_type == 0)
+    if len(clear_idx):
+        # a run ends at the next clear of the same (doc, term), else at the doc's last window
+        j = np.searchsorted(clear_idx, starts, side="right")
+        nxt = clear_idx[np.minimum(j, len(clear_idx) - 1)]
+        has = (j < len(clear_idx)) & (ev_g[nxt] == ev_g[starts])
+        l_end = np.where(has, ev_t[nxt], l_end)
+    return (np.concatenate([s_doc, l_doc]), np.concatenate([s_tid, l_tid]),
+            np.concatenate([s_start, l_start]), np.concatenate([s_end, l_end]))
+
+def _npmi(C, n):
+    p = np.diag(C) / n
+    pj = C / n
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.log((pj + EPSILON) / np.outer(p, p)) / -np.log(pj + EPSILON)
+
+def c_v(C, n, ids):
+    # s_one_set segmentation, NPMI context vectors (gamma=1), cosine, arithmetic mean
+    M = _npmi(C, n)
+    uniq, inv = np.unique(ids, return_inverse=True)
+    P = np.zeros((len(ids), len(uniq))); P[np.arange(len(ids)), inv] = 1.0
+    ctx = M @ P                      # context vector of each topic word over unique topic words
+    whole = ctx.sum(axis=0)          # context vector of the whole topic
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cos = ctx @ whole / (np.linalg.norm(ctx, axis=1) * np.linalg.norm(whole))
+    return float(np.mean(cos))
+
+def npmi(C, n):
+    # s_one_one segmentation, mean NPMI over ordered pairs
+    M = _npmi(C, n)
+    off = ~np.eye(len(M), dtype=bool)
+    return float(np.mean(M[off])) if off.any() else float("nan")
+
+def umass(D, n):
+    # s_one_pre segmentation over document co-occurrence
+    with np.errstate(divide="ignore", invalid="ignore"):
+        L = np.log((D / n + EPSILON) / (np.diag(D)[None, :] / n))
+    low = np.tril(np.ones(L.shape, dtype=bool), k=-1)
+    return float(np.mean(L[low])) if low.any() else float("nan")
+
+def score_topics(topics, texts, c_v_window=C_V_WINDOW, npmi_window=NPMI_WINDOW):
+    # topics: list of term lists already mapped to corpus tokens; one dict of scores per topic
+    with stage("coherence.index", unit="docs") as st:
+        index = OccurrenceIndex(texts, (w for t in topics for w in t))
+        ids = [np.array([index.term2id[w] for w in t], dtype=np.int64) for t in topics]
+        cv_iv, cv_n = index.window_intervals(c_v_window)
+        np_iv, np_n = index.window_intervals(npmi_window)
+        doc_iv, doc_n = index.doc_intervals()
+        st.add(len(index.doc_len), tokens=int(index.doc_len.sum()))
+    with stage("coherence.score", unit="topics") as st:
+        cv_blocks = [cv_iv.block(i) for i in ids]
+        np_blocks = [np_iv.block(i) for i in ids]
+        doc_blocks = [doc_iv.block(i) for i in ids]
+        scores = [{"c_v": c_v(cv, cv_n, i), "npmi": npmi(nb, np_n), "umass": umass(db, doc_n)}
+                  for i, cv, nb, db in zip(ids, cv_blocks, np_blocks, doc_blocks)]
+        st.add(len(topics))
+    return scores
+
+def _gensim_check(topics, tokens, scores):
+    from gensim.corpora import Dictionary
+    from gensim.models.coherencemodel import CoherenceModel
+    if isinstance(tokens, TokenStore):
+        dct, corpus = to_gensim(tokens)
+        tokens = list(tokens.tokens())
+    else:
+        dct = Dictionary(tokens)
+        corpus = [dct.doc2bow(t) for t in tokens]
+    worst = {"c_v": 0.0, "npmi": 0.0, "umass": 0.0}
+    for t, s in zip(topics, scores):
+        ref = {
+            "c_v": CoherenceModel(topics=[t], texts=tokens, dictionary=dct, coherence="c_v", processes=1).get_coherence(),
+            "npmi": CoherenceModel(topics=[t], texts=tokens, dictionary=dct, coherence="c_npmi", processes=1).get_coherence(),
+            "umass": CoherenceModel(topics=[t], corpus=corpus, dictionary=dct, coherence="u_mass").get_coherence(),
+        }
+        for m in worst:
+            worst[m] = max(worst[m], abs(ref[m] - s[m]))
+    print("[INFO] max |engine - gensim| over topics:", {m: f"{v:.2e}" for m, v in worst.items()})
+    return worst
+
+def corpus_tokens(proc):
+    # (texts, vocab) for score_topics: the token store itself, or the JSONL token lists with
+    # phrases underscored so multi-word topic terms can match
+    if os.path.isdir(proc):
+        # cleaned tokens never contain spaces, so there is nothing to underscore
+        tokens = TokenStore(proc)
+        return tokens, set(tokens.vocab)
+    tokens = [[w.replace(" ", "_") for w in doc] for doc in _load_tokens(proc)]
+    return tokens, {w for doc in tokens for w in doc}
 
-def main():
-    base = read_yaml("configs/base.yaml")
-    proc = os.path.join(base["paths"]["processed_dir"], "chunks_tokens.jsonl")
-    if not os.path.exists(proc) or not GENSIM_OK:
-        return
-    tokens = _load_tokens(proc)
-    # Also underscore the training tokens so phrases may match
-    tokens = [[w.replace(" ", "_") for w in doc] for doc in tokens]
-    dct = Dictionary(tokens)
-
-    rows = [["model","topic_index","coherence_c_v"]]
-
-    # NMF
-    nmf = os.path.join(base["paths"]["models_dir"], "nmf", "best_terms.json")
-    if os.path.exists(nmf):
-        data = json.load(open(nmf,"r",encoding="utf-8"))
-        for i,t in enumerate(data.get("terms", [])):
-            topic = _to_dict_tokens(_norm_topic_raw(t), dct)
-            if not topic: continue
-            cm = CoherenceModel(topics=[topic], texts=tokens, dictionary=dct, coherence="c_v")
-            rows.append(["nmf", i, float(cm.get_coherence())])
-
-    # CorEx
-    corex = os.path.join(base["paths"]["models_dir"], "corex", "topics.json")
-    if os.path.exists(corex):
-        data = json.load(open(corex,"r",encoding="utf-8"))
-        for row in data:
-            topic = _to_dict_tokens(_norm_topic_raw(row.get("terms", [])), dct)
-            if not topic: continue
-            cm = CoherenceModel(topics=[topic], texts=tokens, dictionary=dct, coherence="c_v")
-            rows.append(["corex", int(row["topic"]), float(cm.get_coherence())])
-
-    # BERTopic
-    bt = os.path.join(base["paths"]["models_dir"], "bertopic", "topics.json")
-    if os.path.exists(bt):
-        data = json.load(open(bt,"r",encoding="utf-8"))
-        for row in data:
-            topic = _to_dict_tokens(_norm_topic_raw(row.get("terms", [])), dct)
-            if not topic: continue
-            cm = CoherenceModel(topics=[topic], texts=tokens, dictionary=dct, coherence="c_v")
-            rows.append(["bertopic", int(row["topic"]), float(cm.get_coherence())])
-
-    out = os.path.join(base["paths"]["evaluation_dir"], "coherence.csv")
-    os.makedirs(os.path.dirname(out), exist_ok=True)
-    with open(out,"w",newline="",encoding="utf-8") as f:
-        w = csv.writer(f); w.writerows(rows)
-    print("Coherence (c_v) written to evaluation/coherence.csv")
+def main(check_gensim=False):
+    # coherence is one part of the evaluation engine, which scores every run in the topic table
+    from .engine import main as evaluate
+    return evaluate(check_gensim=check_gensim, cards=False)
 
 if __name__ == "__main__":
-    main()
+    main(check_gensim="--check-gensim" in sys.argv[1:])
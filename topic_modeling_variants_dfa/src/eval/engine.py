@@ -0,0 +1,194 @@
+import os, csv, sys, argparse
+import numpy as np
+from scipy.sparse import csr_matrix
+from ..utils.io import read_yaml
+from ..utils.perf import stage
+from ..features.seeds import load_seeds
+from ..features.store import processed_corpus
+from ..models.topic_table import TopicTable
+from .coherence import score_topics, corpus_tokens, _to_dict_tokens, _norm_topic_raw, _gensim_check
+
+# One evaluation pass over the topic table (src/models/topic_table.py): every topic of every run
+# becomes a row of a binary topic x term matrix T, seed sets a binary set x term matrix S, so seed
+# overlap is T S', per-run term diversity is the number of distinct columns in the run's rows of T,
+# and cross-model alignment is the Jaccard matrix |A n B| / |A u B| from T T'. Coherence scores all
+# distinct topics of all runs against one occurrence index of the corpus (src/eval/coherence.py).
+# Writes, under evaluation_dir:
+#   run_metrics.csv        every run (all NMF grid fits, CorEx sweep fits, ...)
+#   model_comparison.csv   each model's best run, with mean best-match Jaccard to the other models
+#   topic_metrics.csv      per topic: coherence, best seed set, closest topic in each other model
+#   topic_alignment.csv    best-run topic pairs across models with their Jaccard similarity
+#   extrinsic_overlap.csv, coherence.csv   the per-model files earlier versions wrote
+# and the topic cards (src/labeling/topic_cards.py).
+
+TOPIC_METRICS = ["model", "run_id", "best", "topic", "coherence_c_v", "coherence_npmi", "coherence_umass",
+                 "seed_set", "seed_overlap", "closest"]
+
+def incidence(table, top_n=None):
+    # (keys, T): keys[j] = (run, topic), T[j, term] = 1 if the term is in the topic's top_n
+    keys, row_topic = table.topic_rows()
+    rows = table.rank < top_n if top_n else np.ones(len(table), dtype=bool)
+    T = csr_matrix((np.ones(int(rows.sum()), dtype=np.float32), (row_topic[rows], table.term[rows])),
+                   shape=(len(keys), len(table.terms)))
+    return keys, (T > 0).astype(np.float32)
+
+def seed_matrix(seeds, terms):
+    index = {t: i for i, t in enumerate(terms)}
+    names = list(seeds)
+    pairs = [(r, index[t]) for r, n in enumerate(names) for t in dict.fromkeys(seeds[n] or []) if t in index]
+    r, c = zip(*pairs) if pairs else ((), ())
+    return names, csr_matrix((np.ones(len(r), dtype=np.float32), (r, c)), shape=(len(names), len(terms)))
+
+def _groups(keys):
+    # runs present in keys (sorted by run) and where each run's topics start
+    starts = np.flatnonzero(np.concatenate([[True], keys[1:, 0] != keys[:-1, 0]])) if len(keys) else np.zeros(0, int)
+    return keys[starts, 0] if len(keys) else np.zeros(0, int), starts
+
+def jaccard(A, B):
+    inter = (A @ B.T).toarray()
+    sa, sb = np.asarray(A.sum(axis=1)).ravel(), np.asarray(B.sum(axis=1)).ravel()
+    union = sa[:, None] + sb[None, :] - inter
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(union > 0, inter / union, 0.0)
+
+def coherence_scores(table, keys, base, top_n=None):
+    # {(run, topic): {"c_v", "npmi", "umass"}}; identical term lists are scored once
+    proc = processed_corpus(base["paths"])
+    if not os.path.exists(proc) or not len(keys):
+        return {}, [], [], None
+    tokens, vocab = corpus_tokens(proc)
+    uniq, owner = {}, {}
+    for run in np.unique(keys[:, 0]):
+        for topic, terms, _ in table.topics(int(run), top_n):
+            mapped = tuple(_to_dict_tokens(_norm_topic_raw(terms), vocab))
+            if mapped:
+                owner[(int(run), topic)] = uniq.setdefault(mapped, len(uniq))
+    topics = [list(t) for t in uniq]
+    scores = score_topics(topics, tokens) if topics else []
+    return {k: scores[j] for k, j in owner.items()}, topics, scores, tokens
+
+def evaluate(base, seeds, top_n=None, check_gensim=False):
+    table = TopicTable.load(base["paths"]["models_dir"])
+    with stage("evaluate.sets", unit="topics", runs=len(table.runs)) as st:
+        keys, T = incidence(table, top_n)
+        names, S = seed_matrix(seeds, table.terms)
+        O = (T @ S.T).toarray()                                  # topic x seed set overlap
+        runs, starts = _groups(keys)
+        run_overlap = np.maximum.reduceat(O, starts, axis=0) if len(starts) and O.shape[1] else np.zeros((len(runs), len(names)))
+        G = csr_matrix((np.ones(len(keys), dtype=np.float32), (np.searchsorted(runs, keys[:, 0]), np.arange(len(keys)))),
+                       shape=(len(runs), len(keys)))
+        distinct = np.diff((G @ T).tocsr().indptr)              # distinct terms per run
+        total = np.asarray(G @ T.sum(axis=1)).ravel()           # terms per run, summed over its topics
+        st.add(len(keys))
+    with stage("evaluate.coherence", unit="topics") as st:
+        coh, uniq_topics, uniq_scores, tokens = coherence_scores(table, keys, base, top_n)
+        if check_gensim and uniq_topics:
+            _gensim_check(uniq_topics, tokens, uniq_scores)
+        st.add(len(uniq_topics))
+    best = table.best_runs()
+    with stage("evaluate.align", unit="topics") as st:
+        sel = {m: np.flatnonzero(keys[:, 0] == r) for m, r in best.items()}
+        align = {}
+        for a in best:
+            for b in best:
+                if a != b and len(sel[a]) and len(sel[b]):
+                    align[(a, b)] = jaccard(T[sel[a]], T[sel[b]])
+        st.add(sum(len(v) for v in sel.values()))
+    return {"table": table, "keys": keys, "names": names, "overlap": O, "runs": runs, "run_overlap": run_overlap,
+            "starts": starts, "distinct": distinct, "total": total, "coherence": coh, "best": best, "sel": sel,
+            "align": align}
+
+def _mean(vals):
+    vals = [v for v in vals if v is not None and np.isfinite(v)]
+    return float(np.mean(vals)) if vals else float("nan")
+
+def _write(path, header, rows):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f); w.writerow(header); w.writerows(rows)
+
+def write_outputs(res, evdir):
+    table, keys, names = res["table"], res["keys"], res["names"]
+    coh, best, sel, align = res["coherence"], res["best"], res["sel"], res["align"]
+    run_pos = {int(r): i for i, r in enumerate(res["runs"])}
+    ends = np.append(res["starts"][1:], len(keys)).astype(int)
+    metrics = {}
+    for i, run in enumerate(table.runs):
+        p = run_pos.get(i)
+        topics = keys[res["starts"][p]:ends[p], 1].tolist() if p is not None else []
+        scores = [coh.get((i, t)) for t in topics]
+        metrics[i] = {
+            "n_topics": len(topics),
+            "seed_overlap_total": int(res["run_overlap"][p].sum()) if p is not None else 0,
+            "coherence_c_v_mean": _mean([s["c_v"] for s in scores if s]),
+            "coherence_npmi_mean": _mean([s["npmi"] for s in scores if s]),
+            "coherence_umass_mean": _mean([s["umass"] for s in scores if s]),
+            "term_diversity": float(res["distinct"][p] / max(1, res["total"][p])) if p is not None else float("nan"),
+        }
+    cols = ["n_topics", "seed_overlap_total", "coherence_c_v_mean", "coherence_npmi_mean", "coherence_umass_mean",
+            "term_diversity"]
+    _write(os.path.join(evdir, "run_metrics.csv"), ["model", "run_id", "part", "best", "k", *cols],
+           [[r["model"], r["run_id"], r["part"], int(i in best.values()), r.get("k", ""),
+             *[metrics[i][c] for c in cols]] for i, r in enumerate(table.runs)])
+
+    models = sorted(best)
+    mean_align = {(a, b): float(J.max(axis=1).mean()) for (a, b), J in align.items()}
+    _write(os.path.join(evdir, "model_comparison.csv"), ["model", "run_id", *cols[1:], *[f"alignment_{m}" for m in models]],
+           [[m, table.runs[best[m]]["run_id"], *[metrics[best[m]][c] for c in cols[1:]],
+             *[mean_align.get((m, o), "") for o in models]] for m in models])
+
+    closest, pairs, topic_rows = {}, [], []
+    for (a, b), J in align.items():
+        for ia, ja in enumerate(J.argmax(axis=1)):
+            ka, kb = keys[sel[a][ia]], keys[sel[b][ja]]
+            closest.setdefault((a, int(ka[1])), {})[b] = (int(kb[1]), float(J[ia, ja]))
+        if a < b:
+            for ia, ib in zip(*np.nonzero(J)):
+                pairs.append([a, int(keys[sel[a][ia]][1]), b, int(keys[sel[b][ib]][1]), round(float(J[ia, ib]), 4)])
+    _write(os.path.join(evdir, "topic_alignment.csv"), ["model_a", "topic_a", "model_b", "topic_b", "jaccard"],
+           sorted(pairs, key=lambda r: (r[0], r[2], -r[4])))
+
+    for j, (r, t) in enumerate(keys):
+        run = table.runs[r]
+        s = coh.get((int(r), int(t))) or {}
+        o = res["overlap"][j]
+        k = int(np.argmax(o)) if len(o) and o.max() > 0 else None
+        near = closest.get((run["model"], int(t)), {}) if best.get(run["model"]) == r else {}
+        topic_rows.append({"model": run["model"], "run_id": run["run_id"], "best": int(r == best.get(run["model"])),
+                           "topic": int(t), "coherence_c_v": s.get("c_v", ""), "coherence_npmi": s.get("npmi", ""),
+                           "coherence_umass": s.get("umass", ""), "seed_set": names[k] if k is not None else "",
+                           "seed_overlap": int(o[k]) if k is not None else 0,
+                           "closest": ";".join(f"{m}:{nt}:{jv:.3f}" for m, (nt, jv) in sorted(near.items()))})
+    _write(os.path.join(evdir, "topic_metrics.csv"), TOPIC_METRICS, [[d[c] for c in TOPIC_METRICS] for d in topic_rows])
+
+    # the per-model files earlier versions wrote, for the best runs
+    _write(os.path.join(evdir, "extrinsic_overlap.csv"), ["model", "seed_set", "overlap"],
+           [[m, n, int(res["run_overlap"][run_pos[best[m]]][c]) if best[m] in run_pos else 0]
+            for m in models for c, n in enumerate(names)])
+    _write(os.path.join(evdir, "coherence.csv"), ["model", "topic_index", "coherence_c_v", "coherence_npmi", "coherence_umass"],
+           [[m, int(keys[j][1]), *(coh[(best[m], int(keys[j][1]))][x] for x in ("c_v", "npmi", "umass"))]
+            for m in models for j in sel[m] if (best[m], int(keys[j][1])) in coh])
+    return topic_rows
+
+def main(check_gensim=False, cards=True, base_cfg="configs/base.yaml"):
+    base = read_yaml(base_cfg)
+    cfg = base.get("evaluate", {}) or {}
+    res = evaluate(base, load_seeds(cfg.get("seeds_file", "configs/seeds.yaml")), cfg.get("top_n"), check_gensim)
+    if not res["table"].runs:
+        print("No model outputs present.")
+        return 0
+    evdir = base["paths"]["evaluation_dir"]
+    topic_rows = write_outputs(res, evdir)
+    print(f"[INFO] {len(res['table'].runs)} runs, {len(res['keys'])} topics evaluated")
+    print(f"Evaluation written to {evdir}/ (model_comparison.csv, run_metrics.csv, topic_metrics.csv, ...)")
+    if cards:
+        from ..labeling.topic_cards import write_cards
+        write_cards(res["table"], topic_rows, os.path.join(base["paths"]["reports_dir"], "topic_cards"))
+    return 0
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(prog="python -m src.eval.engine")
+    ap.add_argument("--check-gensim", action="store_true", help="cross-check coherence against gensim's CoherenceModel")
+    ap.add_argument("--no-cards", action="store_true", help="skip the topic cards")
+    args = ap.parse_args()
+    sys.exit(main(check_gensim=args.check_gensim, cards=not args.no_cards))
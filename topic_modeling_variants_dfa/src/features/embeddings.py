@@ -0,0 +1,104 @@
+import os, json, hashlib, re
+import numpy as np
+from ..utils.io import batched
+
+# Persistent sentence-embedding cache.
+# <cache_dir>/<model slug>-<dtype>/ holds vectors.bin (rows appended as raw float32/float16, read back
+# through np.memmap), keys.txt (sha1 of the document text, one per row) and meta.json.
+
+def doc_key(text: str):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+def _slug(model_name: str):
+    tail = re.sub(r"[^A-Za-z0-9_.-]+", "_", os.path.basename(model_name.rstrip("/\\")))
+    return f"{tail}-{hashlib.sha1(model_name.encode('utf-8')).hexdigest()[:10]}"
+
+class EmbeddingCache:
+    def __init__(self, cache_dir, model_name, dtype="float32"):
+        self.dtype = np.dtype(dtype)
+        self.dir = os.path.join(cache_dir, f"{_slug(model_name)}-{self.dtype.name}")
+        self.model_name = model_name
+        os.makedirs(self.dir, exist_ok=True)
+        self._vec_path = os.path.join(self.dir, "vectors.bin")
+        self._key_path = os.path.join(self.dir, "keys.txt")
+        meta_path = os.path.join(self.dir, "meta.json")
+        self.dim = None
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                self.dim = int(json.load(f)["dim"])
+        self.index = {}
+        keys = []
+        if os.path.exists(self._key_path):
+            with open(self._key_path, "r", encoding="utf-8") as f:
+                keys = [line[:-1] for line in f if line.endswith("\n")]
+        self._repair(keys)
+        for i, k in enumerate(keys):
+            self.index.setdefault(k, i)
+
+    def _repair(self, keys):
+        # Vectors are appended before their keys, so an interrupted run can leave extra rows or
+        # a torn last key line; cut both files back to the last complete (key, row) pair.
+        n = min(len(keys), self._n_rows())
+        del keys[n:]
+        if self.dim is not None and os.path.exists(self._vec_path):
+            size = n * self.dim * self.dtype.itemsize
+            if os.path.getsize(self._vec_path) != size:
+                with open(self._vec_path, "r+b") as f:
+                    f.truncate(size)
+        if os.path.exists(self._key_path) and os.path.getsize(self._key_path) != sum(len(k) + 1 for k in keys):
+            with open(self._key_path, "w", encoding="utf-8") as f:
+                f.writelines(f"{k}\n" for k in keys)
+
+    def _n_rows(self):
+        if self.dim is None or not os.path.exists(self._vec_path):
+            return 0
+        return os.path.getsize(self._vec_path) // (self.dim * self.dtype.itemsize)
+
+    def vectors(self):
+        n = self._n_rows()
+        if n == 0:
+            return np.zeros((0, self.dim or 0), dtype=self.dtype)
+        return np.memmap(self._vec_path, dtype=self.dtype, mode="r", shape=(n, self.dim))
+
+    def missing(self, keys):
+        return [k for k in dict.fromkeys(keys) if k not in self.index]
+
+    def append(self, keys, vecs):
+        vecs = np.asarray(vecs)
+        if self.dim is None:
+            self.dim = int(vecs.shape[1])
+            with open(os.path.join(self.dir, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump({"model": self.model_name, "dim": self.dim, "dtype": str(self.dtype)}, f, indent=2)
+        start = self._n_rows()
+        with open(self._vec_path, "ab") as f:
+            f.write(np.ascontiguousarray(vecs, dtype=self.dtype).tobytes())
+        with open(self._key_path, "a", encoding="utf-8") as f:
+            for i, k in enumerate(keys):
+                f.write(f"{k}\n")
+                self.index.setdefault(k, start + i)
+
+    def get(self, keys):
+        rows = np.fromiter((self.index[k] for k in keys), dtype=np.int64, count=len(keys))
+        return np.asarray(self.vectors()[rows], dtype=np.float32)
+
+def load_encoder(model_name, device="cpu", local_files_only=False):
+    from sentence_transformers import SentenceTransformer
+    kwargs = {"local_files_only": True} if local_files_only else {}
+    return SentenceTransformer(model_name, device=device, **kwargs)
+
+def embed_documents(docs, model_name, cache_dir, encoder=None, batch_size=64, dtype="float32",
+                    device="cpu", local_files_only=False):
+    # Returns (float32 embeddings aligned with docs, encoder or None). Only documents whose
+    # (text, model) pair is not cached are encoded, in batches of batch_size.
+    cache = EmbeddingCache(cache_dir, model_name, dtype=dtype)
+    keys = [doc_key(d) for d in docs]
+    todo = cache.missing(keys)
+    if todo:
+        text_of = dict(zip(keys, docs))
+        encoder = encoder or load_encoder(model_name, device=device, local_files_only=local_files_only)
+        for batch in batched(todo, batch_size):
+            vecs = encoder.encode([text_of[k] for k in batch], batch_size=batch_size,
+                                  show_progress_bar=False, convert_to_numpy=True)
+            cache.append(batch, vecs)
+    print(f"[INFO] Embeddings: {len(keys) - len(todo)} cached, {len(todo)} encoded ({cache.dir})")
+    return cache.get(keys), encoder
@@ -0,0 +1,153 @@
+import os, json, hashlib, shutil
+from importlib.metadata import version
+import numpy as np
+from scipy.sparse import csr_matrix
+from ..utils.io import read_jsonl
+from ..preprocess.token_store import TokenStore, store_path
+
+# On-disk TF-IDF cache shared by the model runners.
+# <features_dir>/<key>/ holds the CSR arrays as raw .npy (memory-mappable), vocab.txt and the
+# fitted vectorizer; key = hash(processed corpus bytes, tfidf config block, sklearn version).
+# The processed corpus is the integer token store when there is one (built straight from the id
+# arrays), else chunks_tokens.jsonl. tfidf.backend: hashing streams the corpus twice instead and
+# writes the row batches straight to disk (save_feature_batches), never holding X or a vocabulary.
+
+def file_sha256(path, bufsize=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(bufsize), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def store_key(proc_path, tfidf_cfg):
+    # proc_path: chunks_tokens.jsonl or a token store directory
+    if os.path.isdir(proc_path):
+        h = hashlib.sha256(b"tokens")
+        for name in ("vocab.txt", "ids.i32", "offsets.i64"):
+            h.update(file_sha256(os.path.join(proc_path, name)).encode("ascii"))
+    else:
+        h = hashlib.sha256(file_sha256(proc_path).encode("ascii"))
+    h.update(json.dumps(tfidf_cfg or {}, sort_keys=True, default=str).encode("utf-8"))
+    h.update(version("scikit-learn").encode("ascii"))  # without importing sklearn
+    return h.hexdigest()[:24]
+
+def _tfidf_kwargs(tfidf_cfg):
+    return dict(
+        ngram=(tfidf_cfg["ngram_min"], tfidf_cfg["ngram_max"]),
+        min_df=tfidf_cfg["min_df"],
+        max_df=tfidf_cfg["max_df"],
+        dtype=np.dtype(tfidf_cfg.get("dtype", "float64")),
+    )
+
+def _hashing_kwargs(tfidf_cfg):
+    return dict(n_features=int(tfidf_cfg.get("n_features", 1 << 20)), batch_docs=int(tfidf_cfg.get("batch_docs", 4096)),
+                heavy_hitters=int(tfidf_cfg.get("heavy_hitters", 100000)))
+
+def _stream_docs(proc_path):
+    if os.path.isdir(proc_path):
+        return TokenStore(proc_path).joined()
+    return (" ".join(r.get("tokens", []) or []) for r in read_jsonl(proc_path))
+
+def _publish(tmp, store_dir):
+    try:
+        os.replace(tmp, store_dir)
+    except OSError:
+        # another process published the same key first; its copy is equivalent
+        shutil.rmtree(tmp, ignore_errors=True)
+    return store_dir
+
+def _write_common(tmp, shape, dtype, vocab, vec, meta):
+    with open(os.path.join(tmp, "vocab.txt"), "w", encoding="utf-8") as f:
+        for t in vocab:
+            f.write(f"{t}\n")
+    import joblib
+    joblib.dump(vec, os.path.join(tmp, "vectorizer.joblib"))
+    with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({"shape": list(shape), "dtype": str(dtype), **(meta or {})}, f, indent=2)
+
+def save_features(store_dir, X, vocab, vec, meta=None):
+    X = csr_matrix(X)
+    X.sum_duplicates()  # canonical on disk, so read-only memory maps are never re-sorted in place
+    tmp = f"{store_dir}.{os.getpid()}.tmp"
+    os.makedirs(tmp, exist_ok=True)
+    np.save(os.path.join(tmp, "X_data.npy"), X.data)
+    np.save(os.path.join(tmp, "X_indices.npy"), X.indices)
+    np.save(os.path.join(tmp, "X_indptr.npy"), X.indptr)
+    _write_common(tmp, X.shape, X.dtype, vocab, vec, meta)
+    return _publish(tmp, store_dir)
+
+def save_feature_batches(store_dir, batches, vocab, vec, meta=None, copy_block=1 << 22):
+    # like save_features for CSR row batches that never sit in memory together: data/indices are
+    # appended to raw files, then copied block-wise into the .npy files load_features maps
+    tmp = f"{store_dir}.{os.getpid()}.tmp"
+    os.makedirs(tmp, exist_ok=True)
+    indptr, dtype, n_cols = [0], None, len(vocab)
+    with open(os.path.join(tmp, "data.raw"), "wb") as fd, open(os.path.join(tmp, "indices.raw"), "wb") as fi:
+        for X in batches:
+            X = csr_matrix(X); X.sum_duplicates()
+            dtype = X.dtype
+            fd.write(X.data.tobytes()); fi.write(X.indices.astype(np.int32).tobytes())
+            indptr.extend((X.indptr[1:] + indptr[-1]).tolist())
+    nnz = indptr[-1]
+    for name, dt in (("data", dtype or np.float64), ("indices", np.int32)):
+        raw = os.path.join(tmp, f"{name}.raw")
+        out = np.lib.format.open_memmap(os.path.join(tmp, f"X_{name}.npy"), mode="w+", dtype=dt, shape=(nnz,))
+        if nnz:
+            src = np.memmap(raw, dtype=dt, mode="r", shape=(nnz,))
+            for s in range(0, nnz, copy_block):
+                out[s:s + copy_block] = src[s:s + copy_block]
+            del src
+        out.flush(); del out
+        os.remove(raw)
+    np.save(os.path.join(tmp, "X_indptr.npy"), np.asarray(indptr, dtype=np.int64))
+    _write_common(tmp, (len(indptr) - 1, n_cols), dtype or np.float64, vocab, vec, meta)
+    return _publish(tmp, store_dir)
+
+def load_features(store_dir, mmap=True, with_vectorizer=False):
+    with open(os.path.join(store_dir, "meta.json"), "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    mode = "r" if mmap else None
+    arrs = [np.load(os.path.join(store_dir, f"X_{n}.npy"), mmap_mode=mode) for n in ("data", "indices", "indptr")]
+    X = csr_matrix(tuple(arrs), shape=tuple(meta["shape"]), copy=False)
+    X.has_canonical_format = True
+    with open(os.path.join(store_dir, "vocab.txt"), "r", encoding="utf-8") as f:
+        vocab = np.array([line.rstrip("\n") for line in f])
+    vec = None
+    if with_vectorizer:
+        import joblib
+        vec = joblib.load(os.path.join(store_dir, "vectorizer.joblib"))
+    return X, vocab, vec
+
+def processed_corpus(paths):
+    # token store dir if preprocess wrote one, else the JSONL path (which may not exist yet)
+    tok = store_path(paths)
+    if os.path.exists(os.path.join(tok, "meta.json")):
+        return tok
+    return os.path.join(paths["processed_dir"], "chunks_tokens.jsonl")
+
+def load_or_build_tfidf(base, proc_path=None, mmap=True, with_vectorizer=False):
+    paths = base["paths"]
+    proc_path = proc_path or processed_corpus(paths)
+    tfidf_cfg = base["tfidf"]
+    key = store_key(proc_path, tfidf_cfg)
+    from .tfidf import build_tfidf_strs, build_tfidf_ids, build_tfidf_hashing  # sklearn: only when building
+    store_dir = os.path.join(paths.get("features_dir", "data/features"), f"tfidf_{key}")
+    if not os.path.exists(os.path.join(store_dir, "meta.json")) and tfidf_cfg.get("backend", "exact") == "hashing":
+        vec, vocab, batches = build_tfidf_hashing(lambda: _stream_docs(proc_path), **_tfidf_kwargs(tfidf_cfg),
+                                                  **_hashing_kwargs(tfidf_cfg))
+        save_feature_batches(store_dir, batches, vocab, vec, meta={"corpus": proc_path, "tfidf": tfidf_cfg})
+        print(f"[INFO] TF-IDF (hashing, {len(vocab)} of {vec.n_features} buckets used) cached in {store_dir}")
+    elif not os.path.exists(os.path.join(store_dir, "meta.json")):
+        built = None
+        if os.path.isdir(proc_path):
+            tokens = TokenStore(proc_path)
+            built = build_tfidf_ids(tokens, **_tfidf_kwargs(tfidf_cfg))
+            records = None if built else list(tokens.records())
+        else:
+            records = list(read_jsonl(proc_path))
+        X, vocab, vec = built or build_tfidf_strs(records, **_tfidf_kwargs(tfidf_cfg))
+        save_features(store_dir, X, vocab, vec, meta={"corpus": proc_path, "tfidf": tfidf_cfg})
+        print(f"[INFO] TF-IDF built {X.shape} and cached in {store_dir}")
+    else:
+        print(f"[INFO] TF-IDF loaded from cache {store_dir}")
+    return load_features(store_dir, mmap=mmap, with_vectorizer=with_vectorizer)
@@ -1,5 +1,12 @@
-from sklearn.feature_extraction.text import TfidfVectorizer
+import re
+from numbers import Integral
+from sklearn.feature_extraction import FeatureHasher
+from sklearn.feature_extraction.text import TfidfVectorizer, TfidfTransformer, HashingVectorizer
+from sklearn.preprocessing import normalize
 import numpy as np
+from scipy.sparse import csr_matrix
+from ..utils.io import batched
+from ..utils.perf import stage, timed_iter
 
 def _docs_from_records(records):
     docs_tokens = [" ".join(r.get("tokens", []) or []) for r in records]
@@ -8,17 +15,209 @@ def _docs_from_records(records):
     docs_text = [r.get("text", "") for r in records]
     return docs_text, False
 
-def build_tfidf_strs(records, ngram=(1,3), min_df=1, max_df=0.9):
+TOKEN_PATTERN = r"(?u)\b[\w\-']+\b"
+
+def build_tfidf_strs(records, ngram=(1,3), min_df=1, max_df=0.9, dtype=np.float64):
     docs, using_tokens = _docs_from_records(records)
     vec = TfidfVectorizer(
         ngram_range=ngram,
         min_df=min_df,
         max_df=max_df,
         lowercase=True,
-        token_pattern=r"(?u)\b[\w\-']+\b",
+        token_pattern=TOKEN_PATTERN,
+        dtype=dtype,
     )
-    X = vec.fit_transform(docs)
-    vocab = np.array(vec.get_feature_names_out())
+    with stage("tfidf.build", unit="docs") as st:
+        X = vec.fit_transform(docs)
+        vocab = np.array(vec.get_feature_names_out())
+        st.add(X.shape[0])
+        st.meta.update(n_terms=int(X.shape[1]), nnz=int(X.nnz), dtype=str(X.dtype))
     if X.shape[1] == 0:
         raise ValueError(f"Empty TF–IDF vocabulary (using_tokens={using_tokens}).")
     return X, vocab, vec
+
+def _canonical(vocab):
+    # what TOKEN_PATTERN makes of each stored term (e.g. a trailing apostrophe is dropped);
+    # None if some term would not map to exactly one token
+    pat = re.compile(TOKEN_PATTERN)
+    canon, index, lut = [], {}, np.empty(len(vocab), dtype=np.int64)
+    for i, t in enumerate(vocab):
+        parts = pat.findall(t.lower())
+        if len(parts) != 1:
+            return None, None
+        lut[i] = index.setdefault(parts[0], len(index))
+        if lut[i] == len(canon):
+            canon.append(parts[0])
+    return lut, np.array(canon, dtype=object)
+
+def _ngram_counts(store, lut, V, n, batch_tokens=1 << 22):
+    # (doc, key, count, first position) of every n-gram within a document; key = base-V digits
+    # of the term ids, position = index into the store's flat id array
+    docs, keys, counts, firsts = [], [], [], []
+    offsets = np.asarray(store.offsets)
+    d0 = 0
+    while d0 < len(store):
+        d1 = max(d0 + 1, int(np.searchsorted(offsets, offsets[d0] + batch_tokens, side="right")) - 1)
+        d1 = min(d1, len(store))
+        c = lut[np.asarray(store.ids[offsets[d0]:offsets[d1]])]
+        doc = np.repeat(np.arange(d0, d1, dtype=np.int64), np.diff(offsets[d0:d1 + 1]))
+        m = len(c) - n + 1
+        if m > 0:
+            key = c[:m].copy()
+            for j in range(1, n):
+                key = key * V + c[j:j + m]
+            ok = doc[:m] == doc[n - 1:]
+            key, doc, pos = key[ok], doc[:m][ok], np.flatnonzero(ok) + offsets[d0]
+            order = np.lexsort((key, doc))  # stable: first element of a run is the first occurrence
+            key, doc, pos = key[order], doc[order], pos[order]
+            new = np.concatenate([[True], (key[1:] != key[:-1]) | (doc[1:] != doc[:-1])]) if len(key) else np.zeros(0, bool)
+            starts = np.flatnonzero(new)
+            docs.append(doc[starts]); keys.append(key[starts]); firsts.append(pos[starts])
+            counts.append(np.diff(np.append(starts, len(key))))
+        d0 = d1
+    cat = lambda xs: np.concatenate(xs) if xs else np.zeros(0, dtype=np.int64)
+    return cat(docs), cat(keys), cat(counts), cat(firsts)
+
+def build_tfidf_ids(store, ngram=(1,3), min_df=1, max_df=0.9, dtype=np.float64):
+    # Same X / vocab as build_tfidf_strs on " ".join(tokens), computed from a TokenStore's id
+    # arrays: n-grams are integer keys, strings are only built for the surviving features.
+    # Returns None when the ids cannot reproduce the string path (then use build_tfidf_strs).
+    lut, canon = _canonical(store.vocab)
+    V = len(canon) if canon is not None else 0
+    if canon is None or V == 0 or store.meta["n_tokens"] == 0 or float(V) ** ngram[1] >= 2.0 ** 63:
+        return None
+    n_doc = len(store)
+    max_doc_count = max_df if isinstance(max_df, Integral) else max_df * n_doc
+    min_doc_count = min_df if isinstance(min_df, Integral) else min_df * n_doc
+    if max_doc_count < min_doc_count:
+        raise ValueError("max_df corresponds to < documents than min_df")
+    rows, cols, data, names, seen = [], [], [], [], []
+    offsets = np.asarray(store.offsets)
+    for n in range(ngram[0], ngram[1] + 1):
+        doc, key, cnt, pos = _ngram_counts(store, lut, V, n)
+        uniq, inv, df = np.unique(key, return_inverse=True, return_counts=True)
+        keep = (df <= max_doc_count) & (df >= min_doc_count)
+        digits = [uniq[keep] // V ** (n - 1 - j) % V for j in range(n)]
+        names.extend(" ".join(w) for w in zip(*(canon[d] for d in digits)))
+        first = np.full(len(uniq), np.iinfo(np.int64).max, dtype=np.int64)
+        np.minimum.at(first, inv, pos)
+        first = first[keep]
+        seen.append((np.searchsorted(offsets, first, side="right") - 1, np.full(len(first), n), first))
+        col = np.full(len(uniq), -1, dtype=np.int64)
+        col[keep] = np.arange(int(keep.sum())) + len(names) - int(keep.sum())
+        c = col[inv]; sel = c >= 0
+        rows.append(doc[sel]); cols.append(c[sel]); data.append(cnt[sel])
+    if not names:
+        raise ValueError("After pruning, no terms remain. Try a lower min_df or a higher max_df.")
+    names = np.array(names, dtype=object)
+    # sklearn numbers features by first appearance (doc, then n, then position), orders each row's
+    # entries that way, and only then relabels columns alphabetically without re-sorting rows;
+    # row norms are summed in that order, so it is reproduced to get identical floats
+    fd, fn, fp = (np.concatenate(x) for x in zip(*seen))
+    seen_order = np.empty(len(names), dtype=np.int64); seen_order[np.lexsort((fp, fn, fd))] = np.arange(len(names))
+    order = np.argsort(names.astype(str), kind="stable")
+    rank = np.empty(len(order), dtype=np.int64); rank[order] = np.arange(len(order))
+    by_seen = np.empty(len(names), dtype=np.int64); by_seen[seen_order] = np.arange(len(names))
+    r, c = np.concatenate(rows), seen_order[np.concatenate(cols)]
+    counts = csr_matrix((np.concatenate(data).astype(dtype), (r, c)), shape=(n_doc, len(names)), dtype=dtype)
+    counts.sort_indices()
+    counts.indices = rank[by_seen[counts.indices]].astype(counts.indices.dtype)
+    counts.has_sorted_indices = False
+    vocab = names[order]
+    tfidf = TfidfTransformer()
+    X = tfidf.fit_transform(counts)
+    vec = TfidfVectorizer(ngram_range=ngram, min_df=min_df, max_df=max_df, lowercase=True,
+                          token_pattern=TOKEN_PATTERN, dtype=dtype,
+                          vocabulary={t: i for i, t in enumerate(vocab)})
+    vec.idf_ = tfidf.idf_
+    return X, vocab, vec
+
+class HashingTfidf:
+    # Fitted hashing TF-IDF (build_tfidf_hashing): transform(docs) gives rows like the training
+    # matrix. Buckets outside min_df/max_df are dropped; columns keep bucket order. known: the
+    # heavy-hitter terms seen in training -> their column (a bucket may hold several).
+    def __init__(self, ngram, n_features, dtype, columns, idf, names, known=None):
+        self.ngram_range, self.n_features, self.dtype = ngram, n_features, dtype
+        self.columns, self.idf_, self.names = columns, idf, names
+        self.known = known
+
+    def _hashing(self):
+        return HashingVectorizer(ngram_range=self.ngram_range, lowercase=True, token_pattern=TOKEN_PATTERN,
+                                 n_features=self.n_features, alternate_sign=False, norm=None, dtype=self.dtype)
+
+    def build_analyzer(self):
+        return self._hashing().build_analyzer()
+
+    def get_feature_names_out(self):
+        return self.names
+
+    def transform(self, docs):
+        C = self._hashing().transform(docs)
+        col = self.columns[C.indices]
+        keep = col >= 0
+        row = np.repeat(np.arange(C.shape[0]), np.diff(C.indptr))
+        indptr = np.concatenate([[0], np.cumsum(np.bincount(row[keep], minlength=C.shape[0]))])
+        X = csr_matrix((C.data[keep] * self.idf_[col[keep]], col[keep], indptr), shape=(C.shape[0], len(self.idf_)),
+                       dtype=self.dtype)
+        return normalize(X, norm="l2", copy=False)
+
+    def term_columns(self, terms):
+        # column of each term's bucket, or -1 unless the term was seen in training (a heavy hitter
+        # of a kept bucket): every string hashes to some bucket, mostly one that other terms filled
+        known = getattr(self, "known", None)
+        if known is None:  # stores from before `known`: only a bucket's name counts
+            known = {str(n): c for c, n in enumerate(self.names) if not str(n).startswith("#")}
+        return [known.get(t, -1) for t in terms]
+
+def _prune(counts, k):
+    # Misra-Gries: subtract the k-th largest count, drop what falls to zero
+    thr = np.partition(np.fromiter(counts.values(), dtype=np.int64), len(counts) - k)[len(counts) - k]
+    return {t: c - thr for t, c in counts.items() if c > thr}
+
+def build_tfidf_hashing(docs_fn, ngram=(1,3), min_df=1, max_df=0.9, dtype=np.float64, n_features=1 << 20,
+                        batch_docs=4096, heavy_hitters=100000):
+    # Out-of-core TF-IDF: docs_fn() streams the corpus and is called twice. Pass 1 hashes each batch
+    # into n_features buckets and adds up bucket document frequencies, while a Misra-Gries summary of
+    # at most 2 * heavy_hitters terms remembers the frequent terms behind the buckets; pass 2 (the
+    # returned generator) yields l2-normalised TF-IDF row batches. Memory is one batch plus
+    # O(n_features + heavy_hitters), whatever the n-gram vocabulary. Unnamed columns read "#<bucket>".
+    analyze = HashingVectorizer(ngram_range=ngram, lowercase=True, token_pattern=TOKEN_PATTERN).build_analyzer()
+    fh = FeatureHasher(n_features=n_features, input_type="string", alternate_sign=False)
+    df = np.zeros(n_features, dtype=np.int64)
+    heavy, n_doc = {}, 0
+    with stage("tfidf.hashing_df", unit="docs", n_features=n_features) as st:
+        for batch in batched(docs_fn(), batch_docs):
+            terms = [analyze(d) for d in batch]
+            C = fh.transform(terms)
+            df += np.bincount(C.indices, minlength=n_features)
+            for t in terms:
+                for w in set(t):
+                    heavy[w] = heavy.get(w, 0) + 1
+            if len(heavy) > 2 * heavy_hitters:
+                heavy = _prune(heavy, heavy_hitters)
+            n_doc += len(batch); st.add(len(batch))
+    max_doc_count = max_df if isinstance(max_df, Integral) else max_df * n_doc
+    min_doc_count = min_df if isinstance(min_df, Integral) else min_df * n_doc
+    if max_doc_count < min_doc_count:
+        raise ValueError("max_df corresponds to < documents than min_df")
+    keep = (df > 0) & (df >= min_doc_count) & (df <= max_doc_count)
+    if not keep.any():
+        raise ValueError("After pruning, no terms remain. Try a lower min_df or a higher max_df.")
+    columns = np.full(n_features, -1, dtype=np.int64)
+    columns[keep] = np.arange(int(keep.sum()))
+    idf = (np.log((1 + n_doc) / (1 + df[keep])) + 1).astype(dtype)  # TfidfTransformer's smooth idf
+    # name each bucket after its most frequent tracked term
+    names = np.array([f"#{b}" for b in np.flatnonzero(keep)], dtype=object)
+    ranked = sorted(heavy, key=lambda w: (-heavy[w], w))
+    known, named = {}, set()
+    if ranked:
+        cols = columns[fh.transform([[w] for w in ranked]).indices]
+        for w, c in zip(ranked, cols.tolist()):
+            if c >= 0:
+                if c not in named:
+                    names[c] = w; named.add(c)
+                known[w] = c
+    vec = HashingTfidf(ngram, n_features, dtype, columns, idf, names, known)
+    rows = timed_iter((vec.transform(b) for b in batched(docs_fn(), batch_docs)), "tfidf.hashing_transform",
+                      unit="batches", count=lambda X: {"docs": X.shape[0], "nnz": int(X.nnz)})
+    return vec, names, rows
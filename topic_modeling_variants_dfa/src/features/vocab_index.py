@@ -0,0 +1,50 @@
+import re
+from .tfidf import TOKEN_PATTERN
+
+# Term -> column lookup over a feature store vocabulary, built once per fit. A seed term is tried
+# as given, lowercased, re-tokenized, and in the corpus's own token form (preprocess.clean:
+# stopwords dropped, lemmatized), so "fears of needles" finds the n-gram "fear needle". With the
+# hashing backend the vectorizer maps terms to columns by hash instead, and only terms its
+# heavy-hitter summary saw in training count: any other string lands in some occupied bucket.
+
+class VocabIndex:
+    def __init__(self, vocab, vec=None, extra_stop=None):
+        self.vocab = vocab
+        self.term_columns = getattr(vec, "term_columns", None)
+        self.index = None if self.term_columns else {t: i for i, t in enumerate(vocab)}
+        self.extra_stop = extra_stop
+
+    def __len__(self):
+        return len(self.vocab)
+
+    def forms(self, term):
+        t = str(term).strip()
+        low = t.lower()
+        forms = [t, low, " ".join(re.findall(TOKEN_PATTERN, low))]
+        try:
+            from ..preprocess.clean import process_record
+            forms.append(" ".join(process_record({"text": t}, extra_stop=self.extra_stop)["tokens"]))
+        except LookupError:
+            pass  # NLTK stopwords/wordnet missing: no lemma-aware form
+        return [f for f in dict.fromkeys(forms) if f]
+
+    def lookup(self, term):
+        forms = self.forms(term)
+        if self.term_columns:
+            ids = [c for c in self.term_columns(forms) if c >= 0]
+        else:
+            ids = [self.index[f] for f in forms if f in self.index]
+        return list(dict.fromkeys(ids))
+
+    def resolve(self, seeds):
+        # ({group: [column ids]}, [seed terms that matched nothing])
+        groups, missing = {}, []
+        for g, terms in seeds.items():
+            ids = []
+            for t in terms or []:
+                hit = self.lookup(t)
+                ids.extend(hit)
+                if not hit:
+                    missing.append(t)
+            groups[g] = list(dict.fromkeys(ids))
+        return groups, missing
@@ -1,12 +1,15 @@
 import re
+from ..utils.perf import timed_generator
 
 def _tokenize(txt: str):
     return re.findall(r"\w+|\S", txt)
 
+@timed_generator("ingest.chunk", unit="chunks", count=lambda c: {"tokens": c["text"].count(" ") + 1})
 def chunk_pages(doc, target_tokens=320, overlap_tokens=50):
-    chunks = []
-    buf, count, start_page = [], 0, None
+    # Generator; doc["pages"] may itself be a lazy page stream.
+    buf, count, start_page, last_page = [], 0, None, None
     for page in doc["pages"]:
+        last_page = page["page"]
         toks = _tokenize(page["text"] or "")
         i = 0
         while i < len(toks):
@@ -16,10 +19,9 @@ def chunk_pages(doc, target_tokens=320, overlap_tokens=50):
             take = min(need, len(toks) - i)
             buf.extend(toks[i:i+take]); i += take; count += take
             if count >= target_tokens:
-                chunks.append({"start_page": start_page, "end_page": page["page"], "text": " ".join(buf)})
+                yield {"start_page": start_page, "end_page": page["page"], "text": " ".join(buf)}
                 buf = buf[-overlap_tokens:]
                 count = len(buf)
                 start_page = None
     if buf:
-        chunks.append({"start_page": start_page or 1, "end_page": doc["pages"][-1]["page"], "text": " ".join(buf)})
-    return chunks
+        yield {"start_page": start_page or 1, "end_page": last_page, "text": " ".join(buf)}
@@ -0,0 +1,170 @@
+import os, re, json, hashlib, tempfile
+from array import array
+from functools import lru_cache
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from ..utils.io import read_jsonl, batched
+from ..utils.perf import stage
+from .pdf_to_text import _bounded_map
+
+# Near-duplicate chunk removal: MinHash signatures over word shingles + banded LSH.
+# Pass 1 writes one signature row per chunk to a temporary memmap (bounded memory: a batch of
+# records per worker). Candidate pairs come from sorting each band's hash column, so the cost is
+# O(n log n) per band, never pairwise; a candidate is joined to the first chunk of its bucket and
+# accepted when the signatures agree on >= threshold of their slots (estimated Jaccard).
+# Connected components of accepted pairs are duplicate groups; the earliest chunk represents each.
+# Pass 2 re-reads the input and writes kept chunks plus a provenance map of what was removed.
+
+TOKEN_RE = re.compile(r"\w+")
+MERSENNE = np.uint64((1 << 61) - 1)
+MAX32 = np.uint64((1 << 32) - 1)
+
+def _perm(num_perm, seed):
+    rng = np.random.RandomState(seed)
+    a = rng.randint(1, (1 << 61) - 1, size=num_perm, dtype=np.uint64)
+    b = rng.randint(0, (1 << 61) - 1, size=num_perm, dtype=np.uint64)
+    return a, b
+
+@lru_cache(maxsize=1 << 18)
+def _token_hash(tok):
+    return int.from_bytes(hashlib.blake2b(tok.encode("utf-8"), digest_size=8).digest(), "little")
+
+def shingle_hashes(text, k=5):
+    # 32-bit hashes of the word k-shingles (rolling combination of per-token hashes)
+    toks = TOKEN_RE.findall(text.lower())
+    if not toks:
+        return np.zeros(0, dtype=np.uint64)
+    h = np.fromiter(map(_token_hash, toks), dtype=np.uint64, count=len(toks))
+    k = min(k, len(h))
+    m = len(h) - k + 1
+    with np.errstate(over="ignore"):
+        acc = h[:m].copy()
+        for j in range(1, k):
+            acc = acc * np.uint64(1099511628211) + h[j:j + m]
+    return np.unique(acc & MAX32)
+
+def minhash(hv, a, b):
+    if not len(hv):
+        return np.full(len(a), MAX32, dtype=np.uint32)
+    with np.errstate(over="ignore"):
+        phv = ((hv[:, None] * a[None, :] + b[None, :]) % MERSENNE) & MAX32
+    return phv.min(axis=0).astype(np.uint32)
+
+def lsh_params(threshold, num_perm, fn_weight=0.9):
+    # (bands, rows), bands * rows <= num_perm, minimising the weighted areas under the S-curve
+    # P(s) = 1 - (1 - s^r)^b: false positives below threshold, false negatives above (datasketch's
+    # choice). Misses are weighted up since the signature-agreement check drops false candidates.
+    s = (np.arange(200) + 0.5) / 200
+    lo, hi = s < threshold, s >= threshold
+    best = None
+    for b in range(1, num_perm + 1):
+        for r in range(1, num_perm // b + 1):
+            p = 1.0 - (1.0 - s ** r) ** b
+            err = ((1 - fn_weight) * p[lo].sum() + fn_weight * (1.0 - p[hi]).sum()) / len(s)
+            if best is None or err < best[0]:
+                best = (err, b, r)
+    return best[1], best[2]
+
+def _signature_batch(args):
+    texts, k, num_perm, seed = args
+    a, b = _perm(num_perm, seed)
+    return np.stack([minhash(shingle_hashes(t, k), a, b) for t in texts]) if texts else np.zeros((0, num_perm), np.uint32)
+
+def _band_hash(sig, lo, hi):
+    with np.errstate(over="ignore"):
+        h = np.full(sig.shape[0], 14695981039346656037, dtype=np.uint64)
+        for j in range(lo, hi):
+            h = (h ^ sig[:, j].astype(np.uint64)) * np.uint64(1099511628211)
+    return h
+
+def _components(sig, bands, rows, threshold, chunk=1 << 16):
+    n = sig.shape[0]
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+    src, dst = [], []
+    for band in range(bands):
+        h = _band_hash(np.ascontiguousarray(sig[:, band * rows:(band + 1) * rows]), 0, rows)
+        order = np.argsort(h, kind="stable")
+        hs = h[order]
+        starts = np.concatenate([[True], hs[1:] != hs[:-1]])
+        head = order[np.flatnonzero(starts)[np.cumsum(starts) - 1]]  # first chunk of each bucket
+        cand = np.flatnonzero(head != order)
+        for s in range(0, len(cand), chunk):
+            i, j = head[cand[s:s + chunk]], order[cand[s:s + chunk]]
+            ok = (sig[i] == sig[j]).mean(axis=1) >= threshold
+            src.append(i[ok]); dst.append(j[ok])
+    src = np.concatenate(src) if src else np.zeros(0, np.int64)
+    dst = np.concatenate(dst) if dst else np.zeros(0, np.int64)
+    g = coo_matrix((np.ones(len(src), np.int8), (src, dst)), shape=(n, n))
+    _, labels = connected_components(g, directed=False)
+    rep = np.full(labels.max() + 1, n, dtype=np.int64)
+    np.minimum.at(rep, labels, np.arange(n))
+    return rep[labels]
+
+class _Provenance:
+    # pdf_id / page span of every chunk in ~12 bytes each
+    def __init__(self):
+        self.names, self.index, self.doc, self.pages = [], {}, array("i"), array("i")
+
+    def add(self, rec):
+        pid = rec.get("pdf_id")
+        if pid not in self.index:
+            self.index[pid] = len(self.names); self.names.append(pid)
+        self.doc.append(self.index[pid])
+        self.pages.extend((rec.get("start_page") or 0, rec.get("end_page") or 0))
+
+    def __call__(self, i):
+        return {"pdf_id": self.names[self.doc[i]], "start_page": self.pages[2 * i], "end_page": self.pages[2 * i + 1]}
+
+def dedup_jsonl(in_path, out_path, map_path, threshold=0.8, num_perm=128, shingle_size=5, mode="drop",
+                workers=0, batch_size=1024, seed=1):
+    # returns {"chunks", "kept", "removed", "groups"}; map_path gets one line per removed chunk
+    workers = int(workers or os.cpu_count() or 1)
+    bands, rows = lsh_params(threshold, num_perm)
+    n = sum(1 for _ in open(in_path, "r", encoding="utf-8"))
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    fd, sig_path = tempfile.mkstemp(suffix=".minhash", dir=os.path.dirname(out_path) or ".")
+    os.close(fd)
+    try:
+        where = _Provenance()
+        def jobs():
+            for batch in batched(read_jsonl(in_path), batch_size):
+                for r in batch:
+                    where.add(r)
+                yield [r.get("text", "") for r in batch], shingle_size, num_perm, seed
+        with stage("dedup.minhash", unit="chunks", num_perm=num_perm, bands=bands, rows=rows) as st:
+            mm = np.memmap(sig_path, dtype=np.uint32, mode="w+", shape=(max(n, 1), num_perm))
+            sig = mm[:n]
+            parts = _bounded_map(_signature_batch, jobs(), workers) if workers > 1 else map(_signature_batch, jobs())
+            i = 0
+            for part in parts:
+                sig[i:i + len(part)] = part; i += len(part)
+            mm.flush()
+            st.add(n)
+        with stage("dedup.lsh", unit="chunks") as st:
+            rep = _components(sig, bands, rows, threshold)
+            st.add(n)
+        dup = np.flatnonzero(rep != np.arange(n))
+        groups = int(len(np.unique(rep[dup])))
+        jac = dict(zip(dup.tolist(), (sig[dup] == sig[rep[dup]]).mean(axis=1).round(4).tolist())) if len(dup) else {}
+        del sig, mm
+        members = {}
+        for d in dup.tolist():
+            members.setdefault(int(rep[d]), []).append(d)
+        with open(out_path, "w", encoding="utf-8") as out, open(map_path, "w", encoding="utf-8") as mp:
+            for idx, rec in enumerate(read_jsonl(in_path)):
+                r = int(rep[idx])
+                if r == idx:
+                    if mode == "collapse" and idx in members:
+                        rec["dup_count"] = len(members[idx])
+                        rec["sources"] = [where(idx)] + [where(d) for d in members[idx]]
+                    out.write(json.dumps(rec, ensure_ascii=False) + "\n")
+                else:
+                    mp.write(json.dumps({"chunk": idx, **where(idx), "duplicate_of": {"chunk": r, **where(r)},
+                                         "jaccard": jac[idx]}, ensure_ascii=False) + "\n")
+    finally:
+        os.remove(sig_path)
+    print(f"[INFO] Dedup: {n} chunks, {len(dup)} near-duplicates in {groups} groups removed "
+          f"(Jaccard >= {threshold}, {bands} bands x {rows} rows)")
+    return {"chunks": n, "kept": n - int(len(dup)), "removed": int(len(dup)), "groups": groups}
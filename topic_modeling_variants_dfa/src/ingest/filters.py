@@ -0,0 +1,23 @@
+import re
+from .chunker import chunk_pages
+
+REF_HEAD = re.compile(r"^\s*(references|bibliography)\b", re.I)
+DOI_OR_URL = re.compile(r"\b(doi:|https?://|www\.)", re.I)
+PUBLISHER_FOOT = re.compile(r"(sagepub|copyright|all rights reserved)", re.I)
+
+def keep_chunk(text: str):
+    if REF_HEAD.search(text) or len(DOI_OR_URL.findall(text)) >= 2:
+        return False
+    if len(text.split()) < 25 and PUBLISHER_FOOT.search(text):
+        return False
+    return True
+
+def chunk_records(doc, target_tokens=320, overlap_tokens=50):
+    # Chunk one document and drop reference-list / publisher-footer chunks.
+    for ch in chunk_pages(doc, target_tokens=target_tokens, overlap_tokens=overlap_tokens):
+        text = ch["text"] or ""
+        if not keep_chunk(text):
+            continue
+        yield {"pdf_id": doc["pdf_id"], "title": doc["title"],
+               "start_page": ch["start_page"], "end_page": ch["end_page"],
+               "text": text}
@@ -1,32 +1,125 @@
-import os
+import os, json, hashlib
 from io import StringIO
-from pdfminer.high_level import extract_text_to_fp
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import pdfminer
+from pdfminer.converter import TextConverter
 from pdfminer.layout import LAParams
+from pdfminer.pdfinterp import PDFResourceManager, PDFPageInterpreter
 from pdfminer.pdfpage import PDFPage
+from ..utils.perf import stage
 
-def _extract_page_text(pdf_path, page_numbers=None):
-    output = StringIO()
-    laparams = LAParams()
-    with open(pdf_path, "rb") as f:
-        extract_text_to_fp(f, output, laparams=laparams, page_numbers=page_numbers, output_type="text")
-    return output.getvalue()
+def _laparams_key(laparams):
+    # every LAParams field plus the pdfminer version: a layout change must invalidate the cache
+    return json.dumps({"pdfminer": pdfminer.__version__, **vars(laparams)}, sort_keys=True, default=str)
 
-def pdf_to_pages(path):
-    pages = []
+def _file_sha256(path, bufsize=1 << 20):
+    h = hashlib.sha256()
     with open(path, "rb") as f:
-        for i, _ in enumerate(PDFPage.get_pages(f), start=0):
-            txt = _extract_page_text(path, page_numbers=[i]) or ""
-            pages.append({"page": i + 1, "text": txt})
+        for block in iter(lambda: f.read(bufsize), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def cache_key(path, laparams=None):
+    laparams = laparams or LAParams()
+    h = hashlib.sha256(_file_sha256(path).encode("ascii"))
+    h.update(_laparams_key(laparams).encode("utf-8"))
+    return h.hexdigest()
+
+def iter_pages(path, laparams=None):
+    # Parse the document once and yield each page's text as soon as it is laid out.
+    # Output matches extract_text_to_fp(page_numbers=[i]) page by page.
+    laparams = laparams or LAParams()
+    rsrc = PDFResourceManager(caching=True)
+    out = StringIO()
+    device = TextConverter(rsrc, out, laparams=laparams)
+    try:
+        interp = PDFPageInterpreter(rsrc, device)
+        with open(path, "rb") as f:
+            for i, page in enumerate(PDFPage.get_pages(f, caching=True), start=0):
+                interp.process_page(page)
+                txt = out.getvalue()
+                out.seek(0); out.truncate(0)
+                yield {"page": i + 1, "text": txt or ""}
+    finally:
+        device.close()
+
+def _cache_path(cache_dir, key):
+    return os.path.join(cache_dir, f"{key}.json")
+
+def _read_cache(cache_dir, key):
+    p = _cache_path(cache_dir, key)
+    if not os.path.exists(p):
+        return None
+    try:
+        with open(p, "r", encoding="utf-8") as f:
+            return json.load(f)["pages"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+def _write_cache(cache_dir, key, pages):
+    os.makedirs(cache_dir, exist_ok=True)
+    p = _cache_path(cache_dir, key)
+    tmp = f"{p}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"pages": pages}, f, ensure_ascii=False)
+    os.replace(tmp, p)
+
+def iter_doc_pages(path, laparams=None, cache_dir=None):
+    # Streaming counterpart of pdf_to_pages: serves cached pages, or extracts lazily and
+    # fills the cache once the document is done.
+    key = cache_key(path, laparams) if cache_dir else None
+    pages = _read_cache(cache_dir, key) if key else None
+    if pages is not None:
+        yield from pages
+        return
+    pages = []
+    for p in iter_pages(path, laparams):
+        if key: pages.append(p)
+        yield p
+    if key:
+        _write_cache(cache_dir, key, pages)
+
+def pdf_to_pages(path, laparams=None, cache_dir=None):
     title = os.path.basename(path)
-    return {"title": title, "pages": pages}
-
-def extract_all(raw_dir: str):
-    results = []
-    for fname in sorted(os.listdir(raw_dir)):
-        if not fname.lower().endswith(".pdf"):
-            continue
-        full = os.path.join(raw_dir, fname)
-        doc = pdf_to_pages(full)
-        results.append({"pdf_id": os.path.splitext(fname)[0], **doc})
-        print(f"[INFO] Extracted {len(doc['pages'])} pages from {fname}")
-    return results
+    with stage("ingest.pdf_to_text", unit="pages", pdf=title) as st:
+        key = cache_key(path, laparams) if cache_dir else None
+        pages = _read_cache(cache_dir, key) if key else None
+        cached = st.meta["cached"] = pages is not None
+        if pages is None:
+            pages = list(iter_pages(path, laparams))
+            if key:
+                _write_cache(cache_dir, key, pages)
+        st.add(len(pages))
+    return {"title": title, "pages": pages, "cached": cached}
+
+def _extract_one(args):
+    full, cache_dir = args
+    return pdf_to_pages(full, cache_dir=cache_dir)
+
+def list_pdfs(raw_dir: str):
+    return [f for f in sorted(os.listdir(raw_dir)) if f.lower().endswith(".pdf")]
+
+def _bounded_map(fn, items, workers):
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        pending = deque()
+        for item in items:
+            pending.append(ex.submit(fn, item))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def iter_extract(raw_dir: str, workers=1, cache_dir=None):
+    # Yields documents in filename order; at most 2 * workers PDFs are held at once.
+    fnames = list_pdfs(raw_dir)
+    jobs = [(os.path.join(raw_dir, f), cache_dir) for f in fnames]
+    workers = min(int(workers or os.cpu_count() or 1), max(1, len(jobs)))
+    docs = _bounded_map(_extract_one, jobs, workers) if workers > 1 else map(_extract_one, jobs)
+    for fname, doc in zip(fnames, docs):
+        cached = doc.pop("cached")
+        print(f"[INFO] Extracted {len(doc['pages'])} pages from {fname}" + (" (cached)" if cached else ""))
+        yield {"pdf_id": os.path.splitext(fname)[0], **doc}
+
+def extract_all(raw_dir: str, workers=1, cache_dir=None):
+    return list(iter_extract(raw_dir, workers=workers, cache_dir=cache_dir))
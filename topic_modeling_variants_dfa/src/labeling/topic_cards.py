@@ -1,35 +1,62 @@
-import os, json
+import os, csv, glob
 from ..utils.io import read_yaml
+from ..models.topic_table import TopicTable
 
-def _write_card(dirpath, model_name, idx, terms):
+# One card per topic of each model's best run, from the topic table (src/models/topic_table.py)
+# and the per-topic metrics of the evaluation engine (evaluation/topic_metrics.csv).
+
+def _fmt(v, nd=3):
+    try:
+        return f"{float(v):.{nd}f}"
+    except (TypeError, ValueError):
+        return "n/a"
+
+def _write_card(dirpath, model_name, idx, terms, weights=None, metrics=None):
     os.makedirs(dirpath, exist_ok=True)
     path = os.path.join(dirpath, f"topic_{idx:02d}.md")
+    metrics = metrics or {}
     with open(path, "w", encoding="utf-8") as f:
         f.write(f"# {model_name.upper()} — Topic {idx}\n\n")
+        if metrics.get("run_id"):
+            f.write(f"Run: {metrics['run_id']}\n\n")
         f.write("Top terms:\n\n")
-        for t in terms:
-            f.write(f"- {t}\n")
+        for t, w in zip(terms, weights or [None] * len(terms)):
+            f.write(f"- {t}" + (f" ({_fmt(w)})" if w is not None and w == w else "") + "\n")
+        if metrics:
+            f.write(f"\nCoherence: c_v {_fmt(metrics.get('coherence_c_v'))}, "
+                    f"npmi {_fmt(metrics.get('coherence_npmi'))}, umass {_fmt(metrics.get('coherence_umass'))}\n")
+            if metrics.get("seed_set"):
+                f.write(f"\nSeed set: {metrics['seed_set']} ({metrics.get('seed_overlap', 0)} terms)\n")
+            if metrics.get("closest"):
+                f.write("\nClosest topics in other models:\n\n")
+                for item in metrics["closest"].split(";"):
+                    m, t, j = item.split(":")
+                    f.write(f"- {m} topic {t} (Jaccard {j})\n")
     return path
 
-def main():
-    base = read_yaml("configs/base.yaml")
-    reports = os.path.join(base["paths"]["reports_dir"], "topic_cards")
-    nmf = os.path.join(base["paths"]["models_dir"], "nmf", "best_terms.json")
-    if os.path.exists(nmf):
-        data = json.load(open(nmf,"r",encoding="utf-8"))
-        for i, terms in enumerate(data.get("terms", [])):
-            _write_card(os.path.join(reports,"nmf"), "nmf", i, terms)
-    corex = os.path.join(base["paths"]["models_dir"], "corex", "topics.json")
-    if os.path.exists(corex):
-        data = json.load(open(corex,"r",encoding="utf-8"))
-        for row in data:
-            _write_card(os.path.join(reports,"corex"), "corex", row["topic"], row["terms"])
-    bt = os.path.join(base["paths"]["models_dir"], "bertopic", "topics.json")
-    if os.path.exists(bt):
-        data = json.load(open(bt,"r",encoding="utf-8"))
-        for row in data:
-            _write_card(os.path.join(reports,"bertopic"), "bertopic", row["topic"], row["terms"])
-    print("Cards written to reports/topic_cards/*")
+def write_cards(table, topic_rows, reports_dir):
+    # topic_rows: dicts as written to evaluation/topic_metrics.csv (best runs are used)
+    metrics = {(r["model"], int(r["topic"])): r for r in topic_rows if int(r["best"])}
+    n = 0
+    for model, run in sorted(table.best_runs().items()):
+        d = os.path.join(reports_dir, model)
+        for old in glob.glob(os.path.join(d, "topic_*.md")):  # cards of a previous, larger run
+            os.remove(old)
+        for topic, terms, weights in table.topics(run):
+            _write_card(d, model, topic, terms, weights, metrics.get((model, topic)))
+            n += 1
+    print(f"Cards written to {reports_dir}/* ({n} topics)")
+    return n
+
+def main(base_cfg="configs/base.yaml"):
+    base = read_yaml(base_cfg)
+    table = TopicTable.load(base["paths"]["models_dir"])
+    p = os.path.join(base["paths"]["evaluation_dir"], "topic_metrics.csv")
+    rows = []
+    if os.path.exists(p):
+        with open(p, "r", encoding="utf-8", newline="") as f:
+            rows = list(csv.DictReader(f))
+    write_cards(table, rows, os.path.join(base["paths"]["reports_dir"], "topic_cards"))
 
 if __name__ == "__main__":
     main()
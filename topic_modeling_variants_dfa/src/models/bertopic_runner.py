@@ -1,31 +1,75 @@
 import os, json
 from ..utils.io import read_yaml, read_jsonl
+from ..features.store import processed_corpus
+from ..preprocess.token_store import TokenStore
+from ..utils.perf import stage
+from ..utils.deps import missing
+from .topic_table import write_part
+from ..features.embeddings import embed_documents
+
+DEPS = ("bertopic", "sentence_transformers", "umap", "hdbscan")
+
+def _cluster_models(cfg, seed):
+    # honour the umap / hdbscan blocks of bertopic.yaml (BERTopic's own defaults otherwise)
+    from umap import UMAP
+    from hdbscan import HDBSCAN
+    umap_model = hdbscan_model = None
+    if cfg.get("umap"):
+        u = cfg["umap"]
+        umap_model = UMAP(n_neighbors=int(u.get("n_neighbors", 15)), n_components=int(u.get("n_components", 5)),
+                          min_dist=float(u.get("min_dist", 0.0)), metric=u.get("metric", "cosine"),
+                          random_state=seed)
+    if cfg.get("hdbscan"):
+        h = cfg["hdbscan"]
+        hdbscan_model = HDBSCAN(min_cluster_size=int(h.get("min_cluster_size", cfg.get("min_topic_size", 10))),
+                                min_samples=h.get("min_samples"), metric=h.get("metric", "euclidean"),
+                                cluster_selection_method=h.get("cluster_selection_method", "eom"),
+                                prediction_data=True)
+    return umap_model, hdbscan_model
 
 def run(cfg_path="configs/bertopic.yaml", base_cfg="configs/base.yaml"):
-    try:
-        from bertopic import BERTopic
-        from sentence_transformers import SentenceTransformer  # ensure present
-        import umap, hdbscan  # noqa
-    except Exception:
-        print("[INFO] BERTopic deps not installed — skipping BERTopic.")
+    gone = missing(*DEPS)
+    if gone:
+        print(f"[INFO] BERTopic deps not installed ({', '.join(gone)}) — skipping BERTopic.")
         return None
+    from bertopic import BERTopic
 
     base = read_yaml(base_cfg); cfg = read_yaml(cfg_path)
-    proc_path = os.path.join(base["paths"]["processed_dir"], "chunks_tokens.jsonl")
+    proc_path = processed_corpus(base["paths"])
     if not os.path.exists(proc_path):
         print("[WARN] Missing processed chunks. Run scripts/02_preprocess.sh first.")
         return None
 
-    records = list(read_jsonl(proc_path))
-    docs = [" ".join(r.get("tokens", [])) for r in records]
+    if os.path.isdir(proc_path):
+        docs = list(TokenStore(proc_path).joined())
+    else:
+        docs = [" ".join(r.get("tokens", [])) for r in read_jsonl(proc_path)]
+
+    # Embeddings come from the on-disk cache (keyed by document text + model), so changing only
+    # clustering settings never re-encodes or even loads the encoder. BERTopic gets the encoder only
+    # when one was loaded; inference encodes new text itself otherwise.
+    model_name = cfg.get("embedding_model","sentence-transformers/all-MiniLM-L6-v2")
+    with stage("bertopic.embed", unit="docs", model=model_name) as st:
+        embeddings, encoder = embed_documents(
+            docs, model_name, cfg.get("embedding_cache_dir", "data/embeddings"),
+            batch_size=int(cfg.get("embedding_batch_size", 64)), dtype=cfg.get("embedding_dtype", "float32"),
+            device=cfg.get("embedding_device", "cpu"),
+            local_files_only=bool(cfg.get("embedding_local_files_only", False)),
+        )
+        st.add(len(docs))
+    umap_model, hdbscan_model = _cluster_models(cfg, base["random_seed"])
 
     topic_model = BERTopic(
-        embedding_model=cfg.get("embedding_model","sentence-transformers/all-MiniLM-L6-v2"),
+        embedding_model=encoder,
+        umap_model=umap_model,
+        hdbscan_model=hdbscan_model,
         min_topic_size=int(cfg.get("min_topic_size",3)),
         nr_topics=cfg.get("nr_topics","auto"),
         top_n_words=int(cfg.get("top_n_words",15)),
     )
-    topics, _ = topic_model.fit_transform(docs)
+    with stage("bertopic.fit", unit="docs") as st:
+        topics, _ = topic_model.fit_transform(docs, embeddings=embeddings)
+        st.add(len(docs), topics=len(set(topics) - {-1}))
 
     out_dir = os.path.join(base["paths"]["models_dir"], "bertopic")
     os.makedirs(out_dir, exist_ok=True)
@@ -35,11 +79,15 @@ def run(cfg_path="configs/bertopic.yaml", base_cfg="configs/base.yaml"):
     topic_model.save(model_path)
 
     # Export top terms
-    info = []
+    info, rows = [], []
     for tid in sorted(set(t for t in topics if t != -1)):
-        terms = [w for w,_ in topic_model.get_topic(tid)]
-        info.append({"topic": int(tid), "terms": terms})
+        pairs = topic_model.get_topic(tid)
+        info.append({"topic": int(tid), "terms": [w for w, _ in pairs]})
+        rows.append({**info[-1], "weights": [float(v) for _, v in pairs]})
     json.dump(info, open(os.path.join(out_dir, "topics.json"),"w",encoding="utf-8"), indent=2)
+    write_part(base["paths"]["models_dir"], "bertopic", "bertopic",
+               [{"run_id": f"mts{int(cfg.get('min_topic_size', 3))}-nr{cfg.get('nr_topics', 'auto')}", "best": True,
+                 "k": len(rows), "model_name": model_name, "topics": rows}])
 
     print("BERTopic written to", out_dir)
     return out_dir
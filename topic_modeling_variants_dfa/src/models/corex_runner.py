@@ -1,9 +1,14 @@
-import os, json
+import os, json, time, argparse, itertools
 import numpy as np
+import joblib
+from joblib import delayed
 from scipy.sparse import csr_matrix
-from ..utils.io import read_yaml, read_jsonl
-from ..features.tfidf import build_tfidf_strs
+from ..utils.io import read_yaml
+from ..utils.perf import stage, cpu_budget, process_pool
+from ..features.store import load_or_build_tfidf, processed_corpus
 from ..features.seeds import load_seeds
+from ..features.vocab_index import VocabIndex
+from .topic_table import write_part
 
 def _get_corex():
     try:
@@ -16,54 +21,142 @@ def _get_corex():
         except Exception:
             return None
 
-def run(cfg_path="configs/corex.yaml", base_cfg="configs/base.yaml"):
-    Corex = _get_corex()
-    if Corex is None:
-        print("[INFO] CorEx not available — skipping.")
-        return None
-
-    base = read_yaml(base_cfg); cfg = read_yaml(cfg_path)
-    proc_path = os.path.join(base["paths"]["processed_dir"], "chunks_tokens.jsonl")
+def _prepare(base, cfg):
+    proc_path = processed_corpus(base["paths"])
     if not os.path.exists(proc_path):
         raise FileNotFoundError("Run scripts/02_preprocess.sh first.")
-    records = list(read_jsonl(proc_path))
-    X, vocab, _ = build_tfidf_strs(
-        records,
-        ngram=(base["tfidf"]["ngram_min"], base["tfidf"]["ngram_max"]),
-        min_df=base["tfidf"]["min_df"],
-        max_df=base["tfidf"]["max_df"],
-    )
+    X, vocab, vec = load_or_build_tfidf(base, proc_path, with_vectorizer=True)
 
     # CorEx expects binary, sparse input; binarize TF-IDF and keep CSR
     X_bin = csr_matrix((X > 0).astype(np.int8))
 
-    seeds = load_seeds(cfg.get("anchors_file","configs/seeds.yaml"))
-    anchors = []
-    for _, terms in seeds.items():
-        idxs = [i for i, v in enumerate(vocab) if v in terms]
-        if idxs: anchors.append(idxs)
+    extra = base["language"].get("extra_stopwords", []) or base["text_cleaning"].get("extra_stopwords", [])
+    index = VocabIndex(vocab, vec, extra_stop=extra)
+    groups, missing = index.resolve(load_seeds(cfg.get("anchors_file", "configs/seeds.yaml")))
+    if missing:
+        where = "among the hashing store's tracked terms" if index.term_columns else "in the TF-IDF vocabulary"
+        print(f"[INFO] {len(missing)} seed terms not {where}: {', '.join(map(str, missing[:20]))}")
+    return X_bin, vocab, vec, groups
 
-    model = Corex(n_hidden=int(cfg.get("n_topics",5)), seed=base["random_seed"])
-    if cfg.get("use_anchors", True) and anchors:
-        model.fit(X_bin, words=vocab, anchors=anchors, anchor_strength=float(cfg.get("anchor_strength",2.0)))
+def _fit(Corex, X_bin, n_topics, anchors, anchor_strength, seed, words=None):
+    model = Corex(n_hidden=int(n_topics), seed=seed)
+    if anchors:
+        model.fit(X_bin, words=words, anchors=anchors, anchor_strength=float(anchor_strength))
     else:
-        model.fit(X_bin, words=vocab)
+        model.fit(X_bin, words=words)
+    return model
 
-    topics = []
+def _sweep_fit(X_bin, n_topics, anchor_strength, anchors, seed, topn):
+    t0 = time.perf_counter()
+    model = _fit(_get_corex(), X_bin, n_topics, anchors, anchor_strength, seed)
+    # without words, get_topics gives (column, mutual information, sign) tuples
+    raw = model.get_topics(n_words=topn)
+    topics = [[int(w[0]) for w in t] for t in raw]
+    return {"tc": float(model.tc), "tcs": [float(v) for v in model.tcs], "topics": topics,
+            "weights": [[float(w[1]) for w in t] for t in raw], "seconds": time.perf_counter() - t0}
+
+def _seed_subsets(spec, groups):
+    # "all" | "none" | "leave_one_out" | [group, ...] -> [(name, [group, ...])]
+    out = []
+    for s in spec or ["all"]:
+        if s == "all":
+            out.append(("all", list(groups)))
+        elif s == "none":
+            out.append(("none", []))
+        elif s == "leave_one_out":
+            out.extend((f"-{g}", [h for h in groups if h != g]) for g in groups)
+        else:
+            out.append(("+".join(s), [g for g in s if g in groups]))
+    return out
+
+def sweep(cfg_path="configs/corex.yaml", base_cfg="configs/base.yaml"):
+    # CorEx over n_topics x anchor_strength x seed subsets in worker processes; reports total
+    # correlation (TC) and per-topic TC for each fit into models/corex/sweep_results.json
+    if _get_corex() is None:
+        print("[INFO] CorEx not available — skipping.")
+        return None
+    base = read_yaml(base_cfg); cfg = read_yaml(cfg_path)
+    sw = cfg.get("sweep", {}) or {}
+    X_bin, vocab, _, groups = _prepare(base, cfg)
+    grid = list(itertools.product([int(k) for k in sw.get("n_topics", [cfg.get("n_topics", 5)])],
+                                  [float(a) for a in sw.get("anchor_strength", [cfg.get("anchor_strength", 2.0)])],
+                                  _seed_subsets(sw.get("seed_subsets"), groups)))
+    topn = int(sw.get("top_n", 10))
+    n_jobs = int(sw.get("n_jobs", 0)) or cpu_budget()
+    with stage("corex.sweep", unit="fits", shape=list(X_bin.shape)) as st:
+        fits = process_pool(n_jobs, len(grid))(
+            delayed(_sweep_fit)(X_bin, k, a, [groups[g] for g in sub if groups[g]], base["random_seed"], topn)
+            for k, a, (_, sub) in grid)
+        st.add(len(fits), topics=sum(k for k, _, _ in grid))
+    results = []
+    for (k, a, (name, _)), f in zip(grid, fits):
+        results.append({"n_topics": k, "anchor_strength": a, "seeds": name, "tc": f["tc"], "tcs": f["tcs"],
+                        "seconds": round(f["seconds"], 4),
+                        "terms": [[str(vocab[i]) for i in t] for t in f["topics"]]})
+    out_dir = os.path.join(base["paths"]["models_dir"], "corex")
+    os.makedirs(out_dir, exist_ok=True)
+    out = os.path.join(out_dir, "sweep_results.json")
+    json.dump(results, open(out, "w", encoding="utf-8"), indent=2)
+    write_part(base["paths"]["models_dir"], "corex_sweep", "corex", [
+        {"run_id": f"k{r['n_topics']}-a{r['anchor_strength']:g}-{r['seeds']}", "k": r["n_topics"],
+         "anchor_strength": r["anchor_strength"], "seeds": r["seeds"], "tc": r["tc"],
+         "topics": [{"topic": i, "terms": terms, "weights": w} for i, (terms, w) in enumerate(zip(r["terms"], f["weights"]))]}
+        for r, f in zip(results, fits)])
+    print(f"{'n_topics':>8} {'anchor':>6}  {'seeds':<24} {'TC':>8}  per-topic TC")
+    for r in sorted(results, key=lambda r: -r["tc"]):
+        print(f"{r['n_topics']:>8} {r['anchor_strength']:>6.2f}  {r['seeds']:<24} {r['tc']:>8.3f}  "
+              + " ".join(f"{v:.2f}" for v in r["tcs"]))
+    print("CorEx sweep written to", out)
+    return out
+
+def run(cfg_path="configs/corex.yaml", base_cfg="configs/base.yaml"):
+    Corex = _get_corex()
+    if Corex is None:
+        print("[INFO] CorEx not available — skipping.")
+        return None
+
+    base = read_yaml(base_cfg); cfg = read_yaml(cfg_path)
+    X_bin, vocab, vec, groups = _prepare(base, cfg)
+    anchors = [ids for ids in groups.values() if ids] if cfg.get("use_anchors", True) else []
+
+    with stage("corex.fit", unit="docs", shape=list(X_bin.shape)) as st:
+        model = _fit(Corex, X_bin, cfg.get("n_topics", 5), anchors, cfg.get("anchor_strength", 2.0),
+                     base["random_seed"], words=vocab)
+        st.add(X_bin.shape[0], topics=int(cfg.get("n_topics",5)))
+
+    topics, weights = [], []
     try:
         for i, t in enumerate(model.get_topics(n_words=15)):
             terms = [w if isinstance(w, str) else w[0] for w in t]
             topics.append({"topic": i, "terms": terms})
+            weights.append([np.nan if isinstance(w, str) else float(w[1]) for w in t])
     except Exception:
         # conservative fallback
         for i in range(int(cfg.get("n_topics",5))):
             topics.append({"topic": i, "terms": []})
+            weights.append([])
 
     out_dir = os.path.join(base["paths"]["models_dir"], "corex")
     os.makedirs(out_dir, exist_ok=True)
     json.dump(topics, open(os.path.join(out_dir, "topics.json"),"w",encoding="utf-8"), indent=2)
+    # fitted vectorizer + CorEx, for src.models.inference (which binarizes like above)
+    joblib.dump({"vectorizer": vec, "model": model}, os.path.join(out_dir, "corex_model.joblib"))
+    k = int(cfg.get("n_topics", 5))
+    write_part(base["paths"]["models_dir"], "corex", "corex", [
+        {"run_id": f"k{k}-a{float(cfg.get('anchor_strength', 2.0)):g}", "best": True, "k": k,
+         "anchor_strength": float(cfg.get("anchor_strength", 2.0)), "tc": float(getattr(model, "tc", np.nan)),
+         "topics": [{**t, "weights": w} for t, w in zip(topics, weights)]}])
     print("CorEx written to", out_dir)
     return out_dir
 
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m src.models.corex_runner")
+    ap.add_argument("--sweep", action="store_true", help="fit the corex.yaml sweep grid and report TC per fit")
+    ap.add_argument("--config", default="configs/corex.yaml")
+    ap.add_argument("--base", default="configs/base.yaml")
+    args = ap.parse_args(argv)
+    (sweep if args.sweep else run)(args.config, args.base)
+    return 0
+
 if __name__ == "__main__":
-    run()
+    main()
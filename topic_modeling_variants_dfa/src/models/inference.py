@@ -0,0 +1,204 @@
+import os, sys, json, time, queue, argparse, threading
+import numpy as np
+import joblib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from ..utils.io import read_yaml, batched
+from ..preprocess.clean import process_record, ensure_nltk_data
+
+# Topic inference for new text with the models written by the runners:
+#   models/nmf/nmf_model.joblib, models/corex/corex_model.joblib  ({"vectorizer", "model"})
+#   models/bertopic/bertopic_model.pkl
+# Models are loaded once; transform(texts) cleans with preprocess.clean (same tokens as training)
+# and scores a whole batch per model call. `serve` wraps it in a local HTTP endpoint that merges
+# concurrent requests into micro-batches.
+
+MODELS = ("nmf", "corex", "bertopic")
+
+def _load_bundle(path, name):
+    if not os.path.exists(path):
+        return None
+    try:
+        return joblib.load(path)
+    except ImportError:
+        print(f"[INFO] {name} model found but its package is not installed — skipping.")
+        return None
+
+def _assign(scores):
+    scores = np.asarray(scores, dtype=float).ravel()
+    topic = int(scores.argmax()) if scores.size and scores.max() > 0 else -1
+    return {"topic": topic, "scores": [round(float(s), 6) for s in scores]}
+
+class TopicInference:
+    def __init__(self, base_cfg="configs/base.yaml", models=MODELS):
+        base = read_yaml(base_cfg)
+        models_dir = base["paths"]["models_dir"]
+        self.extra = base["language"].get("extra_stopwords", []) or base["text_cleaning"].get("extra_stopwords", [])
+        ensure_nltk_data()
+        self.nmf = self.corex = self.bertopic = self.encoder = None
+        if "nmf" in models:
+            self.nmf = _load_bundle(os.path.join(models_dir, "nmf", "nmf_model.joblib"), "NMF")
+        if "corex" in models:
+            self.corex = _load_bundle(os.path.join(models_dir, "corex", "corex_model.joblib"), "CorEx")
+        bt_path = os.path.join(models_dir, "bertopic", "bertopic_model.pkl")
+        if "bertopic" in models and os.path.exists(bt_path):
+            try:
+                from bertopic import BERTopic
+                self.bertopic = BERTopic.load(bt_path)
+                if getattr(self.bertopic, "embedding_model", None) is None:
+                    # fitted on cached embeddings only: encode new text with the configured model
+                    from ..features.embeddings import load_encoder
+                    cfg = read_yaml("configs/bertopic.yaml")
+                    self.encoder = load_encoder(cfg.get("embedding_model", "sentence-transformers/all-MiniLM-L6-v2"),
+                                                device=cfg.get("embedding_device", "cpu"),
+                                                local_files_only=bool(cfg.get("embedding_local_files_only", False)))
+            except ImportError:
+                print("[INFO] BERTopic model found but deps not installed — skipping.")
+        self.loaded = [m for m in MODELS if getattr(self, m) is not None]
+        if not self.loaded:
+            raise FileNotFoundError(f"No fitted models in {models_dir}. Run scripts/03_run_models.sh first.")
+        print(f"[INFO] Inference models loaded: {', '.join(self.loaded)}")
+
+    def preprocess(self, texts):
+        return [" ".join(process_record({"text": t}, extra_stop=self.extra)["tokens"]) for t in texts]
+
+    def transform(self, texts, batch_size=512):
+        out = []
+        for batch in batched(texts, batch_size):
+            out.extend(self._transform_batch(batch))
+        return out
+
+    def _transform_batch(self, texts):
+        docs = self.preprocess(texts)
+        out = [{} for _ in docs]
+        if self.nmf:
+            nmf = self.nmf["model"]
+            # a collapsed fit (all-zero components) cannot transform; every text gets topic -1
+            W = (nmf.transform(self.nmf["vectorizer"].transform(docs)) if nmf.components_.any()
+                 else np.zeros((len(docs), nmf.n_components_)))
+            for o, w in zip(out, W):
+                o["nmf"] = _assign(w)
+        if self.corex:
+            X_bin = (self.corex["vectorizer"].transform(docs) > 0).astype(np.int8)
+            p = self.corex["model"].predict_proba(X_bin)
+            p = p[0] if isinstance(p, tuple) else p  # corextopic returns (p_y_given_x, log_z)
+            for o, row in zip(out, p):
+                o["corex"] = _assign(row)
+        if self.bertopic:
+            emb = None if self.encoder is None else self.encoder.encode(docs, show_progress_bar=False, convert_to_numpy=True)
+            topics, probs = self.bertopic.transform(docs, embeddings=emb)
+            for i, (o, t) in enumerate(zip(out, topics)):
+                scores = [] if probs is None else [round(float(s), 6) for s in np.atleast_1d(probs[i])]
+                o["bertopic"] = {"topic": int(t), "scores": scores}
+        return out
+
+class MicroBatcher:
+    # Collects requests for up to max_wait_ms (or until max_batch texts are queued) and runs them
+    # through fn as one batch on a single worker thread.
+    def __init__(self, fn, max_batch=64, max_wait_ms=10):
+        self.fn, self.max_batch, self.max_wait = fn, int(max_batch), max_wait_ms / 1000.0
+        self.q = queue.Queue()
+        threading.Thread(target=self._loop, daemon=True).start()
+
+    def submit(self, texts):
+        item = {"texts": list(texts), "done": threading.Event()}
+        self.q.put(item)
+        item["done"].wait()
+        if "error" in item:
+            raise item["error"]
+        return item["result"]
+
+    def _loop(self):
+        while True:
+            batch = [self.q.get()]
+            n = len(batch[0]["texts"])
+            deadline = time.monotonic() + self.max_wait
+            while n < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.q.get(timeout=remaining))
+                except queue.Empty:
+                    break
+                n += len(batch[-1]["texts"])
+            try:
+                results = self.fn([t for it in batch for t in it["texts"]])
+            except Exception as e:
+                for it in batch:
+                    it["error"] = e; it["done"].set()
+                continue
+            i = 0
+            for it in batch:
+                it["result"] = results[i:i + len(it["texts"])]
+                i += len(it["texts"])
+                it["done"].set()
+
+def make_handler(model, batcher):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, code, obj):
+            body = json.dumps(obj).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send(200, {"status": "ok", "models": model.loaded})
+            else:
+                self._send(404, {"error": "not found"})
+
+        def do_POST(self):
+            # body: {"texts": ["...", ...]} or {"text": "..."}
+            if self.path != "/transform":
+                return self._send(404, {"error": "not found"})
+            try:
+                req = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                texts = req["texts"] if "texts" in req else [req["text"]]
+                if not all(isinstance(t, str) for t in texts):
+                    raise ValueError("texts must be strings")
+            except (ValueError, KeyError, TypeError) as e:
+                return self._send(400, {"error": f"bad request: {e}"})
+            try:
+                self._send(200, {"results": batcher.submit(texts)})
+            except Exception as e:
+                self._send(500, {"error": str(e)})
+
+        def log_message(self, fmt, *args):
+            pass
+    return Handler
+
+def serve(base_cfg="configs/base.yaml", host=None, port=None):
+    cfg = read_yaml(base_cfg).get("inference", {}) or {}
+    host = host or cfg.get("host", "127.0.0.1"); port = int(port or cfg.get("port", 8765))
+    model = TopicInference(base_cfg)
+    batcher = MicroBatcher(model.transform, max_batch=cfg.get("max_batch", 64), max_wait_ms=cfg.get("max_wait_ms", 10))
+    httpd = ThreadingHTTPServer((host, port), make_handler(model, batcher))
+    print(f"[INFO] Serving topic inference on http://{host}:{port} (POST /transform, GET /health)")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m src.models.inference")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    t = sub.add_parser("transform", help="tag texts (one per line) and print JSON lines")
+    t.add_argument("input", nargs="?", help="text file, one document per line (default: stdin)")
+    s = sub.add_parser("serve", help="local HTTP endpoint with request micro-batching")
+    s.add_argument("--host"); s.add_argument("--port", type=int)
+    for p in (t, s):
+        p.add_argument("--config", default="configs/base.yaml")
+    args = ap.parse_args(argv)
+    if args.cmd == "serve":
+        return serve(args.config, args.host, args.port)
+    f = open(args.input, "r", encoding="utf-8") if args.input else sys.stdin
+    texts = [line.rstrip("\n") for line in f if line.strip()]
+    for r in TopicInference(args.config).transform(texts):
+        print(json.dumps(r))
+
+if __name__ == "__main__":
+    main()
@@ -1,45 +1,197 @@
-import os, json
-from ..utils.io import read_yaml, read_jsonl
-from ..features.tfidf import build_tfidf_strs
+import os, json, time, itertools, warnings
+import numpy as np
+import joblib
+from joblib import delayed
+from ..utils.io import read_yaml
+from ..utils.perf import stage, cpu_budget, process_pool
+from ..features.store import load_or_build_tfidf, processed_corpus
+from .topic_table import write_part, remove_part
 from sklearn.decomposition import NMF
+from sklearn.exceptions import ConvergenceWarning
 
-def top_terms(H, vocab, topn=15):
-    return [[vocab[idx] for idx in comp.argsort()[-topn:][::-1]] for comp in H]
+def _top(H, topn=15):
+    # per topic: the topn largest columns (descending) and their weights
+    idx = np.argsort(H, axis=1)[:, -topn:][:, ::-1]
+    return idx, np.take_along_axis(H, idx, axis=1)
 
-def _nmf_kwargs(cfg: dict):
-    return dict(
-        init=cfg.get("init", "nndsvda"),
-        max_iter=int(cfg.get("max_iter", 1000)),
-        l1_ratio=float(cfg.get("l1_ratio", 0.5)),
-        alpha_W=float(cfg.get("alpha_W", 0.1)),
-        alpha_H=float(cfg.get("alpha_H", 0.1)),
-    )
+def top_terms(H, vocab, topn=15, top=None):
+    return [[vocab[i] for i in row] for row in (top if top is not None else _top(H, topn)[0])]
+
+def topic_rows(H, vocab, topn=15, top=None, weights=None):
+    # topic table rows: top terms with their H weights (or precomputed top indices / weights)
+    if top is None:
+        top, weights = _top(H, topn)
+    return [{"topic": i, "terms": [str(vocab[j]) for j in row], "weights": weights[i].tolist()}
+            for i, row in enumerate(top)]
+
+def run_name(k, hp):
+    return f"k{k}-aW{hp['alpha_W']:g}-aH{hp['alpha_H']:g}-l1{hp['l1_ratio']:g}"
+
+def _as_list(v):
+    return list(v) if isinstance(v, (list, tuple)) else [v]
+
+def _hp_grid(cfg: dict):
+    # alpha_W / alpha_H / l1_ratio may each be a scalar or a list; the grid is their product
+    grid = itertools.product(_as_list(cfg.get("alpha_W", 0.1)), _as_list(cfg.get("alpha_H", 0.1)),
+                             _as_list(cfg.get("l1_ratio", 0.5)))
+    return [dict(alpha_W=float(a), alpha_H=float(b), l1_ratio=float(l)) for a, b, l in grid]
+
+def _grow(X, W, H, k, seed):
+    # warm start for k from a (k-1)-factor solution: keep the old factors, seed the new
+    # component from the corpus mean term profile (jittered), like nndsvda's fill-in
+    rng = np.random.default_rng(seed + k)
+    h_new = np.asarray(X.mean(axis=0)).ravel() * rng.uniform(0.5, 1.5, X.shape[1])
+    w_new = np.full((W.shape[0], 1), W.mean() if W.size else 1.0)
+    return (np.hstack([W, w_new]).astype(X.dtype, copy=False),
+            np.vstack([H, h_new[None, :]]).astype(X.dtype, copy=False))
+
+def _fit_config(X, k, hp, init, max_iter, seed, W=None, H=None, probe=False):
+    t0 = time.perf_counter()
+    # a collapsed (all-zero) solution cannot seed a custom init; start cold instead
+    custom = W is not None and W.any() and H.any()
+    nmf = NMF(n_components=int(k), random_state=seed, init="custom" if custom else init,
+              max_iter=int(max_iter), **hp)
+    with warnings.catch_warnings():
+        if probe:  # probe fits stop before convergence on purpose
+            warnings.simplefilter("ignore", ConvergenceWarning)
+        W = nmf.fit_transform(X, W=W, H=H) if custom else nmf.fit_transform(X)
+    return {"W": W, "H": nmf.components_, "model": nmf, "err": float(nmf.reconstruction_err_),
+            "w_mass": W.sum(axis=0),  # per topic; 0 = no document uses it (collapsed through W)
+            "n_iter": int(nmf.n_iter_), "seconds": time.perf_counter() - t0}
+
+def _grid_task(X, k, hp, init, iters, seed, W=None, H=None, probe=False, topn=15, keep=False, rank=(), best=None):
+    # One grid fit in a worker. iters: (n,) or, for a config kept after early stopping,
+    # (probe_iter, rest): the deterministic probe is repeated rather than shipped back and forth.
+    # Returns the error and top terms; W / H only when warm start needs them (keep), and the
+    # model only when (*rank, err) beats `best`, the best rank the parent had seen at dispatch.
+    traj, seconds, n_iter = [], 0.0, 0
+    for j, n in enumerate(iters):
+        f = _fit_config(X, k, hp, init, n, seed, W, H, probe=probe or j < len(iters) - 1)
+        W, H = f["W"], f["H"]
+        traj.append(f["err"]); seconds += f["seconds"]; n_iter += f["n_iter"]
+    top, weights = _top(H, topn)
+    out = {"err": f["err"], "n_iter": n_iter, "seconds": seconds, "trajectory": traj, "top": top,
+           "top_weights": weights, "w_mass": f["w_mass"]}
+    if best is not None and (*rank, f["err"]) < best:
+        out["model"] = f["model"]
+    if keep:
+        out["W"], out["H"] = W, H
+    return out
+
+def grid_search(X, cfg: dict, seed=42, n_jobs=None, rank=None, topn=15):
+    # -> one summary per (k, config): err, n_iter, seconds, trajectory, pruned, top / top_weights
+    # (column indices and weights of each topic's topn terms). Only the best fit by
+    # (*rank(k, hp), err) carries its fitted "model"; rank defaults to error alone.
+    ks = list(range(int(cfg["k_min"]), int(cfg["k_max"]) + 1))
+    hps = _hp_grid(cfg)
+    init = cfg.get("init", "nndsvda")
+    max_iter = int(cfg.get("max_iter", 1000))
+    warm = bool(cfg.get("warm_start", False))
+    probe_iter = int(cfg.get("probe_iter", 50))
+    ratio = float(cfg.get("early_stop_ratio", 1.10))
+    # early stopping compares configs at the same k, so it needs more than one per k
+    early = len(hps) > 1 and 0 < probe_iter < max_iter and ratio > 0
+    n_jobs = int(n_jobs if n_jobs is not None else cfg.get("n_jobs", 0)) or cpu_budget()
+    # results stream back as they finish, so the parent holds summaries plus one model
+    par = process_pool(n_jobs, len(hps) if warm else len(ks) * len(hps), return_as="generator")
+    rank = rank or (lambda k, hp: ())
+    best = {"rank": None}
+
+    def final(k, h, WH, iters):
+        # best["rank"] is read when joblib dispatches the task, so later tasks see the current best
+        return delayed(_grid_task)(X, k, hps[h], init, iters, seed, *WH, topn=topn, keep=warm,
+                                   rank=rank(k, hps[h]), best=best["rank"] or (float("inf"),))
+
+    def collect(tasks, results):
+        out = {}
+        for (k, h, _), r in zip(tasks, results):
+            model = r.pop("model", None)
+            key = (*rank(k, hps[h]), r["err"])
+            if model is not None and (best["rank"] is None or key < best["rank"]):
+                best.update(rank=key, kh=(k, h), model=model)
+            out[(k, h)] = r
+        return out
+
+    # without warm starts every k is independent and the whole grid runs as one batch;
+    # with warm starts, k levels run in order and configs within a level run in parallel
+    levels = [[k] for k in ks] if warm else [ks]
+    prev, done = {}, {}
+    for level in levels:
+        tasks = [(k, h, _grow(X, *prev[h], k, seed) if warm and h in prev else (None, None))
+                 for k in level for h in range(len(hps))]
+        if early:
+            probes = par(delayed(_grid_task)(X, k, hps[h], init, (probe_iter,), seed, *WH, probe=True,
+                                             topn=topn, keep=warm) for k, h, WH in tasks)
+            results = {kh: r for kh, r in zip([(k, h) for k, h, _ in tasks], probes)}
+            lowest = {k: min(r["err"] for (kk, _), r in results.items() if kk == k) for k in level}
+            for (k, h), r in results.items():
+                r["pruned"] = r["err"] > ratio * lowest[k]
+            keep = [t for t in tasks if not results[t[:2]]["pruned"]]
+            results.update(collect(keep, par(final(k, h, WH, (probe_iter, max_iter - probe_iter)) for k, h, WH in keep)))
+        else:
+            results = collect(tasks, par(final(k, h, WH, (max_iter,)) for k, h, WH in tasks))
+        for (k, h), r in results.items():
+            r.setdefault("pruned", False)
+            if warm:
+                prev[h] = (r.pop("W"), r.pop("H"))
+            done[(k, h)] = r
+    fits = [{"k": k, **hps[h], **done[(k, h)]} for k in ks for h in range(len(hps))]
+    if "kh" in best:
+        fits[ks.index(best["kh"][0]) * len(hps) + best["kh"][1]]["model"] = best["model"]
+    return fits
 
 def run(cfg_path="configs/nmf.yaml", base_cfg="configs/base.yaml"):
     base = read_yaml(base_cfg); cfg = read_yaml(cfg_path)
-    proc_path = os.path.join(base["paths"]["processed_dir"], "chunks_tokens.jsonl")
+    proc_path = processed_corpus(base["paths"])
     if not os.path.exists(proc_path):
         raise FileNotFoundError("Run scripts/02_preprocess.sh first.")
-    records = list(read_jsonl(proc_path))
-    X, vocab, _ = build_tfidf_strs(
-        records,
-        ngram=(base["tfidf"]["ngram_min"], base["tfidf"]["ngram_max"]),
-        min_df=base["tfidf"]["min_df"],
-        max_df=base["tfidf"]["max_df"],
-    )
-    best = None; results = []
-    for k in range(int(cfg["k_min"]), int(cfg["k_max"]) + 1):
-        nmf = NMF(n_components=int(k), random_state=base["random_seed"], **_nmf_kwargs(cfg))
-        W = nmf.fit_transform(X); H = nmf.components_
-        err = float(nmf.reconstruction_err_)
-        terms = top_terms(H, vocab, topn=15)
-        results.append({"k": int(k), "reconstruction_error": err, "terms": terms})
-        if best is None or err < best["reconstruction_error"]:
-            best = {"k": int(k), "reconstruction_error": err, "terms": terms}
+    X, vocab, vec = load_or_build_tfidf(base, proc_path, with_vectorizer=True)
+    # k by lowest reconstruction error (which always favours the largest k), or by topic stability
+    # across bootstrap refits (src/models/stability.py) among configs without collapsed topics,
+    # error breaking ties
+    stab = {}
+    if cfg.get("select_k", "error") == "stability":
+        from .stability import nmf_stability
+        stab = {r["run_id"]: r for r in nmf_stability(base, X, cfg)}
+
+    def rank(k, hp):
+        # configs whose replicates collapse topics lose to any that do not
+        st = stab.get(run_name(k, hp))
+        return (st["collapsed"] > 0, -st["stability"]) if st else (True, float("inf")) if stab else ()
+
+    with stage("nmf.grid_search", unit="fits", shape=list(X.shape)) as st:
+        fits = grid_search(X, cfg, seed=base["random_seed"], rank=rank, topn=15)
+        st.add(len(fits), topics=sum(f["k"] for f in fits), pruned=sum(f["pruned"] for f in fits))
+    best = None; results = []; timing = []; runs = []
+    for f in fits:
+        hp = {"alpha_W": f["alpha_W"], "alpha_H": f["alpha_H"], "l1_ratio": f["l1_ratio"]}
+        timing.append({"k": f["k"], **hp, "seconds": round(f["seconds"], 4), "n_iter": f["n_iter"],
+                       "pruned": f["pruned"], "trajectory": f["trajectory"]})
+        if f["pruned"]:
+            continue
+        err = f["err"]
+        terms = top_terms(None, vocab, top=f["top"])
+        name = run_name(f["k"], hp)
+        st = {c: stab[name][c] for c in ("stability", "agreement", "collapsed")} if name in stab else {}
+        results.append({"k": f["k"], "reconstruction_error": err, **st, "terms": terms, **hp})
+        runs.append({"run_id": name, "k": f["k"], **hp, "reconstruction_error": err, **st,
+                     "topics": topic_rows(None, vocab, top=f["top"], weights=f["top_weights"])})
+        if "model" in f:  # grid_search ships back only the best model
+            best = {"k": f["k"], "terms": terms, "model": f["model"], "run": len(runs) - 1}
     out_dir = os.path.join(base["paths"]["models_dir"], "nmf")
     os.makedirs(out_dir, exist_ok=True)
     json.dump(results, open(os.path.join(out_dir, "grid_results.json"),"w",encoding="utf-8"), indent=2)
+    json.dump(timing, open(os.path.join(out_dir, "grid_timing.json"),"w",encoding="utf-8"), indent=2)
     json.dump({"k": best["k"], "terms": best["terms"]}, open(os.path.join(out_dir, "best_terms.json"),"w",encoding="utf-8"), indent=2)
+    # fitted vectorizer + best NMF, for src.models.inference
+    joblib.dump({"vectorizer": vec, "model": best["model"]}, os.path.join(out_dir, "nmf_model.joblib"))
+    # every grid fit goes to the topic table; a full fit supersedes earlier online versions
+    runs[best["run"]]["best"] = True
+    write_part(base["paths"]["models_dir"], "nmf", "nmf", runs)
+    remove_part(base["paths"]["models_dir"], "nmf_online")
+    if cfg.get("online_state", True):
+        from .online import bootstrap
+        bootstrap(base, X, vec, best["model"], proc_path)
     print("NMF written to", out_dir)
     return out_dir
 
@@ -0,0 +1,301 @@
+import os, sys, json, argparse
+from datetime import datetime, timezone
+from numbers import Integral
+import numpy as np
+import joblib
+from ..utils.io import read_yaml, read_jsonl
+from ..utils.perf import stage
+from .topic_table import write_part
+
+# Incremental NMF between full refits:
+#   python -m src.models.online update [--records new_chunks_tokens.jsonl] [--check]
+#   python -m src.models.online status
+# After every full fit nmf_runner bootstraps models/nmf/online_state.joblib: a MiniBatchNMF started
+# from the best grid-search factors, document frequencies for every analyzer term, and the
+# preprocess fingerprints of the documents it has seen. `update` takes only the documents the
+# pipeline runner preprocessed since (data/processed/docs/<pdf_id>.jsonl), adds their document
+# frequencies (terms reaching min_df join the vocabulary as new columns), recomputes idf and runs
+# partial_fit on their TF-IDF rows — work proportional to the new documents. Topic rows keep their
+# index across updates, and a full refit is matched to the previous state (Hungarian assignment on
+# topic-term cosine) so topic IDs stay stable across versions. Each update appends drift figures to
+# models/nmf/online_history.jsonl and says when a full refit is due.
+# CorEx has no partial fit; it is only refreshed by the full corex stage.
+
+CFG = "configs/online.yaml"
+STATE = "online_state.joblib"
+HISTORY = "online_history.jsonl"
+
+def _now():
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+def _out_dir(base):
+    return os.path.join(base["paths"]["models_dir"], "nmf")
+
+def _doc_limit(v, n):
+    # sklearn's min_df / max_df: an int is a document count, a float a fraction of documents
+    return v if isinstance(v, Integral) else v * n
+
+def rel_err(X, W, H):
+    # ||X - WH||_F / ||X||_F without forming WH
+    xx = float(X.multiply(X).sum())
+    cross = float(np.sum(W * np.asarray(X @ H.T)))
+    quad = float(np.sum((W.T @ W) * (H @ H.T)))
+    return float(np.sqrt(max(xx - 2 * cross + quad, 0.0) / xx)) if xx > 0 else 0.0
+
+def _cosine(A, B):
+    na, nb = np.linalg.norm(A, axis=1), np.linalg.norm(B, axis=1)
+    S = (A @ B.T) / np.maximum(np.outer(na, nb), 1e-12)
+    S[np.outer(na == 0, nb == 0)] = 1.0  # two empty topics are the same topic
+    return S
+
+def _shared_columns(vocab_a, vocab_b):
+    idx = {t: i for i, t in enumerate(vocab_b)}
+    pairs = [(i, idx[t]) for i, t in enumerate(vocab_a) if t in idx]
+    ia, ib = zip(*pairs) if pairs else ((), ())
+    return np.array(ia, dtype=np.int64), np.array(ib, dtype=np.int64)
+
+def match_topics(H_ref, vocab_ref, H_new, vocab_new):
+    # order of H_new's rows that best matches H_ref's (unmatched new topics go last) + matched cosines
+    ia, ib = _shared_columns(vocab_ref, vocab_new)
+    S = _cosine(H_ref[:, ia], H_new[:, ib])
+    from scipy.optimize import linear_sum_assignment
+    rows, cols = linear_sum_assignment(-S)
+    perm = list(cols[np.argsort(rows)]) + [j for j in range(H_new.shape[0]) if j not in set(cols)]
+    return np.array(perm, dtype=np.int64), S[rows, cols][np.argsort(rows)]
+
+def _vectorizer(state):
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    vec = TfidfVectorizer(**{**state["vec_params"], "vocabulary": {t: i for i, t in enumerate(state["vocab"])}})
+    n, df = state["n_docs"], state["df"]
+    idf = np.log((1 + n) / (1 + df)) + 1 if vec.smooth_idf else np.log(n / np.maximum(df, 1)) + 1
+    idf[df > _doc_limit(vec.max_df, n)] = 0.0  # over max_df: kept as a column, weighs nothing
+    vec.idf_ = idf
+    return vec
+
+def load_state(base):
+    p = os.path.join(_out_dir(base), STATE)
+    return joblib.load(p) if os.path.exists(p) else None
+
+def _save_state(base, state):
+    p = os.path.join(_out_dir(base), STATE)
+    joblib.dump(state, p + ".tmp")
+    os.replace(p + ".tmp", p)
+
+def _drop_state(base):
+    # a state left from an earlier fit would republish a model this fit replaced
+    p = os.path.join(_out_dir(base), STATE)
+    if os.path.exists(p):
+        os.remove(p)
+
+def _publish(base, vec, model, state=None):
+    # the bundle src.models.inference loads, plus best_terms.json and the topic table part for evaluate/report
+    from .nmf_runner import top_terms, topic_rows
+    out_dir = _out_dir(base)
+    bundle = {"vectorizer": vec, "model": model}
+    if state is not None:
+        bundle["version"] = state["version"]
+    joblib.dump(bundle, os.path.join(out_dir, "nmf_model.joblib"))
+    vocab = [t for t, _ in sorted(vec.vocabulary_.items(), key=lambda kv: kv[1])]
+    terms = top_terms(model.components_, vocab, topn=15)
+    best = {"k": int(model.components_.shape[0]), "terms": terms}
+    if state is not None:
+        best["version"] = state["version"]
+    json.dump(best, open(os.path.join(out_dir, "best_terms.json"), "w", encoding="utf-8"), indent=2)
+    run_id = f"online-v{state['version']}" if state is not None else f"k{best['k']}-reordered"
+    write_part(base["paths"]["models_dir"], "nmf_online", "nmf",
+               [{"run_id": run_id, "best": True, "k": best["k"], "topics": topic_rows(model.components_, vocab, topn=15)}])
+
+def _doc_fingerprints(base):
+    # per-document preprocess fingerprints recorded by src.pipeline.runner (None without the runner)
+    p = os.path.join(base["paths"].get("pipeline_dir", "data/.pipeline"), "state.json")
+    if not os.path.exists(p):
+        return None
+    with open(p, "r", encoding="utf-8") as f:
+        return json.load(f).get("docs", {}).get("preprocess")
+
+def corpus_docs(proc_path, texts=True):
+    # (joined tokens or None, pdf_id) per row of the processed corpus, in TF-IDF row order
+    if os.path.isdir(proc_path):
+        from ..preprocess.token_store import TokenStore
+        ids = [r.get("pdf_id") for r in read_jsonl(os.path.join(proc_path, "records.jsonl"))]
+        return (list(TokenStore(proc_path).joined()) if texts else None), ids
+    recs = list(read_jsonl(proc_path))
+    return ([" ".join(r.get("tokens", []) or []) for r in recs] if texts else None), [r.get("pdf_id") for r in recs]
+
+def _all_terms_kept(vec, n):
+    # the fitted vocabulary holds every analyzer term: none pruned by min_df, max_df or max_features
+    return _doc_limit(vec.min_df, n) <= 1 and _doc_limit(vec.max_df, n) >= n and vec.max_features is None
+
+def bootstrap(base, X, vec, model, proc_path, cfg_path=CFG):
+    # Called by nmf_runner after a full fit, with the TF-IDF matrix and vectorizer it fitted on.
+    cfg = read_yaml(cfg_path)
+    if not hasattr(vec, "vocabulary_"):
+        print("[INFO] Online NMF updates need tfidf.backend: exact — state not bootstrapped.")
+        return _drop_state(base)
+    H = model.components_
+    if not H.any():
+        print("[WARN] Best NMF solution is all zeros — online updates need a full refit on more data.")
+        return _drop_state(base)
+    vocab = [t for t, _ in sorted(vec.vocabulary_.items(), key=lambda kv: kv[1])]
+    with stage("online.bootstrap", unit="docs") as st:
+        prev = load_state(base)
+        if prev is not None:
+            perm, sims = match_topics(prev["model"].components_, prev["vocab"], H, vocab)
+            if (perm != np.arange(len(perm))).any():
+                model.components_ = H = H[perm]
+                _publish(base, vec, model)
+                print(f"[INFO] Topics reordered to match version {prev['version']} (cosine {np.round(sims, 3).tolist()})")
+        # vocabulary columns: df straight from the TF-IDF matrix; only out-of-vocabulary terms (kept
+        # as pending counts until they reach min_df) need the analyzer, and only if any were pruned
+        n_docs = X.shape[0]
+        df = np.bincount(X.indices[X.data != 0], minlength=X.shape[1]).astype(np.int64)
+        counts = {}
+        docs, pdf_ids = corpus_docs(proc_path, texts=not _all_terms_kept(vec, n_docs))
+        if docs is not None:
+            analyze, index = vec.build_analyzer(), vec.vocabulary_
+            for d in docs:
+                for t in set(analyze(d)):
+                    if t not in index:
+                        counts[t] = counts.get(t, 0) + 1
+            del docs
+        W = model.transform(X)
+        from sklearn.decomposition import MiniBatchNMF
+        mb = MiniBatchNMF(n_components=H.shape[0], init="custom", alpha_W=model.alpha_W, alpha_H=model.alpha_H,
+                          l1_ratio=model.l1_ratio, batch_size=int(cfg.get("batch_size", 256)),
+                          forget_factor=float(cfg.get("forget_factor", 1.0)), random_state=model.random_state)
+        # one step over the whole corpus seeds partial_fit's running sufficient statistics
+        mb.partial_fit(X.astype(X.dtype, copy=True), W=W, H=H.copy())
+        fps = _doc_fingerprints(base) or {}
+        state = {
+            "version": prev["version"] + 1 if prev else 1, "created": _now(), "updated": _now(),
+            "vec_params": {k: v for k, v in vec.get_params().items() if k != "vocabulary"},
+            "vocab": vocab, "df": df, "pending": counts, "n_docs": n_docs, "model": mb,
+            "seen": {p: fps.get(p) for p in dict.fromkeys(pdf_ids)},
+            "ref": {"n_docs": n_docs, "n_terms": len(vocab), "H": H.copy(), "rel_err": rel_err(X, W, H)},
+            "since": {"docs": 0, "mass": 0.0, "new_mass": 0.0},
+        }
+        st.add(n_docs)
+    _save_state(base, state)
+    print(f"[INFO] Online NMF state v{state['version']} bootstrapped ({n_docs} docs, {len(vocab)} terms)")
+    return state
+
+def _new_records(base, state):
+    fps = _doc_fingerprints(base)
+    docs_dir = os.path.join(base["paths"]["processed_dir"], "docs")
+    if fps is None or not os.path.isdir(docs_dir):
+        raise FileNotFoundError("No per-document preprocess state; run `python -m src run preprocess` "
+                                "or pass --records.")
+    seen = state["seen"]
+    new = [p for p in fps if p not in seen]
+    changed = [p for p in fps if p in seen and seen[p] is not None and seen[p] != fps[p]]
+    removed = [p for p in seen if p not in fps]
+    records = [r for p in new for r in read_jsonl(os.path.join(docs_dir, f"{p}.jsonl"))]
+    return records, {p: fps[p] for p in new}, changed, removed
+
+def _grow(mb, n_new):
+    # MiniBatchNMF keeps its running numerator/denominator (H = A / B) privately; new term columns
+    # start at a small positive weight because multiplicative updates never move a zero.
+    # Private attributes: without them (another sklearn) the new columns cannot be added.
+    if not (hasattr(mb, "_components_numerator") and hasattr(mb, "_components_denominator")):
+        import sklearn
+        raise RuntimeError(f"MiniBatchNMF in scikit-learn {sklearn.__version__} has no running numerator/denominator; "
+                           "new terms need a full refit: python -m src run nmf --force")
+    H = mb.components_
+    h0 = float(H.mean()) * 0.1 or np.finfo(H.dtype).eps
+    pad = np.full((H.shape[0], n_new), h0, dtype=H.dtype)
+    mb.components_ = np.hstack([H, pad])
+    mb._components_numerator = np.hstack([mb._components_numerator, pad])
+    mb._components_denominator = np.hstack([mb._components_denominator, np.ones_like(pad)])
+    mb.n_features_in_ = mb.components_.shape[1]
+
+def update(base, cfg, records=None):
+    state = load_state(base)
+    if state is None:
+        raise FileNotFoundError("No online NMF state. Run the nmf stage (scripts/03_run_models.sh) first.")
+    if records is None:
+        records, fps, changed, removed = _new_records(base, state)
+    else:
+        fps, changed, removed = {r.get("pdf_id"): None for r in records}, [], []
+    if not records:
+        print("[INFO] No new documents since the last update.")
+        return None
+    mb, ref, since = state["model"], state["ref"], state["since"]
+    docs = [" ".join(r.get("tokens", []) or []) for r in records]
+    with stage("online.update", unit="docs") as st:
+        vec = _vectorizer(state)
+        analyze = vec.build_analyzer()
+        index = {t: i for i, t in enumerate(state["vocab"])}
+        pending, hits, touched = state["pending"], [], {}
+        for d in docs:
+            for t in set(analyze(d)):
+                i = index.get(t)
+                if i is None:
+                    pending[t] = pending.get(t, 0) + 1; touched[t] = None
+                else:
+                    hits.append(i)
+        np.add.at(state["df"], np.array(hits, dtype=np.int64), 1)
+        n = state["n_docs"] = state["n_docs"] + len(docs)
+        lo, hi = _doc_limit(vec.min_df, n), _doc_limit(vec.max_df, n)
+        added = [t for t in touched if lo <= pending[t] <= hi]
+        if added:
+            state["vocab"].extend(added)
+            state["df"] = np.concatenate([state["df"], np.array([pending.pop(t) for t in added], dtype=np.int64)])
+            _grow(mb, len(added))
+        vec = _vectorizer(state)
+        X = vec.transform(docs)
+        H_before = mb.components_.copy()
+        fit = rel_err(X, mb.transform(X), H_before)  # how well the model explains them before learning them
+        for s in range(0, X.shape[0], int(cfg.get("batch_size", 256))):
+            mb.partial_fit(X[s:s + int(cfg.get("batch_size", 256))])
+        st.add(len(docs), terms=len(added), nnz=int(X.nnz))
+    H, k0 = mb.components_, ref["n_terms"]
+    since["docs"] += len(docs); since["mass"] += float(X.sum()); since["new_mass"] += float(X[:, k0:].sum())
+    state["seen"].update(fps)
+    state["version"] += 1; state["updated"] = _now()
+    rec = {"version": state["version"], "ts": state["updated"], "new_docs": len(docs), "new_terms": len(added),
+           "vocab_size": len(state["vocab"]), "changed_docs": len(changed), "removed_docs": len(removed),
+           "fit_ratio": round(fit / max(ref["rel_err"], 1e-12), 4),
+           "update_shift": round(float(1 - np.diag(_cosine(H_before, H)).min()), 4),
+           "topic_shift": round(float(1 - np.diag(_cosine(ref["H"], H[:, :k0])).min()), 4),
+           "new_term_mass": round(since["new_mass"] / max(since["mass"], 1e-12), 4),
+           "growth": round(since["docs"] / max(ref["n_docs"], 1), 4)}
+    drift = cfg.get("drift", {}) or {}
+    reasons = [m for m in ("fit_ratio", "topic_shift", "new_term_mass", "growth")
+               if m in drift and rec[m] > float(drift[m])]
+    if changed or removed:
+        reasons.append("changed_or_removed_docs")  # their old counts cannot be taken back out
+    rec["refit_recommended"], rec["reasons"] = bool(reasons), reasons
+    _save_state(base, state)
+    _publish(base, vec, mb, state)
+    with open(os.path.join(_out_dir(base), HISTORY), "a", encoding="utf-8") as f:
+        f.write(json.dumps(rec) + "\n")
+    print(f"[INFO] Online NMF v{rec['version']}: +{len(docs)} docs, +{len(added)} terms, fit_ratio={rec['fit_ratio']}, "
+          f"topic_shift={rec['topic_shift']}, new_term_mass={rec['new_term_mass']}, growth={rec['growth']}")
+    if reasons:
+        print(f"[WARN] Full refit recommended ({', '.join(reasons)}): python -m src run nmf corex --force")
+    return rec
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m src.models.online")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    u = sub.add_parser("update", help="partial-fit NMF on documents preprocessed since the last update")
+    u.add_argument("--records", help="tokenized chunks JSONL to add instead of the runner's new documents")
+    u.add_argument("--check", action="store_true", help="exit 2 when a full refit is recommended")
+    sub.add_parser("status", help="print the latest drift record")
+    for p in (u, sub.choices["status"]):
+        p.add_argument("--base", default="configs/base.yaml"); p.add_argument("--config", default=CFG)
+    args = ap.parse_args(argv)
+    base = read_yaml(args.base)
+    if args.cmd == "status":
+        p = os.path.join(_out_dir(base), HISTORY)
+        last = None
+        if os.path.exists(p):
+            for last in read_jsonl(p):
+                pass
+        print(json.dumps(last, indent=2) if last else "No online updates yet.")
+        return 0
+    rec = update(base, read_yaml(args.config), list(read_jsonl(args.records)) if args.records else None)
+    return 2 if args.check and rec and rec["refit_recommended"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,186 @@
+import os, sys, csv, json, hashlib, argparse, itertools
+import numpy as np
+from joblib import delayed
+from scipy.sparse import csr_matrix, diags
+from ..utils.io import read_yaml
+from ..utils.perf import stage, cpu_budget, process_pool
+from ..features.store import load_or_build_tfidf, processed_corpus, store_key
+
+# Topic stability per k:
+#   python -m src stability [nmf] [corex] [--replicates N]
+# Every replicate refits a model on a resampled set of rows of the cached TF-IDF matrix (bootstrap:
+# n rows drawn with replacement; subsample: a fraction without), in a joblib process pool. The
+# topics of every pair of replicates are matched one-to-one (Hungarian assignment on the cosine of
+# their term-weight vectors: NMF's H, CorEx's mutual information); the stability of a k is the mean
+# matched cosine over all pairs, its agreement the mean Jaccard of the matched topics' top terms.
+# A collapsed topic (all-zero H row, or for NMF a W column no document loads on, e.g. W = 0 with H
+# left over from init) is zeroed and matches nothing. Replicates are cached under
+# models/stability/<model>/<config hash>/s<seed>-k<k>.npz, the hash covering the TF-IDF store, the
+# resampling and the fit parameters, so an interrupted run resumes and a larger --replicates only
+# fits the new seeds. nmf.yaml `select_k: stability` uses these scores to pick the NMF k.
+
+CFG = "configs/stability.yaml"
+CACHE_VERSION = 2  # part of the replicate hash; bump when _fit's output changes
+EPS = 1e-10
+COLUMNS = ["model", "run_id", "k", "replicates", "stability", "stability_std", "agreement", "collapsed", "objective"]
+
+def _hash(obj):
+    return hashlib.sha256(json.dumps(obj, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+
+def resample(n, seed, sample="bootstrap", fraction=0.8):
+    rng = np.random.default_rng(seed)
+    if sample == "subsample":
+        return np.sort(rng.choice(n, size=max(1, int(round(fraction * n))), replace=False))
+    return rng.integers(0, n, size=n)
+
+def _fit(model, X, k, params, seed):
+    # (topic x term weights, objective): NMF reconstruction error, CorEx total correlation
+    if model == "nmf":
+        from .nmf_runner import _fit_config
+        hp = {p: params[p] for p in ("alpha_W", "alpha_H", "l1_ratio")}
+        f = _fit_config(X, k, hp, params["init"], params["max_iter"], seed)
+        return np.where((f["w_mass"] > EPS)[:, None], f["H"], 0.0), f["err"]
+    from .corex_runner import _fit as corex_fit, _get_corex
+    m = corex_fit(_get_corex(), X, k, params["anchors"], params["anchor_strength"], seed)
+    H = getattr(m, "mis", None)
+    if H is None:  # builds without the MI matrix: top terms only
+        H = np.zeros((k, X.shape[1]))
+        for i, t in enumerate(m.get_topics(n_words=100)):
+            for w in t:
+                H[i, int(w[0])] = float(w[1])
+    return np.nan_to_num(np.asarray(H, dtype=np.float64)), float(m.tc)
+
+def _replicate(model, X, k, params, seed, sample, fraction, path):
+    H, obj = _fit(model, X[resample(X.shape[0], seed, sample, fraction)], k, params, seed)
+    H = csr_matrix(np.maximum(H, 0), dtype=np.float32)
+    tmp = f"{path[:-len('.npz')]}.{os.getpid()}.tmp.npz"
+    np.savez(tmp, data=H.data, indices=H.indices, indptr=H.indptr, shape=np.array(H.shape), objective=obj)
+    os.replace(tmp, path)
+    return path
+
+def _load(path):
+    with np.load(path) as z:
+        H = csr_matrix((z["data"], z["indices"], z["indptr"]), shape=tuple(z["shape"]))
+        return H, float(z["objective"])
+
+def pair_scores(Hs, top_n=15):
+    # per replicate pair: mean matched cosine, mean top-n Jaccard of the matched topics
+    from scipy.optimize import linear_sum_assignment
+    units, tops = [], []
+    for H in Hs:
+        norm = np.sqrt(np.asarray(H.multiply(H).sum(axis=1)).ravel())
+        units.append(diags(1.0 / np.where(norm > 0, norm, 1.0)) @ H)
+        rows = []
+        for i in range(H.shape[0]):
+            lo, hi = H.indptr[i], H.indptr[i + 1]
+            rows.append(set(H.indices[lo:hi][np.argsort(-H.data[lo:hi])[:top_n]].tolist()))
+        tops.append(rows)
+    cos, jac = [], []
+    for a, b in itertools.combinations(range(len(Hs)), 2):
+        S = (units[a] @ units[b].T).toarray()
+        r, c = linear_sum_assignment(-S)
+        cos.append(float(S[r, c].mean()))
+        jac.append(float(np.mean([len(tops[a][i] & tops[b][j]) / max(1, len(tops[a][i] | tops[b][j]))
+                                  for i, j in zip(r, c)])))
+    return cos, jac
+
+def stability(model, X, specs, base, scfg, data_key, n_jobs=None):
+    # specs: [(run_id, k, params)] -> one row per spec (COLUMNS)
+    reps = max(2, int(scfg.get("replicates", 20)))  # stability needs at least one pair
+    sample = scfg.get("sample", "bootstrap")
+    fraction = float(scfg.get("fraction", 0.8)) if sample == "subsample" else None
+    seeds = [int(base["random_seed"]) + r for r in range(reps)]
+    root = os.path.join(base["paths"]["models_dir"], "stability", model)
+    paths, todo = {}, []
+    for run_id, k, params in specs:
+        key = {"version": CACHE_VERSION, "data": data_key, "model": model, "sample": sample, "fraction": fraction, "params": params}
+        d = os.path.join(root, _hash(key))
+        os.makedirs(d, exist_ok=True)
+        with open(os.path.join(d, "config.json"), "w", encoding="utf-8") as f:
+            json.dump(key, f, indent=2, default=str)
+        for s in seeds:
+            p = paths[(run_id, s)] = os.path.join(d, f"s{s}-k{k}.npz")
+            if not os.path.exists(p):
+                todo.append((k, params, s, p))
+    print(f"[INFO] {model} stability: {len(todo)} replicate fits to run, {len(paths) - len(todo)} cached")
+    n_jobs = int(n_jobs or scfg.get("n_jobs", 0)) or cpu_budget()
+    with stage(f"stability.{model}", unit="fits", shape=list(X.shape), cached=len(paths) - len(todo)) as st:
+        process_pool(n_jobs, len(todo))(
+            delayed(_replicate)(model, X, k, params, s, sample, fraction or 0.0, p) for k, params, s, p in todo)
+        st.add(len(todo))
+    out = []
+    with stage(f"stability.{model}.align", unit="pairs") as st:
+        for run_id, k, _ in specs:
+            Hs, objs = zip(*[_load(paths[(run_id, s)]) for s in seeds])
+            cos, jac = pair_scores(Hs, int(scfg.get("top_n", 15)))
+            out.append({"model": model, "run_id": run_id, "k": k, "replicates": reps,
+                        "stability": float(np.mean(cos)) if cos else float("nan"),
+                        "stability_std": float(np.std(cos)) if cos else float("nan"),
+                        "agreement": float(np.mean(jac)) if jac else float("nan"),
+                        "collapsed": float(np.mean([np.diff(H.indptr) == 0 for H in Hs])),
+                        "objective": float(np.mean(objs))})
+            st.add(len(cos))
+    return out
+
+def _data_key(base):
+    return store_key(processed_corpus(base["paths"]), base["tfidf"])
+
+def nmf_stability(base, X, cfg, scfg=None, n_jobs=None):
+    from .nmf_runner import _hp_grid, run_name
+    scfg = read_yaml(CFG) if scfg is None else scfg
+    ks = [int(k) for k in scfg.get("nmf_k") or range(int(cfg["k_min"]), int(cfg["k_max"]) + 1)]
+    common = {"init": cfg.get("init", "nndsvda"), "max_iter": int(cfg.get("max_iter", 1000))}
+    specs = [(run_name(k, hp), k, {**hp, **common}) for k in ks for hp in _hp_grid(cfg)]
+    return stability("nmf", X, specs, base, scfg, _data_key(base), n_jobs)
+
+def corex_stability(base, cfg, scfg=None, n_jobs=None):
+    from .corex_runner import _get_corex, _prepare
+    if _get_corex() is None:
+        print("[INFO] CorEx not available — skipping.")
+        return []
+    scfg = read_yaml(CFG) if scfg is None else scfg
+    X_bin, _, _, groups = _prepare(base, cfg)
+    anchors = [[int(i) for i in ids] for ids in groups.values() if ids] if cfg.get("use_anchors", True) else []
+    a = float(cfg.get("anchor_strength", 2.0))
+    ks = [int(k) for k in scfg.get("corex_k") or (cfg.get("sweep") or {}).get("n_topics") or [cfg.get("n_topics", 5)]]
+    specs = [(f"k{k}-a{a:g}", k, {"anchors": anchors, "anchor_strength": a}) for k in ks]
+    return stability("corex", X_bin, specs, base, scfg, _data_key(base), n_jobs)
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m src.models.stability",
+                                 description="Bootstrap topic stability per k (replicates cached under models/stability).")
+    ap.add_argument("models", nargs="*", metavar="model", help="nmf | corex (default: stability.yaml models)")
+    ap.add_argument("--replicates", type=int, default=0, help="resampled fits per k (default: stability.yaml)")
+    ap.add_argument("--jobs", type=int, default=0, help="worker processes (default: stability.yaml n_jobs)")
+    ap.add_argument("--config", default=CFG)
+    ap.add_argument("--base", default="configs/base.yaml")
+    args = ap.parse_args(argv)
+    unknown = [m for m in args.models if m not in ("nmf", "corex")]
+    if unknown:
+        ap.error(f"unknown model(s): {', '.join(unknown)}")
+    base, scfg = read_yaml(args.base), read_yaml(args.config)
+    if args.replicates:
+        scfg["replicates"] = args.replicates
+    if not os.path.exists(processed_corpus(base["paths"])):
+        print("Run scripts/02_preprocess.sh first.", file=sys.stderr)
+        return 1
+    rows = []
+    for model in dict.fromkeys(args.models or scfg.get("models", ["nmf", "corex"])):
+        if model == "nmf":
+            X, _, _ = load_or_build_tfidf(base)
+            rows += nmf_stability(base, X, read_yaml("configs/nmf.yaml"), scfg, args.jobs)
+        else:
+            rows += corex_stability(base, read_yaml("configs/corex.yaml"), scfg, args.jobs)
+    out = os.path.join(base["paths"]["evaluation_dir"], "stability.csv")
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=COLUMNS); w.writeheader(); w.writerows(rows)
+    print(f"{'model':<6} {'run':<24} {'k':>3} {'reps':>4} {'stability':>15} {'agreement':>9} {'collapsed':>9} {'objective':>10}")
+    for r in rows:
+        print(f"{r['model']:<6} {r['run_id']:<24} {r['k']:>3} {r['replicates']:>4} {r['stability']:>7.3f} ± {r['stability_std']:<5.3f} "
+              f"{r['agreement']:>9.3f} {r['collapsed']:>9.2f} {r['objective']:>10.4g}")
+    print("Stability written to", out)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
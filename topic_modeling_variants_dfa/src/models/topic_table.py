@@ -0,0 +1,140 @@
+import os, glob, json
+from datetime import datetime, timezone
+import numpy as np
+
+# Columnar topic artifacts written by every runner and read once by the evaluation engine
+# (src/eval/engine.py) and the topic cards. Each writer owns one part, models/topics/<part>.npz,
+# with one row per (run, topic, term rank):
+#   run int32 (into runs) | topic int32 | rank int16 | term int32 (into terms) | weight float32
+# plus the part's term strings and a JSON list of runs ({"model", "run_id", "best", "created",
+# fit parameters...}). Every NMF grid fit is a run, not only the best. Parts are replaced
+# atomically, so runners working in parallel never share a file; TopicTable.load concatenates all
+# parts under one term index. The per-model JSON files (best_terms.json, topics.json) are still
+# written for inference and older tooling; for a model without a part (fitted before the table
+# existed) load reads them in memory, so evaluate/report never write into models/.
+
+TOPICS_DIR = "topics"
+COLUMNS = (("run", np.int32), ("topic", np.int32), ("rank", np.int16), ("term", np.int32), ("weight", np.float32))
+
+def topics_dir(models_dir):
+    return os.path.join(models_dir, TOPICS_DIR)
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+def _columns(model, runs, created):
+    # runs -> (terms, run metadata, columns) of one part
+    index, meta = {}, []
+    cols = {c: [] for c, _ in COLUMNS}
+    for r, run in enumerate(runs):
+        meta.append({"model": model, "best": False, "created": created,
+                     **{k: v for k, v in run.items() if k != "topics"}})
+        for row in run["topics"]:
+            weights = row.get("weights") or [np.nan] * len(row["terms"])
+            for rank, (term, w) in enumerate(zip(row["terms"], weights)):
+                cols["run"].append(r); cols["topic"].append(int(row["topic"])); cols["rank"].append(rank)
+                cols["term"].append(index.setdefault(str(term), len(index))); cols["weight"].append(float(w))
+    return list(index), meta, {c: np.asarray(cols[c], dtype=t) for c, t in COLUMNS}
+
+def write_part(models_dir, part, model, runs):
+    # runs: [{"run_id", "best", <params>..., "topics": [{"topic", "terms", "weights"?}, ...]}]
+    terms, meta, cols = _columns(model, runs, _now())
+    d = topics_dir(models_dir)
+    os.makedirs(d, exist_ok=True)
+    tmp = os.path.join(d, f"{part}.{os.getpid()}.tmp.npz")
+    np.savez(tmp, terms=np.array(terms, dtype=str), runs=np.array(json.dumps(meta, default=str)), **cols)
+    os.replace(tmp, os.path.join(d, f"{part}.npz"))
+    return os.path.join(d, f"{part}.npz")
+
+def remove_part(models_dir, part):
+    p = os.path.join(topics_dir(models_dir), f"{part}.npz")
+    if os.path.exists(p):
+        os.remove(p)
+
+def parts(models_dir):
+    return sorted(p for p in glob.glob(os.path.join(topics_dir(models_dir), "*.npz")) if ".tmp." not in p)
+
+class TopicTable:
+    def __init__(self, runs, terms, **cols):
+        self.runs, self.terms = runs, terms
+        for c, t in COLUMNS:
+            setattr(self, c, np.asarray(cols[c], dtype=t))
+
+    @classmethod
+    def load(cls, models_dir, models=None, legacy=True):
+        # legacy: also read the JSON outputs of models that have no part (in memory, nothing written)
+        runs, index = [], {}
+        cols = {c: [] for c, _ in COLUMNS}
+
+        def add(part, terms, meta, z):
+            keep = [i for i, m in enumerate(meta) if models is None or m["model"] in models]
+            run_map = np.full(len(meta), -1, dtype=np.int64)
+            run_map[keep] = np.arange(len(runs), len(runs) + len(keep))
+            runs.extend({**meta[i], "part": part} for i in keep)
+            term_map = np.array([index.setdefault(t, len(index)) for t in terms] or [0], dtype=np.int64)
+            run = run_map[z["run"]]
+            rows = run >= 0
+            cols["run"].append(run[rows]); cols["term"].append(term_map[z["term"][rows]])
+            for c in ("topic", "rank", "weight"):
+                cols[c].append(z[c][rows])
+
+        have = set()
+        for p in parts(models_dir):
+            with np.load(p, allow_pickle=False) as z:
+                meta = json.loads(str(z["runs"]))
+                have.update(m["model"] for m in meta)
+                add(os.path.basename(p)[:-len(".npz")], z["terms"].tolist(), meta, z)
+        if legacy:
+            for part, model, legacy_runs, created in _legacy_runs(models_dir, have):
+                terms, meta, z = _columns(model, legacy_runs, created)
+                add(part, terms, meta, z)
+        empty = {c: np.zeros(0, dtype=t) for c, t in COLUMNS}
+        return cls(runs, list(index), **{c: np.concatenate(v) if v else empty[c] for c, v in cols.items()})
+
+    def __len__(self):
+        return len(self.run)
+
+    def best_runs(self):
+        # {model: run index}: the most recently written run flagged best
+        best = {}
+        for i, r in enumerate(self.runs):
+            if r.get("best") and (r["model"] not in best or r["created"] >= self.runs[best[r["model"]]]["created"]):
+                best[r["model"]] = i
+        return best
+
+    def topic_rows(self):
+        # (keys, row_topic): keys[j] = (run, topic) of the j-th distinct topic, row_topic maps rows to j
+        if not len(self):
+            return np.zeros((0, 2), dtype=np.int64), np.zeros(0, dtype=np.int64)
+        keys, inv = np.unique(np.stack([self.run.astype(np.int64), self.topic.astype(np.int64)], axis=1),
+                              axis=0, return_inverse=True)
+        return keys, inv.ravel()
+
+    def topics(self, run, top_n=None):
+        # [(topic id, [terms by rank], [weights by rank])] of one run
+        rows = np.flatnonzero(self.run == run)
+        if top_n:
+            rows = rows[self.rank[rows] < top_n]
+        rows = rows[np.lexsort((self.rank[rows], self.topic[rows]))]
+        out = []
+        for t in np.unique(self.topic[rows]):
+            sel = rows[self.topic[rows] == t]
+            out.append((int(t), [self.terms[i] for i in self.term[sel]], self.weight[sel].tolist()))
+        return out
+
+def _legacy_runs(models_dir, have):
+    # (part, model, runs, created) for models that only have the older JSON outputs
+    nmf = os.path.join(models_dir, "nmf", "best_terms.json")
+    files = [("nmf", nmf)] + [(m, os.path.join(models_dir, m, "topics.json")) for m in ("corex", "bertopic")]
+    for model, p in files:
+        if model in have or not os.path.exists(p):
+            continue
+        with open(p, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        created = datetime.fromtimestamp(os.path.getmtime(p), timezone.utc).isoformat()
+        if model == "nmf":
+            runs = [{"run_id": f"k{data.get('k')}", "best": True, "k": data.get("k"),
+                     "topics": [{"topic": i, "terms": t} for i, t in enumerate(data.get("terms", []))]}]
+        else:
+            runs = [{"run_id": model, "best": True, "k": len(data), "topics": data}]
+        yield model, model, runs, created
@@ -0,0 +1,103 @@
+import os, sys, json, glob, time, argparse
+from concurrent.futures import ProcessPoolExecutor
+from ..utils.io import read_yaml
+from ..utils.perf import stage
+
+# Model stage orchestration: nmf, corex and bertopic run side by side, so the stage takes about as
+# long as the slowest runner. The TF-IDF store is built (or validated) once up front; every runner
+# then memory-maps the same .npy CSR arrays and token store read-only (page cache shared, nothing
+# pickled to the workers). Each runner gets a share of `models.cpus`: BLAS/OpenMP/numba threads are
+# capped with threadpoolctl and the *_NUM_THREADS variables, and $TM_CPUS sizes the runner's own
+# joblib pools (nmf grid, corex sweep, stability), whose workers split it (utils/perf.process_pool). Timings and outputs per runner go to models/orchestrate.json.
+
+MODEL_STAGES = ("nmf", "corex", "bertopic")
+TFIDF_STAGES = ("nmf", "corex")
+THREAD_VARS = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "NUMBA_NUM_THREADS")
+
+def budgets(names, cfg, cpus):
+    # {runner: cores}: one each, the rest split by models.weights (largest remainders), so the total
+    # is max(cpus, len(names)); run_models runs at most `cpus` runners at a time
+    weights = {n: float((cfg.get("weights") or {}).get(n, 1)) for n in names}
+    total = sum(weights.values()) or 1.0
+    spare = max(0, int(cpus) - len(names))
+    exact = {n: spare * weights[n] / total for n in names}
+    share = {n: 1 + int(exact[n]) for n in names}
+    left = spare - sum(int(v) for v in exact.values())
+    for n in sorted(names, key=lambda n: int(exact[n]) - exact[n])[:left]:
+        share[n] += 1
+    return share
+
+def prepare(base):
+    # build the shared TF-IDF store before the runners start, so they never race to build it
+    from ..features.store import load_or_build_tfidf, processed_corpus
+    proc = processed_corpus(base["paths"])
+    if not os.path.exists(proc):
+        return None
+    with stage("models.prepare", unit="docs") as st:
+        X, _, _ = load_or_build_tfidf(base, proc)
+        st.add(X.shape[0])
+    return proc
+
+def _run(call, name, base_cfg, doc_state, threads):
+    os.environ["TM_CPUS"] = str(threads)
+    for v in THREAD_VARS:  # read by libraries not loaded yet (torch, numba)
+        os.environ[v] = str(threads)
+    from threadpoolctl import threadpool_limits  # BLAS pools already loaded with numpy
+    t0 = time.perf_counter()
+    with threadpool_limits(limits=threads):
+        r = call(name, base_cfg, doc_state)
+    return {**r, "seconds": time.perf_counter() - t0}
+
+def _artifacts(base, name):
+    d = os.path.join(base["paths"]["models_dir"], name)
+    return sorted(os.path.relpath(p, base["paths"]["models_dir"]) for p in glob.glob(os.path.join(d, "*"))
+                  if os.path.isfile(p))
+
+def run_models(names, base_cfg, doc_states, call, cpus=None):
+    # call(name, base_cfg, doc_state) -> {"ok", "result" | "error"}, as pipeline.runner._call
+    base = read_yaml(base_cfg)
+    cfg = base.get("models", {}) or {}
+    if any(n in TFIDF_STAGES for n in names):
+        try:
+            prepare(base)
+        except Exception as e:  # the runners hit (and report) the same error themselves
+            print(f"[WARN] shared TF-IDF store not built: {e}", file=sys.stderr)
+    cpus = int(cpus or cfg.get("cpus", 0) or os.cpu_count() or 1)
+    threads = budgets(names, cfg, cpus)
+    print("[INFO] model runners: " + ", ".join(f"{n} ({threads[n]} cpu)" for n in names))
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max(1, min(len(names), cpus))) as ex:
+        futs = {n: ex.submit(_run, call, n, base_cfg, doc_states.get(n, {}), threads[n]) for n in names}
+        results = {n: f.result() for n, f in futs.items()}
+    wall = time.perf_counter() - t0
+    summary = {"wall_seconds": round(wall, 3), "cpus": cpus, "runners": {
+        n: {"ok": r["ok"], "skipped": r["ok"] and r.get("result") is None, "threads": threads[n],
+            "seconds": round(r["seconds"], 3), "artifacts": _artifacts(base, n)} for n, r in results.items()}}
+    os.makedirs(base["paths"]["models_dir"], exist_ok=True)
+    with open(os.path.join(base["paths"]["models_dir"], "orchestrate.json"), "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+    slowest = max(r["seconds"] for r in results.values())
+    print(f"[INFO] model stage {wall:.1f}s (slowest runner {slowest:.1f}s, "
+          f"sum {sum(r['seconds'] for r in results.values()):.1f}s)")
+    return results
+
+def main(argv=None):
+    from .runner import _call
+    ap = argparse.ArgumentParser(prog="python -m src.pipeline.models",
+                                 description="Run the model runners concurrently (no fingerprints; see `python -m src run`).")
+    ap.add_argument("runners", nargs="*", metavar="runner", help=f"default: {' '.join(MODEL_STAGES)}")
+    ap.add_argument("--cpus", type=int, default=0, help="cores to split between the runners (default: models.cpus)")
+    ap.add_argument("--config", default="configs/base.yaml")
+    args = ap.parse_args(argv)
+    unknown = [n for n in args.runners if n not in MODEL_STAGES]
+    if unknown:
+        ap.error(f"unknown runner(s): {', '.join(unknown)}")
+    names = list(dict.fromkeys(args.runners)) or list(MODEL_STAGES)
+    results = run_models(names, args.config, {}, _call, cpus=args.cpus or None)
+    for n, r in results.items():
+        if not r["ok"]:
+            print(f"[FAIL] {n}\n{r['error']}", file=sys.stderr)
+    return 0 if all(r["ok"] for r in results.values()) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,352 @@
+import os, sys, json, glob, shutil, hashlib, argparse, traceback
+from itertools import groupby
+from concurrent.futures import ProcessPoolExecutor
+from ..utils.io import read_yaml, read_jsonl, write_jsonl
+from ..utils.perf import stage, configure
+from ..preprocess.token_store import TokenStoreWriter, tee_token_store, store_path
+from .models import MODEL_STAGES, run_models
+
+# Incremental pipeline: ingest -> dedup -> preprocess -> {nmf, corex, bertopic} -> evaluate -> report.
+# Each stage is fingerprinted from the content of its inputs, its config sections and the
+# source of the code it runs; a stage whose fingerprint matches the last successful run (and
+# whose outputs exist) is skipped. Ingest and preprocess fingerprint every PDF separately, so
+# only new or changed documents are re-extracted and re-cleaned. Stages on the same DAG level
+# run in parallel processes (the model runners with split CPU budgets, src/pipeline/models.py),
+# and a failing stage fails the run instead of being masked.
+
+STATE_FILE = "state.json"
+
+def _sha(*parts):
+    h = hashlib.sha256()
+    for p in parts:
+        h.update(p if isinstance(p, bytes) else json.dumps(p, sort_keys=True, default=str).encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+def file_hash(path, bufsize=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(bufsize), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def _src(*rel):
+    return [os.path.join(os.path.dirname(os.path.dirname(__file__)), r) for r in rel]
+
+class Stage:
+    def __init__(self, name, fn, deps=(), base_keys=(), cfg_files=(), code=(), inputs=(), outputs=(), ignore=()):
+        # ignore: "section.key" entries of base_keys that do not change outputs (worker counts, caches)
+        # outputs: globs, or a function of base returning them (outputs that depend on the config)
+        self.name, self.fn, self.deps = name, fn, list(deps)
+        self.base_keys, self.cfg_files, self.ignore = list(base_keys), list(cfg_files), set(ignore)
+        self.code = _src("utils/io.py", *code)
+        self.inputs, self.outputs = list(inputs), outputs if callable(outputs) else list(outputs)
+
+    def code_version(self):
+        return _sha(*[file_hash(p) for p in self.code])
+
+    def _globs(self, patterns, base):
+        # patterns name directories by their base.yaml key, e.g. "{processed_dir}/tokens/ids.i32"
+        return [p.format(**base["paths"]) for p in (patterns(base) if callable(patterns) else patterns)]
+
+    def _config(self, base, key):
+        v = base.get(key)
+        if isinstance(v, dict):
+            v = {k: x for k, x in v.items() if f"{key}.{k}" not in self.ignore}
+        return v
+
+    def fingerprint(self, base):
+        files = sorted({p for pattern in self._globs(self.inputs, base) for p in glob.glob(pattern)})
+        return _sha(
+            {k: self._config(base, k) for k in self.base_keys},
+            {p: read_yaml(p) for p in self.cfg_files if os.path.exists(p)},
+            self.code_version(),
+            {p: file_hash(p) for p in files},
+        )
+
+    def outputs_exist(self, base):
+        return all(glob.glob(p) for p in self._globs(self.outputs, base))
+
+# ---- per-document ingest / preprocess ---------------------------------------------------------
+
+def _doc_paths(base):
+    paths = base["paths"]
+    return os.path.join(paths["interim_dir"], "docs"), os.path.join(paths["processed_dir"], "docs")
+
+def _concat_jsonl(parts, out_path):
+    def recs():
+        for p in parts:
+            yield from read_jsonl(p)
+    return write_jsonl(out_path, recs())
+
+def _ingest_doc(args):
+    from ..ingest.pdf_to_text import pdf_to_pages
+    from ..ingest.filters import chunk_records
+    pdf_path, out_path, chunking, cache_dir = args
+    fname = os.path.basename(pdf_path)
+    doc = {"pdf_id": os.path.splitext(fname)[0], **pdf_to_pages(pdf_path, cache_dir=cache_dir)}
+    doc.pop("cached")
+    n = write_jsonl(out_path, chunk_records(doc, target_tokens=chunking["target_tokens"],
+                                            overlap_tokens=chunking["overlap_tokens"]))
+    print(f"[INFO] Ingested {fname}: {len(doc['pages'])} pages, {n} chunks")
+    return n
+
+def run_ingest(base, doc_state, base_cfg):
+    from ..ingest.pdf_to_text import list_pdfs
+    paths = base["paths"]; ingest = base.get("ingest", {}) or {}
+    interim_docs, _ = _doc_paths(base)
+    version = STAGES["ingest"].code_version()
+    fnames = list_pdfs(paths["raw_dir"])
+    state, todo = {}, []
+    for fname in fnames:
+        pdf_id = os.path.splitext(fname)[0]
+        pdf_path = os.path.join(paths["raw_dir"], fname)
+        out_path = os.path.join(interim_docs, f"{pdf_id}.jsonl")
+        fp = _sha(file_hash(pdf_path), base["chunking"], version)
+        state[pdf_id] = fp
+        if doc_state.get(pdf_id) != fp or not os.path.exists(out_path):
+            todo.append((pdf_path, out_path, base["chunking"], ingest.get("cache_dir")))
+    _remove_stale(interim_docs, state)
+    _map_docs(_ingest_doc, todo, ingest.get("workers", 0))
+    print(f"[INFO] Ingest: {len(todo)} of {len(fnames)} PDFs (re)processed")
+    out = os.path.join(paths["interim_dir"], "chunks.jsonl")
+    n = _concat_jsonl([os.path.join(interim_docs, f"{os.path.splitext(f)[0]}.jsonl") for f in fnames], out)
+    print(f"Wrote {n} chunks to {out}")
+    return state
+
+def run_dedup(base, doc_state, base_cfg):
+    from ..ingest.dedup import dedup_jsonl
+    paths = base["paths"]; cfg = base.get("dedup", {}) or {}
+    if not cfg.get("enabled", False):
+        print("[INFO] Dedup disabled (dedup.enabled: false)")
+        return None
+    src = os.path.join(paths["interim_dir"], "chunks.jsonl")
+    out = os.path.join(paths["interim_dir"], "chunks_dedup.jsonl")
+    stats = dedup_jsonl(src, out, os.path.join(paths["interim_dir"], "dedup_map.jsonl"),
+                        threshold=float(cfg.get("threshold", 0.8)), num_perm=int(cfg.get("num_perm", 128)),
+                        shingle_size=int(cfg.get("shingle_size", 5)), mode=cfg.get("mode", "drop"),
+                        workers=cfg.get("workers", 0), batch_size=int(cfg.get("batch_size", 1024)))
+    # per-document inputs for incremental preprocessing
+    dedup_docs = os.path.join(paths["interim_dir"], "dedup_docs")
+    shutil.rmtree(dedup_docs, ignore_errors=True)
+    for pdf_id, recs in groupby(read_jsonl(out), key=lambda r: r["pdf_id"]):
+        write_jsonl(os.path.join(dedup_docs, f"{pdf_id}.jsonl"), recs)
+    return stats
+
+def _preprocess_doc(args):
+    from ..preprocess.clean import process_records
+    in_path, out_path, extra, pp = args
+    return write_jsonl(out_path, process_records(read_jsonl(in_path), extra_stop=extra, workers=1,
+                                                 lemma_cache_size=pp.get("lemma_cache_size", 200000)))
+
+def run_preprocess(base, doc_state, base_cfg):
+    from ..preprocess.clean import ensure_nltk_data
+    ensure_nltk_data()
+    paths = base["paths"]; pp = base.get("preprocess", {}) or {}
+    interim_docs, processed_docs = _doc_paths(base)
+    source = "chunks.jsonl"
+    if (base.get("dedup", {}) or {}).get("enabled", False):
+        interim_docs, source = os.path.join(paths["interim_dir"], "dedup_docs"), "chunks_dedup.jsonl"
+    version = STAGES["preprocess"].code_version()
+    extra = base["language"].get("extra_stopwords", []) or base["text_cleaning"].get("extra_stopwords", [])
+    ids = [json.loads(line)["pdf_id"] for line in open(os.path.join(paths["interim_dir"], source), encoding="utf-8")]
+    ids = list(dict.fromkeys(ids))
+    state, todo = {}, []
+    for pdf_id in ids:
+        in_path = os.path.join(interim_docs, f"{pdf_id}.jsonl")
+        out_path = os.path.join(processed_docs, f"{pdf_id}.jsonl")
+        fp = _sha(file_hash(in_path), base["language"], base["text_cleaning"], version)
+        state[pdf_id] = fp
+        if doc_state.get(pdf_id) != fp or not os.path.exists(out_path):
+            todo.append((in_path, out_path, extra, pp))
+    _remove_stale(processed_docs, state)
+    _map_docs(_preprocess_doc, todo, pp.get("workers", 0))
+    print(f"[INFO] Preprocess: {len(todo)} of {len(ids)} documents (re)processed")
+    out = os.path.join(paths["processed_dir"], "chunks_tokens.jsonl")
+    recs = (r for i in ids for r in read_jsonl(os.path.join(processed_docs, f"{i}.jsonl")))
+    with TokenStoreWriter(store_path(paths)) as w:
+        recs = tee_token_store(recs, w)
+        if pp.get("export_jsonl", True):
+            n = write_jsonl(out, recs)
+        else:
+            n = sum(1 for _ in recs)
+            if os.path.exists(out): os.remove(out)  # never leave a stale export behind
+    print(f"Saved tokens to {store_path(paths)}" + (f" and {out}" if pp.get("export_jsonl", True) else "") + f" — {n} records")
+    return state
+
+def _remove_stale(doc_dir, state):
+    for p in glob.glob(os.path.join(doc_dir, "*.jsonl")):
+        if os.path.splitext(os.path.basename(p))[0] not in state:
+            os.remove(p)
+
+def _map_docs(fn, todo, workers):
+    workers = min(int(workers or os.cpu_count() or 1), max(1, len(todo)))
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            return list(ex.map(fn, todo))
+    return [fn(t) for t in todo]
+
+# ---- whole-corpus stages -----------------------------------------------------------------------
+
+def run_nmf(base, doc_state, base_cfg):
+    from ..models import nmf_runner
+    return nmf_runner.run(base_cfg=base_cfg)
+
+def run_corex(base, doc_state, base_cfg):
+    from ..models import corex_runner
+    return corex_runner.run(base_cfg=base_cfg)
+
+def run_bertopic(base, doc_state, base_cfg):
+    from ..models import bertopic_runner
+    return bertopic_runner.run(base_cfg=base_cfg)
+
+def run_evaluate(base, doc_state, base_cfg):
+    from ..eval import engine
+    engine.main(cards=False, base_cfg=base_cfg)
+
+def run_report(base, doc_state, base_cfg):
+    from ..labeling import topic_cards
+    topic_cards.main(base_cfg=base_cfg)
+
+# input / output globs, formatted with base.yaml `paths`
+TOKENS = ["{processed_dir}/tokens/vocab.txt", "{processed_dir}/tokens/ids.i32", "{processed_dir}/tokens/offsets.i64"]
+def _preprocess_outputs(base):
+    out = ["{processed_dir}/tokens/meta.json"]
+    if (base.get("preprocess", {}) or {}).get("export_jsonl", True):
+        out.append("{processed_dir}/chunks_tokens.jsonl")
+    return out
+
+MODEL_OUTPUTS = ["{models_dir}/nmf/*.json", "{models_dir}/corex/*.json", "{models_dir}/bertopic/*.json",
+                 "{models_dir}/topics/*.npz"]
+
+STAGES = {s.name: s for s in [
+    Stage("ingest", run_ingest, base_keys=["chunking"], code=["ingest/pdf_to_text.py", "ingest/chunker.py", "ingest/filters.py"],
+          inputs=["{raw_dir}/*.pdf", "{raw_dir}/*.PDF"], outputs=["{interim_dir}/chunks.jsonl"]),
+    Stage("dedup", run_dedup, deps=["ingest"], base_keys=["dedup"], code=["ingest/dedup.py"],
+          inputs=["{interim_dir}/chunks.jsonl"]),
+    Stage("preprocess", run_preprocess, deps=["dedup"], base_keys=["language", "text_cleaning", "dedup", "preprocess"],
+          ignore=["preprocess.workers", "preprocess.batch_size", "preprocess.lemma_cache_size"],
+          code=["preprocess/clean.py", "preprocess/scan.py", "preprocess/token_store.py"],
+          inputs=["{interim_dir}/chunks.jsonl", "{interim_dir}/chunks_dedup.jsonl"],
+          outputs=_preprocess_outputs),
+    Stage("nmf", run_nmf, deps=["preprocess"], base_keys=["tfidf", "random_seed"],
+          cfg_files=["configs/nmf.yaml", "configs/online.yaml", "configs/stability.yaml"],
+          code=["models/nmf_runner.py", "models/online.py", "models/stability.py", "models/topic_table.py",
+                "features/tfidf.py", "features/store.py"], inputs=TOKENS,
+          outputs=["{models_dir}/nmf/best_terms.json"]),
+    Stage("corex", run_corex, deps=["preprocess"], base_keys=["tfidf", "random_seed"],
+          cfg_files=["configs/corex.yaml", "configs/seeds.yaml"],
+          code=["models/corex_runner.py", "models/topic_table.py", "features/tfidf.py", "features/store.py", "features/seeds.py"],
+          inputs=TOKENS, outputs=["{models_dir}/corex/topics.json"]),
+    Stage("bertopic", run_bertopic, deps=["preprocess"], base_keys=["random_seed"], cfg_files=["configs/bertopic.yaml"],
+          code=["models/bertopic_runner.py", "models/topic_table.py", "features/embeddings.py"], inputs=TOKENS,
+          outputs=["{models_dir}/bertopic/topics.json"]),
+    Stage("evaluate", run_evaluate, deps=["nmf", "corex", "bertopic"], base_keys=["evaluate"], cfg_files=["configs/seeds.yaml"],
+          code=["eval/engine.py", "eval/coherence.py", "models/topic_table.py", "features/seeds.py"],
+          inputs=[*TOKENS, *MODEL_OUTPUTS], outputs=["{evaluation_dir}/*.csv"]),
+    Stage("report", run_report, deps=["evaluate"], code=["labeling/topic_cards.py", "models/topic_table.py"],
+          inputs=[*MODEL_OUTPUTS, "{evaluation_dir}/topic_metrics.csv"],
+          outputs=["{reports_dir}/topic_cards"]),
+]}
+
+# ---- scheduler ---------------------------------------------------------------------------------
+
+def _levels(names):
+    done, levels, todo = set(), [], list(names)
+    while todo:
+        ready = [n for n in todo if all(d in done or d not in names for d in STAGES[n].deps)]
+        levels.append(ready)
+        done.update(ready)
+        todo = [n for n in todo if n not in ready]
+    return levels
+
+def _call(name, base_cfg, doc_state):
+    base = read_yaml(base_cfg)
+    try:
+        with stage(f"pipeline.{name}", unit="runs"):
+            return {"ok": True, "result": STAGES[name].fn(base, doc_state, base_cfg)}
+    except Exception:
+        return {"ok": False, "error": traceback.format_exc()}
+
+def _load_state(state_dir):
+    p = os.path.join(state_dir, STATE_FILE)
+    if os.path.exists(p):
+        with open(p, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {"stages": {}, "docs": {}}
+
+def _save_state(state_dir, state):
+    os.makedirs(state_dir, exist_ok=True)
+    p = os.path.join(state_dir, STATE_FILE)
+    with open(p + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(p + ".tmp", p)
+
+def run(stages=None, base_cfg="configs/base.yaml", force=False, jobs=0):
+    base = read_yaml(base_cfg)
+    configure(base["paths"]["evaluation_dir"])
+    state_dir = base["paths"].get("pipeline_dir", "data/.pipeline")
+    state = _load_state(state_dir)
+    names = [n for n in STAGES if not stages or n in stages]
+    failed, blocked = [], set()
+    jobs = int(jobs or os.cpu_count() or 1)
+    for level in _levels(names):
+        todo = []
+        for name in level:
+            if any(d in blocked for d in STAGES[name].deps):
+                blocked.add(name); print(f"[SKIP] {name}: upstream stage failed"); continue
+            fp = STAGES[name].fingerprint(base)
+            if not force and state["stages"].get(name) == fp and STAGES[name].outputs_exist(base):
+                print(f"[SKIP] {name}: up to date"); continue
+            todo.append(name)
+        if len(todo) > 1 and jobs > 1 and all(n in MODEL_STAGES for n in todo):
+            # shared TF-IDF store built once, per-runner CPU budgets (src/pipeline/models.py)
+            results = run_models(todo, base_cfg, {n: state["docs"].get(n, {}) for n in todo}, _call)
+        elif len(todo) > 1 and jobs > 1:
+            with ProcessPoolExecutor(max_workers=min(jobs, len(todo))) as ex:
+                futs = {n: ex.submit(_call, n, base_cfg, state["docs"].get(n, {})) for n in todo}
+                results = {n: f.result() for n, f in futs.items()}
+        else:
+            results = {n: _call(n, base_cfg, state["docs"].get(n, {})) for n in todo}
+        for name in todo:
+            r = results[name]
+            if not r["ok"]:
+                print(f"[FAIL] {name}\n{r['error']}", file=sys.stderr)
+                failed.append(name); blocked.add(name)
+                state["stages"].pop(name, None)
+                continue
+            if name in ("ingest", "preprocess"):
+                state["docs"][name] = r["result"]
+            if r["result"] is None and name in ("corex", "bertopic"):
+                # optional dependency missing: nothing was produced, so try again next run
+                state["stages"].pop(name, None)
+            else:
+                # fingerprint the inputs as they are now (upstream stages may just have rewritten them)
+                state["stages"][name] = STAGES[name].fingerprint(read_yaml(base_cfg))
+            print(f"[DONE] {name}")
+        _save_state(state_dir, state)
+    if failed:
+        print(f"[FAIL] pipeline stages failed: {', '.join(failed)}", file=sys.stderr)
+        return 1
+    return 0
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m src.pipeline.runner",
+                                 description="Run the topic-modeling pipeline incrementally.")
+    ap.add_argument("stages", nargs="*", metavar="stage",
+                    help=f"stages to run (default: all): {', '.join(STAGES)}")
+    ap.add_argument("--force", action="store_true", help="ignore fingerprints and rerun the selected stages")
+    ap.add_argument("--jobs", type=int, default=0, help="parallel stages per DAG level (0 = CPU count)")
+    ap.add_argument("--config", default="configs/base.yaml")
+    ap.add_argument("--profile", metavar="STAGE", help="cProfile matching perf stages, e.g. nmf or pipeline.ingest "
+                    "(comma-separated, 'all'); same as TM_PROFILE")
+    args = ap.parse_args(argv)
+    if args.profile:
+        os.environ["TM_PROFILE"] = args.profile
+    unknown = [s for s in args.stages if s not in STAGES]
+    if unknown:
+        ap.error(f"unknown stage(s): {', '.join(unknown)}")
+    return run(args.stages or None, base_cfg=args.config, force=args.force, jobs=args.jobs)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,61 @@
+import os, json
+from ..utils.io import read_yaml, write_jsonl
+from ..utils.perf import configure
+from ..ingest.pdf_to_text import list_pdfs, iter_doc_pages
+from ..ingest.filters import chunk_records
+from ..preprocess.clean import process_records, ensure_nltk_data
+from ..preprocess.token_store import TokenStoreWriter, tee_token_store, store_path
+
+# PDF -> pages -> chunks -> filters -> tokens -> JSONL, one lazy chain.
+# Peak memory: one document's pages plus the in-flight preprocessing batches and write buffers.
+
+def iter_docs(raw_dir, cache_dir=None):
+    for fname in list_pdfs(raw_dir):
+        yield {"pdf_id": os.path.splitext(fname)[0], "title": fname,
+               "pages": iter_doc_pages(os.path.join(raw_dir, fname), cache_dir=cache_dir)}
+
+def iter_chunk_records(docs, target_tokens=320, overlap_tokens=50):
+    for d in docs:
+        yield from chunk_records(d, target_tokens=target_tokens, overlap_tokens=overlap_tokens)
+
+def _tee_jsonl(records, f):
+    # write the interim (pre-token) record, pass a copy downstream for preprocessing
+    for r in records:
+        f.write(json.dumps(r, ensure_ascii=False) + "\n")
+        yield dict(r)
+
+def run(base_cfg="configs/base.yaml"):
+    base = read_yaml(base_cfg); paths = base["paths"]
+    configure(paths["evaluation_dir"])
+    ingest = base.get("ingest", {}) or {}
+    pp = base.get("preprocess", {}) or {}
+    buffering = int((base.get("stream", {}) or {}).get("buffer_bytes", 1 << 20))
+    extra = base["language"].get("extra_stopwords", []) or base["text_cleaning"].get("extra_stopwords", [])
+    ensure_nltk_data()
+    if (base.get("dedup", {}) or {}).get("enabled", False):
+        # dedup needs every chunk's signature before it can drop any, so it cannot join a one-pass chain
+        print("[WARN] dedup.enabled is ignored in streaming mode; use `python -m src run` to deduplicate")
+
+    chunks_path = os.path.join(paths["interim_dir"], "chunks.jsonl")
+    tokens_path = os.path.join(paths["processed_dir"], "chunks_tokens.jsonl")
+    os.makedirs(paths["interim_dir"], exist_ok=True)
+    records = iter_chunk_records(iter_docs(paths["raw_dir"], cache_dir=ingest.get("cache_dir")),
+                                 target_tokens=base["chunking"]["target_tokens"],
+                                 overlap_tokens=base["chunking"]["overlap_tokens"])
+    with open(chunks_path, "w", encoding="utf-8", buffering=buffering) as cf:
+        processed = process_records(_tee_jsonl(records, cf), extra_stop=extra,
+                                    workers=pp.get("workers", 0),
+                                    batch_size=int(pp.get("batch_size", 256)),
+                                    lemma_cache_size=pp.get("lemma_cache_size", 200000))
+        with TokenStoreWriter(store_path(paths), buffering=buffering) as w:
+            processed = tee_token_store(processed, w)
+            if pp.get("export_jsonl", True):
+                n = write_jsonl(tokens_path, processed, buffering=buffering)
+            else:
+                n = sum(1 for _ in processed)
+                if os.path.exists(tokens_path): os.remove(tokens_path)  # never leave a stale export behind
+    print(f"Streamed {n} chunks to {chunks_path} and {store_path(paths)}")
+    return store_path(paths)
+
+if __name__ == "__main__":
+    run()
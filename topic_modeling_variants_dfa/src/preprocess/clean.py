@@ -1,10 +1,14 @@
-import re, json
-from nltk.corpus import stopwords
-from nltk.stem import WordNetLemmatizer
+import re, json, os, time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from ..utils.io import batched
+from ..utils.perf import timed_iter
+from .scan import URL_RE, EMAIL_RE, ETAL_RE, scan_tokens
 
-lemmatizer = WordNetLemmatizer()
-URL_RE = re.compile(r"(https?://\S+|www\.\S+)")
-EMAIL_RE = re.compile(r"\b[\w\.-]+@[\w\.-]+\.\w+\b")
+LEMMA_CACHE_SIZE = 200_000
+# basic_clean is the reference; process_record tokenizes with scan.scan_tokens, which decides
+# CITATION_RE without its backtracking (scan._citation_end)
 CITATION_RE = re.compile(
     r"\(("
     r"(?:[a-z][a-z\-]+(?:\s*&\s*|\s*,\s*|\s+and\s+))*[a-z][a-z\-]+"
@@ -13,7 +17,6 @@ CITATION_RE = re.compile(
     r"\s*,\s*\d{4}[a-z]?)*"
     r")\)", flags=re.I,
 )
-ETAL_RE = re.compile(r"\b([a-z][a-z\-]+)\s+et\s+al\.?\b", re.I)
 
 def basic_clean(txt: str, lowercase=True, fix_hyphenation=True):
     if lowercase: txt = txt.lower()
@@ -30,18 +33,87 @@ def split_glued_words(token: str):
     parts = re.findall(r"[a-z]+", token)
     return parts if parts else [token]
 
+def ensure_nltk_data():
+    import nltk
+    for pkg in ["stopwords", "wordnet"]:
+        try: nltk.data.find(f"corpora/{pkg}")
+        except LookupError: nltk.download(pkg)
+
+# NLTK is imported on first use, so importing this module (inference, VocabIndex, the CLI) stays cheap
+@lru_cache(maxsize=None)
+def _nltk_stopwords():
+    from nltk.corpus import stopwords
+    return frozenset(stopwords.words("english"))
+
+@lru_cache(maxsize=None)
+def _lemmatizer():
+    from nltk.stem import WordNetLemmatizer
+    return WordNetLemmatizer()
+
+def _lemmatize(word):
+    return _lemmatizer().lemmatize(word)
+
+@lru_cache(maxsize=32)
+def _stopword_set(extra):
+    return _nltk_stopwords() | extra
+
+def stopword_set(extra_stop=None):
+    # built once per distinct extra list (per process), not once per record
+    return _stopword_set(frozenset(extra_stop or []))
+
+# Corpus vocabulary is Zipfian: a bounded memo in front of WordNet absorbs almost every call.
+lemmatize = lru_cache(maxsize=LEMMA_CACHE_SIZE)(_lemmatize)
+
+def set_lemma_cache_size(n):
+    # n words; 0 = no cache, None = unbounded
+    global lemmatize
+    if n is not None and int(n) < 0:
+        raise ValueError(f"lemma_cache_size must be >= 0 or null, got {n}")
+    lemmatize = lru_cache(maxsize=None if n is None else int(n))(_lemmatize)
+
 def process_record(rec, extra_stop=None):
-    sw = set(stopwords.words("english")) | set(extra_stop or [])
-    text = basic_clean(rec["text"])
-    raw_toks = re.findall(r"[a-z][a-z'-]*", text)
-    toks = []
-    for t in raw_toks:
-        toks.extend(split_glued_words(t))
-    kept = []
-    for w in toks:
-        if len(w) <= 2: continue
-        if any(ch.isdigit() for ch in w): continue
-        if w in sw: continue
-        kept.append(WordNetLemmatizer().lemmatize(w))
-    rec["tokens"] = kept
+    sw = stopword_set(extra_stop)
+    # scan_tokens == basic_clean + findall + split_glued_words, letters only (see scan.py)
+    rec["tokens"] = [lemmatize(w) for w in scan_tokens(rec["text"]) if len(w) > 2 and w not in sw]
     return rec
+
+def _init_worker(extra_stop, lemma_cache_size):
+    set_lemma_cache_size(lemma_cache_size)
+    stopword_set(extra_stop)
+
+def _process_batch(args):
+    batch, extra_stop = args
+    return [process_record(r, extra_stop=extra_stop) for r in batch]
+
+def process_records(records, extra_stop=None, workers=1, batch_size=256, lemma_cache_size=LEMMA_CACHE_SIZE):
+    # Order-preserving; at most 2 * workers batches are in flight, so `records` may be a lazy stream.
+    workers = int(workers or os.cpu_count() or 1)
+    return timed_iter(_process_records(records, extra_stop, workers, batch_size, lemma_cache_size),
+                      "preprocess.clean", unit="records", count=lambda r: {"tokens": len(r["tokens"])},
+                      workers=workers)
+
+def _process_records(records, extra_stop, workers, batch_size, lemma_cache_size):
+    extra = tuple(extra_stop or [])
+    t0, n = time.perf_counter(), 0
+    try:
+        if workers <= 1:
+            if lemmatize.cache_info().maxsize != lemma_cache_size:
+                set_lemma_cache_size(lemma_cache_size)
+            for r in records:
+                yield process_record(r, extra_stop=extra)
+                n += 1
+            return
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(extra, lemma_cache_size)) as ex:
+            pending = deque()
+            for batch in batched(records, batch_size):
+                pending.append(ex.submit(_process_batch, (batch, extra)))
+                if len(pending) >= 2 * workers:
+                    for r in pending.popleft().result():
+                        yield r; n += 1
+            while pending:
+                for r in pending.popleft().result():
+                    yield r; n += 1
+    finally:
+        dt = time.perf_counter() - t0
+        print(f"[INFO] Preprocessed {n} records in {dt:.2f}s ({n / dt if dt > 0 else 0.0:.1f} records/sec, workers={workers})")
@@ -0,0 +1,162 @@
+import re, sys, time, argparse
+
+# Tokenizer for preprocess.clean, equal to basic_clean + findall + split_glued_words. basic_clean
+# runs five full-string substitutions and two more passes tokenize; here each substitution is
+# skipped unless a cheap literal test says the text can contain a match (most chunks have no URL,
+# e-mail, citation or "et al."), and the letter runs come out of one findall. CITATION_RE also
+# backtracks exponentially on long author lists that fail near the end ("(a, 2001; b, 2002; ...;
+# p. 5)"); each "(" is checked by _citation_end instead, which decides the same language in a fixed
+# number of linear passes. `python -m src.preprocess.scan check` compares both paths on the
+# ingested chunks, `bench` reports MB/s.
+
+URL_RE = re.compile(r"(https?://\S+|www\.\S+)")
+EMAIL_RE = re.compile(r"\b[\w\.-]+@[\w\.-]+\.\w+\b")
+HYPHEN_RE = re.compile(r"-(?<=\w-)\s+(?=\w)")  # basic_clean's (?<=\w)-\s+(?=\w), literal-first
+ETAL_RE = re.compile(r"\b([a-z][a-z\-]+)\s+et\s+al\.?\b", re.I)
+ETAL_HINT_RE = re.compile(r"\set\s+al")
+WORD_RE = re.compile(r"[a-z]+")
+SEMI_RE = re.compile(r"\s*;\s*")
+YEAR_RE = re.compile(r"\s*\d{4}[a-z]?", re.I)
+# (name sep)* name, where a name is a whole [a-z-] run: what follows a name is never [a-z-]
+AUTHORS_RE = re.compile(r"[a-z][a-z\-]++(?:(?>\s*[&,]\s*|\s+and\s+)[a-z][a-z\-]++)*+", re.I)
+RUN_RE = re.compile(r"[a-z\-]+", re.I)
+LETTER_RE = re.compile(r"[a-z]", re.I)
+NONSPACE_RE = re.compile(r"\S+")
+SEP_TOKEN_RE = re.compile(r"[&,]+|and", re.I)
+
+def _seps(gap):
+    # gap is one or more of \s*&\s* | \s*,\s* | \s+and\s+ : "&"/"," take any whitespace, each
+    # "and" needs a whitespace character of its own on both sides
+    toks = list(NONSPACE_RE.finditer(gap))
+    if not toks:
+        return False
+    prev_and_end = None
+    for m in toks:
+        if not SEP_TOKEN_RE.fullmatch(m.group()):
+            return False
+        if len(m.group()) == 3 and m.group()[0] not in "&,":  # "and"
+            if m.start() == 0 or m.end() == len(gap):
+                return False
+            if prev_and_end is not None and m.start() - prev_and_end < 2:
+                return False
+            prev_and_end = m.end()
+        else:
+            prev_and_end = None
+    return True
+
+def _later_authors(a):
+    # name sep* name (CITATION_RE's form after a ";"): either one run that splits into two names
+    # of two or more characters, or a first and last run joined by separators
+    lead = RUN_RE.match(a)
+    if not lead or not LETTER_RE.match(a) or lead.end() < 2:
+        return False
+    if lead.end() == len(a):
+        return LETTER_RE.search(a, 2, len(a) - 1) is not None
+    tail = RUN_RE.search(a, lead.end())
+    while tail and tail.end() != len(a):
+        tail = RUN_RE.search(a, tail.end())
+    if not tail or tail.end() - tail.start() < 2 or not LETTER_RE.match(a, tail.start()):
+        return False
+    return _seps(a[lead.end():tail.start()])
+
+def _segment(seg, first):
+    # authors \s*,\s* year
+    k = seg.rfind(",")
+    if k < 0 or not YEAR_RE.fullmatch(seg, k + 1):
+        return False
+    a = seg[:k].rstrip()
+    return bool(AUTHORS_RE.fullmatch(a)) if first else _later_authors(a)
+
+def _citation_end(text, i):
+    # end of the CITATION_RE match starting at text[i] == "(", else -1. Nothing inside a citation
+    # is ")", so a match always ends at the first ")".
+    j = text.find(")", i + 1)
+    if j < 0:
+        return -1
+    segs = SEMI_RE.split(text[i + 1:j])
+    if _segment(segs[0], True) and all(_segment(s, False) for s in segs[1:]):
+        return j + 1
+    return -1
+
+def _drop_citations(text):
+    out, pos = [], 0
+    i = text.find("(")
+    while i >= 0:
+        end = _citation_end(text, i)
+        if end > 0:
+            out.append(text[pos:i]); out.append(" ")
+            pos = end
+        i = text.find("(", max(i + 1, pos))
+    if not out:
+        return text
+    out.append(text[pos:])
+    return "".join(out)
+
+def scan_tokens(text):
+    # == [p for t in re.findall(r"[a-z][a-z'-]*", basic_clean(text)) for p in split_glued_words(t)]
+    text = text.lower()
+    if "-" in text:
+        text = HYPHEN_RE.sub("", text)
+    if "http" in text or "www." in text:
+        text = URL_RE.sub(" ", text)
+    if "@" in text:
+        text = EMAIL_RE.sub(" ", text)
+    if "(" in text:
+        text = _drop_citations(text)
+    if ETAL_HINT_RE.search(text):
+        text = ETAL_RE.sub(" ", text)
+    return WORD_RE.findall(text)
+
+def _reference_tokens(text):
+    from .clean import basic_clean, split_glued_words
+    return [p for t in re.findall(r"[a-z][a-z'-]*", basic_clean(text)) for p in split_glued_words(t)]
+
+def check(path):
+    # golden comparison against basic_clean + findall + split_glued_words
+    from ..utils.io import read_jsonl
+    n = bad = 0
+    for rec in read_jsonl(path):
+        n += 1
+        want, got = _reference_tokens(rec["text"]), scan_tokens(rec["text"])
+        if want != got:
+            bad += 1
+            i = next((k for k, (a, b) in enumerate(zip(want, got)) if a != b), min(len(want), len(got)))
+            print(f"[DIFF] {rec.get('pdf_id')} p{rec.get('start_page')}: at token {i}: "
+                  f"{want[max(0, i - 3):i + 3]} vs {got[max(0, i - 3):i + 3]}")
+    print(f"[INFO] {n - bad}/{n} chunks tokenize identically")
+    return bad
+
+def bench(path, repeat=5):
+    from ..utils.io import read_jsonl
+    texts = [r["text"] for r in read_jsonl(path)]
+    mb = sum(len(t.encode("utf-8")) for t in texts) / 1e6
+    rows = {}
+    for name, fn in (("basic_clean", _reference_tokens), ("scan_tokens", scan_tokens)):
+        best = float("inf")
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            for t in texts:
+                fn(t)
+            best = min(best, time.perf_counter() - t0)
+        rows[name] = mb / best
+        print(f"[BENCH] {name:<12} {mb:.2f} MB  {rows[name]:8.1f} MB/s")
+    # reference list that fails at the very end: CITATION_RE backtracks through every split
+    worst = "(anderson, 2001; " + "; ".join(["williamson, 2004"] * 6) + ", p. 5) "
+    for name, fn in (("basic_clean", _reference_tokens), ("scan_tokens", scan_tokens)):
+        t0 = time.perf_counter(); fn(worst)
+        print(f"[BENCH] {name:<12} failing 7-entry citation list: {time.perf_counter() - t0:.4f}s")
+    return rows
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m src.preprocess.scan")
+    ap.add_argument("cmd", choices=["check", "bench"])
+    ap.add_argument("chunks", nargs="?", default="data/interim/chunks.jsonl")
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args(argv)
+    if args.cmd == "check":
+        return 1 if check(args.chunks) else 0
+    bench(args.chunks, args.repeat)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
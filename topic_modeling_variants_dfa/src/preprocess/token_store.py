@@ -0,0 +1,156 @@
+import os, sys, json, shutil, argparse
+import numpy as np
+from ..utils.io import read_jsonl, write_jsonl
+
+# Integer-encoded processed corpus.
+# <dir>/vocab.txt     one term per line; term id = line number (first-occurrence order)
+#       ids.i32       every document's token ids, concatenated (raw int32, memory-mapped)
+#       offsets.i64   n_docs + 1 document boundaries into ids.i32 (raw int64, memory-mapped)
+#       records.jsonl the rest of each record (pdf_id, title, pages, text) without "tokens"
+#       meta.json     counts
+# export_jsonl() writes chunks_tokens.jsonl back out byte-for-byte (tokens is the last key, as
+# process_record leaves it).
+
+class TokenStoreWriter:
+    def __init__(self, store_dir, buffering=1 << 20):
+        self.dir = store_dir
+        self.tmp = f"{store_dir}.{os.getpid()}.tmp"
+        shutil.rmtree(self.tmp, ignore_errors=True)
+        os.makedirs(self.tmp)
+        self.term2id, self.n_docs, self.n_tokens = {}, 0, 0
+        self._ids = open(os.path.join(self.tmp, "ids.i32"), "wb", buffering=buffering)
+        self._offsets = open(os.path.join(self.tmp, "offsets.i64"), "wb", buffering=buffering)
+        self._recs = open(os.path.join(self.tmp, "records.jsonl"), "w", encoding="utf-8", buffering=buffering)
+        self._offsets.write(np.int64(0).tobytes())
+
+    def add(self, rec):
+        get, t2i = self.term2id.get, self.term2id
+        ids = []
+        for t in rec.get("tokens", []) or []:
+            i = get(t)
+            if i is None:
+                i = t2i[t] = len(t2i)
+            ids.append(i)
+        self._ids.write(np.asarray(ids, dtype=np.int32).tobytes())
+        self.n_tokens += len(ids); self.n_docs += 1
+        self._offsets.write(np.int64(self.n_tokens).tobytes())
+        self._recs.write(json.dumps({k: v for k, v in rec.items() if k != "tokens"}, ensure_ascii=False) + "\n")
+        return rec
+
+    def close(self):
+        for f in (self._ids, self._offsets, self._recs):
+            f.close()
+        with open(os.path.join(self.tmp, "vocab.txt"), "w", encoding="utf-8") as f:
+            f.writelines(f"{t}\n" for t in self.term2id)
+        with open(os.path.join(self.tmp, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"n_docs": self.n_docs, "n_tokens": self.n_tokens, "vocab_size": len(self.term2id)}, f, indent=2)
+        shutil.rmtree(self.dir, ignore_errors=True)
+        os.replace(self.tmp, self.dir)
+        return self.dir
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            for f in (self._ids, self._offsets, self._recs):
+                f.close()
+            shutil.rmtree(self.tmp, ignore_errors=True)
+        return False
+
+def write_token_store(store_dir, records):
+    # like write_jsonl: consumes records, returns the count
+    with TokenStoreWriter(store_dir) as w:
+        for r in records:
+            w.add(r)
+    return w.n_docs
+
+def tee_token_store(records, writer):
+    for r in records:
+        yield writer.add(r)
+
+class TokenStore:
+    def __init__(self, store_dir, mmap=True):
+        self.dir = store_dir
+        with open(os.path.join(store_dir, "meta.json"), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        with open(os.path.join(store_dir, "vocab.txt"), "r", encoding="utf-8") as f:
+            self.vocab = np.array([line[:-1] for line in f], dtype=object)
+        self.ids = self._load("ids.i32", np.int32, self.meta["n_tokens"], mmap)
+        self.offsets = self._load("offsets.i64", np.int64, self.meta["n_docs"] + 1, mmap)
+
+    def _load(self, name, dtype, n, mmap):
+        path = os.path.join(self.dir, name)
+        if n == 0:
+            return np.zeros(0, dtype=dtype) if name == "ids.i32" else np.zeros(1, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode="r", shape=(n,)) if mmap else np.fromfile(path, dtype=dtype)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @property
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    def doc(self, i):
+        return self.ids[self.offsets[i]:self.offsets[i + 1]]
+
+    def term_index(self):
+        return {t: i for i, t in enumerate(self.vocab)}
+
+    def tokens(self):
+        # list[str] per document; terms are shared vocab objects, not fresh strings
+        vocab = self.vocab
+        for i in range(len(self)):
+            yield list(vocab[self.doc(i)])
+
+    def joined(self):
+        for toks in self.tokens():
+            yield " ".join(toks)
+
+    def records(self):
+        for rec, toks in zip(read_jsonl(os.path.join(self.dir, "records.jsonl")), self.tokens()):
+            rec["tokens"] = toks
+            yield rec
+
+def store_path(paths):
+    return os.path.join(paths["processed_dir"], "tokens")
+
+def export_jsonl(store_dir, out_path):
+    return write_jsonl(out_path, TokenStore(store_dir).records())
+
+def to_gensim(store):
+    # gensim Dictionary + bag-of-words corpus straight from the id arrays
+    from gensim.corpora import Dictionary
+    V, n = len(store.vocab), len(store)
+    doc_of = np.repeat(np.arange(n, dtype=np.int64), store.lengths)
+    pairs, counts = np.unique(doc_of * V + np.asarray(store.ids, dtype=np.int64), return_counts=True)
+    docs, tids = pairs // V, pairs % V
+    dct = Dictionary()
+    dct.token2id = {t: i for i, t in enumerate(store.vocab)}
+    dct.dfs = dict(enumerate(np.bincount(tids, minlength=V).tolist()))
+    dct.cfs = dict(enumerate(np.bincount(np.asarray(store.ids), minlength=V).tolist()))
+    dct.num_docs, dct.num_pos, dct.num_nnz = n, int(store.meta["n_tokens"]), len(pairs)
+    bounds = np.searchsorted(docs, np.arange(n + 1))
+    corpus = [list(zip(tids[a:b].tolist(), counts[a:b].tolist())) for a, b in zip(bounds[:-1], bounds[1:])]
+    return dct, corpus
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m src.preprocess.token_store")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    e = sub.add_parser("encode", help="chunks_tokens.jsonl -> token store")
+    e.add_argument("jsonl"); e.add_argument("store_dir")
+    x = sub.add_parser("export", help="token store -> chunks_tokens.jsonl")
+    x.add_argument("store_dir"); x.add_argument("jsonl")
+    args = ap.parse_args(argv)
+    if args.cmd == "encode":
+        n = write_token_store(args.store_dir, read_jsonl(args.jsonl))
+        print(f"Encoded {n} records into {args.store_dir}")
+    else:
+        n = export_jsonl(args.store_dir, args.jsonl)
+        print(f"Exported {n} records to {args.jsonl}")
+
+if __name__ == "__main__":
+    sys.exit(main())
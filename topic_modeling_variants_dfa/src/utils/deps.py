@@ -0,0 +1,20 @@
+from importlib.util import find_spec
+
+# Optional-dependency checks that do not import anything: find_spec only locates the top-level
+# package, so asking whether torch/bertopic are installed costs milliseconds, not seconds.
+
+OPTIONAL = {
+    "ingest": ("pdfminer",),
+    "preprocess": ("nltk",),
+    "nmf": ("sklearn", "joblib"),
+    "corex": ("corextopic|corex",),
+    "bertopic": ("bertopic", "sentence_transformers", "umap", "hdbscan"),
+    "coherence --check-gensim": ("gensim",),
+}
+
+def available(name):
+    # "a|b": either top-level package will do
+    return any(find_spec(n.split(".")[0]) is not None for n in name.split("|"))
+
+def missing(*names):
+    return [n for n in names if not available(n)]
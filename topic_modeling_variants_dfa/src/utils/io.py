@@ -1,16 +1,28 @@
 import json, yaml, os
+from itertools import islice
 
 def read_yaml(path: str):
     with open(path, "r", encoding="utf-8") as f:
         return yaml.safe_load(f)
 
-def write_jsonl(path: str, records):
+def write_jsonl(path: str, records, buffering=-1):
     os.makedirs(os.path.dirname(path), exist_ok=True)
-    with open(path, "w", encoding="utf-8") as f:
+    n = 0
+    with open(path, "w", encoding="utf-8", buffering=buffering) as f:
         for r in records:
             f.write(json.dumps(r, ensure_ascii=False) + "\n")
+            n += 1
+    return n
 
 def read_jsonl(path: str):
     with open(path, "r", encoding="utf-8") as f:
         for line in f:
             yield json.loads(line)
+
+def batched(iterable, n: int):
+    it = iter(iterable)
+    while True:
+        batch = list(islice(it, n))
+        if not batch:
+            return
+        yield batch
@@ -0,0 +1,203 @@
+import os, sys, json, time, functools, threading
+from datetime import datetime, timezone
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Lightweight stage instrumentation. Every `stage(...)` block (or `timed_iter` generator) appends one
+# line to $TM_PERF_PATH (default <paths.evaluation_dir>/perf.jsonl) with wall time, CPU time (this
+# process plus reaped worker processes), RSS and items/sec per counted unit. peak_rss_growth_mb is how
+# far the stage raised the process's RSS high-water mark (0 when an earlier stage peaked higher);
+# process_peak_rss_mb is that lifetime high-water mark itself. wall_s / cpu_s are
+# a stage's own time: time spent in stages nested in it (an upstream generator pulled by a
+# timed_iter, an inner `with stage`) is subtracted; total_wall_s / total_cpu_s include it. Records of one run share
+# run_id ($TM_RUN_ID, inherited by worker processes). TM_PERF=0 turns recording off.
+# Opt-in profiling: TM_PROFILE=<stage>[,<stage>...] (or "all") wraps matching stages in cProfile and
+# writes <run_id>-<stage>.prof plus a cumulative-time summary .txt under $TM_PROFILE_DIR
+# (default <paths.evaluation_dir>/profiles).
+
+os.environ.setdefault("TM_RUN_ID", datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S") + f"-{os.getpid()}")
+_lock = threading.Lock()
+_profiling = threading.local()
+_active = threading.local()  # stack of running Stages in this thread
+
+def run_id():
+    return os.environ["TM_RUN_ID"]
+
+def enabled():
+    return os.environ.get("TM_PERF", "1") != "0"
+
+def cpu_budget():
+    # cores this process may use: $TM_CPUS when the model orchestrator (src/pipeline/models.py)
+    # splits the machine between concurrent runners, else all of them
+    return int(os.environ.get("TM_CPUS", 0) or 0) or os.cpu_count() or 1
+
+def process_pool(n_jobs, tasks=None, **kw):
+    # joblib process pool that stays within cpu_budget(): loky workers would otherwise inherit this
+    # process's *_NUM_THREADS (the whole budget each), so each gets budget // workers BLAS threads
+    from joblib import Parallel, parallel_config
+    workers = max(1, min(int(n_jobs), int(tasks or n_jobs)))
+    with parallel_config(backend="loky", inner_max_num_threads=max(1, cpu_budget() // workers)):
+        return Parallel(n_jobs=workers, **kw)
+
+def _cpu():
+    t = time.process_time()
+    if resource is not None:
+        ch = resource.getrusage(resource.RUSAGE_CHILDREN)
+        t += ch.ru_utime + ch.ru_stime
+    return t
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    scale = 1 / (1024 * 1024) if sys.platform == "darwin" else 1 / 1024  # bytes on macOS, KiB on Linux
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    kids = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return round(max(own, kids) * scale, 1)
+
+def _wants_profile(name):
+    sel = [s.strip() for s in os.environ.get("TM_PROFILE", "").split(",") if s.strip()]
+    return "all" in sel or any(name == s or name.startswith(s + ".") for s in sel)
+
+@functools.lru_cache(maxsize=1)
+def _evaluation_dir():
+    # paths.evaluation_dir of configs/base.yaml; runs with another config call configure()
+    try:
+        from .io import read_yaml
+        return read_yaml("configs/base.yaml")["paths"]["evaluation_dir"]
+    except Exception:
+        return "evaluation"
+
+def configure(evaluation_dir):
+    # send records and profiles to a config's evaluation_dir (inherited by worker processes)
+    os.environ.setdefault("TM_PERF_PATH", os.path.join(evaluation_dir, "perf.jsonl"))
+    os.environ.setdefault("TM_PROFILE_DIR", os.path.join(evaluation_dir, "profiles"))
+
+def write_record(rec):
+    path = os.environ.get("TM_PERF_PATH") or os.path.join(_evaluation_dir(), "perf.jsonl")
+    d = os.path.dirname(path)
+    if d: os.makedirs(d, exist_ok=True)
+    line = json.dumps(rec) + "\n"
+    with _lock, open(path, "a", encoding="utf-8") as f:
+        f.write(line)
+
+class Stage:
+    # with stage("nmf.grid_search", unit="fits") as st: ...; st.add(n, topics=k)
+    def __init__(self, name, unit="items", **meta):
+        self.name, self.unit, self.meta = name, unit, meta
+        self.counts = {}
+        self.wall = self.cpu = 0.0          # own time
+        self.total_wall = self.total_cpu = 0.0
+        self.profiler = None
+        self._rss0 = None
+
+    def add(self, n=1, **other):
+        self.counts[self.unit] = self.counts.get(self.unit, 0) + n
+        for k, v in other.items():
+            self.counts[k] = self.counts.get(k, 0) + v
+
+    def start(self):
+        if self.profiler is None and _wants_profile(self.name) and not getattr(_profiling, "active", False):
+            import cProfile
+            self.profiler = cProfile.Profile()
+            _profiling.active = True
+        if self.profiler is not None:
+            self.profiler.enable()
+        if self._rss0 is None:
+            self._rss0 = peak_rss_mb()
+        stack = getattr(_active, "stack", None)
+        if stack is None:
+            stack = _active.stack = []
+        stack.append(self)
+        self._nested_wall = self._nested_cpu = 0.0
+        self._t0, self._c0 = time.perf_counter(), _cpu()
+        return self
+
+    def pause(self):
+        wall, cpu = time.perf_counter() - self._t0, _cpu() - self._c0
+        self.total_wall += wall; self.total_cpu += cpu
+        self.wall += wall - self._nested_wall
+        self.cpu += cpu - self._nested_cpu
+        stack = _active.stack
+        if self in stack:
+            stack.remove(self)
+        if stack:  # the enclosing stage was running while this one was
+            stack[-1]._nested_wall += wall
+            stack[-1]._nested_cpu += cpu
+        if self.profiler is not None:
+            self.profiler.disable()
+
+    def finish(self, error=None):
+        if self.profiler is not None:
+            _profiling.active = False
+            self._dump_profile()
+        rec = {"run_id": run_id(), "stage": self.name, "ts": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+               "pid": os.getpid(), "wall_s": round(self.wall, 6), "cpu_s": round(self.cpu, 6),
+               "total_wall_s": round(self.total_wall, 6), "total_cpu_s": round(self.total_cpu, 6),
+               **self._rss(), "counts": self.counts,
+               "per_s": {k: round(v / self.wall, 3) for k, v in self.counts.items() if self.wall > 0}}
+        if self.meta: rec["meta"] = self.meta
+        if error is not None: rec["error"] = repr(error)
+        if enabled():
+            write_record(rec)
+        return rec
+
+    def _rss(self):
+        peak = peak_rss_mb()
+        growth = None if peak is None or self._rss0 is None else round(max(peak - self._rss0, 0.0), 1)
+        return {"peak_rss_growth_mb": growth, "process_peak_rss_mb": peak}
+
+    def _dump_profile(self):
+        import pstats
+        d = os.environ.get("TM_PROFILE_DIR") or os.path.join(_evaluation_dir(), "profiles")
+        os.makedirs(d, exist_ok=True)
+        base = os.path.join(d, f"{run_id()}-{self.name}-{os.getpid()}")
+        self.profiler.dump_stats(base + ".prof")
+        with open(base + ".txt", "w", encoding="utf-8") as f:
+            pstats.Stats(self.profiler, stream=f).sort_stats("cumulative").print_stats(40)
+        print(f"[INFO] Profile for {self.name} written to {base}.prof")
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.pause()
+        self.finish(exc)
+        return False
+
+def stage(name, unit="items", **meta):
+    return Stage(name, unit, **meta)
+
+def timed_iter(iterable, name, unit="items", count=None, **meta):
+    # Times only the work done inside the producer (not the consumer between items) and records
+    # once the iterator is exhausted or closed. count(item) -> dict of extra counts per item.
+    st = Stage(name, unit, **meta)
+    it = iter(iterable)
+    err = None
+    try:
+        while True:
+            st.start()
+            try:
+                item = next(it)
+            except StopIteration:
+                break
+            finally:
+                st.pause()
+            st.add(1, **(count(item) if count else {}))
+            yield item
+    except GeneratorExit:
+        raise
+    except BaseException as e:
+        err = e
+        raise
+    finally:
+        st.finish(err)
+
+def timed_generator(name, unit="items", count=None):
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            return timed_iter(fn(*args, **kwargs), name, unit, count=count)
+        return wrapper
+    return deco